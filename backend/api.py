@@ -0,0 +1,23 @@
+from fastapi import FastAPI
+
+from app.config import configure_cloudinary, init_cors, api_lifespan, app_secrets
+from app.logger import configure_logging
+from app.api.api_handlers import router
+from app.api.metrics_handlers import metrics_router
+
+# Lean API entry point, it serves the REST endpoints and callbacks only and queues analysis
+# for the worker (worker.py), so it never loads PyTorch, torchreid, ultralytics or Chroma
+
+configure_logging()
+
+app = FastAPI(
+    title="Sentinel API",
+    description="A simple FastAPI backend of Sentinel",
+    version="0.1.0",
+    lifespan=api_lifespan
+)
+
+init_cors(app)
+app.include_router(router)
+app.include_router(metrics_router)
+configure_cloudinary(app_secrets)
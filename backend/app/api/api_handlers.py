@@ -1,26 +1,37 @@
+import asyncio
+from datetime import datetime, timezone
 import json
+import os
 from sqlite3 import Connection
 import sqlite3
+import time
 from typing import Annotated, List
 from fastapi import (
     APIRouter,
-    BackgroundTasks,
     Body,
     Depends,
+    Header,
     HTTPException,
     Query,
+    Request,
+    Response,
     status,
 )
+from fastapi.responses import FileResponse, StreamingResponse
 
 from app.api import api_schema, api_schema_helper
 
-from app.helpers import verify_sop
-
 import logging
 
-from app.api.background import analyse_video
-from app.utils import build_local_uri_for_video, get_structured_output
-from app.db import get_sqllite_db_connection
+from app.callbacks import store_callback_event
+from app.config import app_settings
+from app.constants import AnalysisStage, Environment
+from app.jobs import enqueue_analysis_job
+from app.response_cache import ResultsResponseCache, results_response_cache
+from app.track_store import TrackTimeline
+from app.profiling import PROFILE_STACKS_FILE, PROFILE_SUMMARY_FILE
+from app.utils import build_local_uri_for_profile, build_local_uri_for_tracks
+from app.db import get_sqllite_db_connection, sqlite_connection_pool
 from app.exceptions import (
     AssetDownloadFailed,
     DBOperationFailed,
@@ -33,6 +44,30 @@ logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api/v1")
 
 
+def _get_results_version(video_public_id, db_conn: Connection):
+    """
+    Version of the video's analysis results, -1 for an unknown video
+    """
+
+    cursor = db_conn.cursor()
+    cursor.execute("SELECT results_version FROM videos WHERE public_id = ?", (video_public_id,))
+    res = cursor.fetchone()
+
+    return -1 if res is None else res['results_version']
+
+
+def _build_cached_response(etag, body, if_none_match):
+
+    if ResultsResponseCache.etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+    return Response(
+        content=body,
+        media_type="application/json",
+        headers={"ETag": etag, "Cache-Control": "no-cache"},
+    )
+
+
 @router.post(
     "/register_video",
     status_code=status.HTTP_200_OK,
@@ -41,18 +76,16 @@ router = APIRouter(prefix="/api/v1")
 def registerVideo(
     regVideoReq: api_schema.RegisterVideoRequest,
     db_conn: Annotated[Connection, Depends(get_sqllite_db_connection)],
-    background_tasks: BackgroundTasks,
 ):
     """
     Endpoint to register a video that the frontend has already uploaded to Cloudinary
     """
 
     try:
-        file_path = build_local_uri_for_video(regVideoReq.video_public_id)
         asset_management_service = AssetManagementService()
-        asset_management_service.download_asset_if_not_exist(
-            file_path, regVideoReq.video_url
-        )
+
+        asset_management_service.download_video_for_analysis(regVideoReq.video_public_id, regVideoReq.video_url)
+
         asset_management_service.register_asset(
             regVideoReq.video_public_id,
             regVideoReq.video_url,
@@ -61,9 +94,8 @@ def registerVideo(
             regVideoReq.env_id,
         )
 
-        background_tasks.add_task(
-            analyse_video, regVideoReq.video_public_id
-        )
+        # the analysis worker (separate process or in-process thread) picks it up from the queue
+        enqueue_analysis_job(regVideoReq.video_public_id, db_conn, profile=regVideoReq.profile)
 
         return api_schema.RegisterVideoResponse(reg_status=True)
 
@@ -80,98 +112,249 @@ def registerVideo(
         )
 
 
-# may be only allow for memories ai
-@router.post("/callback/alert_analysis")
-def callbackAlert(
-    video_public_id: Annotated[str, Query()],
-    payload: Annotated[dict, Body()],
+@router.post(
+    "/register_videos",
+    status_code=status.HTTP_202_ACCEPTED,
+    response_model=api_schema.BulkRegisterVideoResponse,
+)
+def bulkRegisterVideos(
+    bulkRegVideoReq: api_schema.BulkRegisterVideoRequest,
     db_conn: Annotated[Connection, Depends(get_sqllite_db_connection)],
 ):
+    """
+    Endpoint to register many videos at once (e.g. a backfill). The videos are registered and queued for analysis
+    in one transaction and the request returns right away, the analysis worker downloads every video as the first
+    step of its job (a failed download fails the job). Returns the status of every video.
+    """
 
-    if video_public_id == "":
-        return
+    asset_management_service = AssetManagementService()
+    statuses = dict()
+
+    videos = dict()
+    for video in bulkRegVideoReq.videos:
+        if video.env_id not in {env.value for env in Environment}:
+            statuses[video.video_public_id] = "invalid_env"
+        else:
+            # a public id listed twice is registered once
+            videos.setdefault(video.video_public_id, video)
+
+    queued = set()
 
     try:
-        logger.info(f"Alert callback for video_public_id - {video_public_id}")
-        logger.info(f"Alert callback Text Payload {payload["data"]["text"]}")
-        alert_resp = get_structured_output(payload["data"]["text"], "alert")
-        logger.info(f"Structured Output for Alert {alert_resp}")
+        registered = asset_management_service.register_videos(
+            [(video.video_public_id, video.video_url, video.env_id) for video in videos.values()],
+            db_conn,
+            commit=False,
+        )
 
-        cursor = db_conn.cursor()
+        for video_public_id, video in videos.items():
+            if video_public_id not in registered:
+                statuses[video_public_id] = "duplicate"
+                continue
 
-        sql_cmd = """
-        UPDATE videos
-        SET alerts = ?
-        WHERE public_id = ?
-        """
+            enqueue_analysis_job(video_public_id, db_conn, commit=False, profile=video.profile)
+            queued.add(video_public_id)
 
-        cursor.execute(sql_cmd,(json.dumps(alert_resp),video_public_id,))
         db_conn.commit()
 
-        logger.info(f"Alert info updated successfully into db for video - {video_public_id}")
+        for video_public_id in queued:
+            statuses[video_public_id] = "queued"
 
-    except json.JSONDecodeError as e:
-        logger.error(
-            f"JSON Parsing of alert response failed, may be LLMs didn't structure data correctly"
-        )
+    except (DBOperationFailed, sqlite3.Error) as e:
+        logger.error(f"Failed to register and queue bulk registered videos due to error {e}")
+        db_conn.rollback()
+        queued.clear()
 
-    except sqlite3.Error as e:
-            logger.error(f"Failed to update alerts for video [{video_public_id}] due to error {e}")
+        for video_public_id in videos:
+            statuses[video_public_id] = "failed"
+
+    logger.info(f"Bulk registration queued {len(queued)}/{len(bulkRegVideoReq.videos)} videos")
+
+    return api_schema.BulkRegisterVideoResponse(
+        results=[
+            api_schema_helper.BulkRegisterVideoResult(
+                video_public_id=video.video_public_id,
+                reg_status=statuses[video.video_public_id] == "queued",
+                status=statuses[video.video_public_id],
+            )
+            for video in bulkRegVideoReq.videos
+        ]
+    )
+
+
+# may be only allow for memories ai
+@router.post("/callback/alert_analysis", status_code=status.HTTP_202_ACCEPTED)
+def callbackAlert(
+    video_public_id: Annotated[str, Query()],
+    payload: Annotated[dict, Body()],
+    db_conn: Annotated[Connection, Depends(get_sqllite_db_connection)],
+):
+    """
+    Stores the raw alert payload and returns right away, the analysis worker structures and persists it
+    """
+
+    if video_public_id == "":
+        return
+
+    logger.info(f"Alert callback for video_public_id - {video_public_id}")
 
-            if db_conn:
-                db_conn.rollback()
+    try:
+        if not store_callback_event("alert", video_public_id, "", payload, db_conn):
+            logger.info(f"Duplicate alert callback ignored for video_public_id - {video_public_id}")
 
-    except Exception as e:
-        logger.error(f"Some unexpected failure occured , error : {e}")
+    except DBOperationFailed:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to store the alert callback",
+        )
 
     return
 
-@router.post("/callback/huid_annotate")
+@router.post("/callback/huid_annotate", status_code=status.HTTP_202_ACCEPTED)
 def callbackHuidAnnotate(
     huid: Annotated[str, Query()],
     video_public_id: Annotated[str, Query()],
     payload: Annotated[dict, Body()],
     db_conn: Annotated[Connection, Depends(get_sqllite_db_connection)],
 ):
+    """
+    Stores the raw annotation payload and returns right away, the analysis worker structures and persists it
+    """
 
     if video_public_id == "":
         return
 
+    logger.info(f"HUID annotate callback for video_public_id - {video_public_id}, huid - {huid}")
+
     try:
-        logger.info(f"HUID annotate callback for video_public_id - {video_public_id}")
-        logger.info(f"HUID Annotate callback payload - {payload["data"]["text"]}")
-        annotate_resp = get_structured_output(payload["data"]["text"], "annotate")
-        logger.info(f"Structured Output for Annotate - {annotate_resp}")
+        if not store_callback_event("annotate", video_public_id, huid, payload, db_conn):
+            logger.info(f"Duplicate HUID annotate callback ignored for video_public_id - {video_public_id}, huid - {huid}")
 
-        cursor = db_conn.cursor()
+    except DBOperationFailed:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to store the HUID annotate callback",
+        )
 
-        sql_cmd = """
-        INSERT INTO PEOPLE (huid, video_public_id, annotation)
-        VALUES (?,?,?)
-        """
+    return
 
-        cursor.execute(sql_cmd,(huid,video_public_id,json.dumps(annotate_resp)))
-        db_conn.commit()
+def _get_alerts_payload(video_public_id, db_conn: Connection):
+    """
+    (etag, serialized response) of the alerts of a video, raises 204 if there are none yet
+    """
+
+    version = _get_results_version(video_public_id, db_conn)
+    cached = results_response_cache.get("alerts", video_public_id, version)
 
-        logger.info(f"Annotation info updated successfully into db for video - {video_public_id}")
+    if cached is not None:
+        return cached
+
+    cursor = db_conn.cursor()
+
+    sql_cmd = """
+    SELECT alerts
+    FROM videos
+    WHERE public_id = ? AND alerts is NOT NULL
+    """
 
-        verify_sop(video_public_id,huid,db_conn)
+    cursor.execute(sql_cmd,(video_public_id,))
+    res = cursor.fetchall()
 
-    except json.JSONDecodeError as e:
-        logger.error(
-            f"JSON Parsing of alert response failed, may be LLMs didn't structure data correctly"
+    if(len(res) == 0):
+        raise HTTPException(
+            status_code=status.HTTP_204_NO_CONTENT,
+            detail="No Alerts found for the video"
         )
 
-    except sqlite3.Error as e:
-            logger.error(f"Failed to update HUID Annotate and SOP Analysis for video [{video_public_id}] due to error {e}")
+    res = res[0][0]
+    res = json.loads(res)
 
-            if db_conn:
-                db_conn.rollback()
+    res = api_schema.VideoAnalysisAlertResponse(alert_results=res)
 
-    except Exception as e:
-        logger.error(f"Some unexpected failure occured , error : {e}")
+    return results_response_cache.set("alerts", video_public_id, version, res)
+
+
+def _get_sop_payload(video_public_id, db_conn: Connection):
+    """
+    (etag, serialized response) of the per person SOP results of a video, raises 204 if there are none yet
+    """
+
+    version = _get_results_version(video_public_id, db_conn)
+    cached = results_response_cache.get("sop", video_public_id, version)
+
+    if cached is not None:
+        return cached
+
+    cursor = db_conn.cursor()
+
+    sql_cmd = """
+    SELECT huid,sop
+    FROM people
+    WHERE video_public_id = ? AND sop is NOT NULL
+    """
+
+    resp_list: List[api_schema_helper.HUIDSOPResultsMap] = []
+
+    cursor.execute(sql_cmd,(video_public_id,))
+    res = cursor.fetchall()
+
+    if len(res) == 0:
+        raise HTTPException(
+            status_code=status.HTTP_204_NO_CONTENT,
+            detail="No Analysis present yet"
+        )
+
+    for r in res:
+        huid = r['huid']
+        sop = json.loads(r['sop'])
+
+        resp_list.append(api_schema_helper.HUIDSOPResultsMap(huid=huid,sop_results=sop))
+
+    res = api_schema.VideoAnalysisSOPResponse(sop_results=resp_list)
+
+    return results_response_cache.set("sop", video_public_id, version, res)
+
+
+def _get_persons_payload(video_public_id, db_conn: Connection):
+    """
+    (etag, serialized response) of the per person annotations of a video, raises 204 if there are none yet
+    """
+
+    version = _get_results_version(video_public_id, db_conn)
+    cached = results_response_cache.get("persons", video_public_id, version)
+
+    if cached is not None:
+        return cached
+
+    cursor = db_conn.cursor()
+
+    sql_cmd = """
+    SELECT huid,annotation
+    FROM people
+    WHERE video_public_id = ? AND annotation is NOT NULL
+    """
+
+    resp_list: List[api_schema_helper.HUIDPersonActionsMap] = []
+
+    cursor.execute(sql_cmd,(video_public_id,))
+    res = cursor.fetchall()
+
+    if len(res) == 0:
+        raise HTTPException(
+            status_code=status.HTTP_204_NO_CONTENT,
+            detail="No Analysis present yet"
+        )
+
+    for r in res:
+        huid = r['huid']
+        annotation = json.loads(r['annotation'])
+
+        resp_list.append(api_schema_helper.HUIDPersonActionsMap(huid=huid,person_actions=annotation))
+
+    res = api_schema.VideoAnalysisPersonsResponse(person_video_results=resp_list)
+
+    return results_response_cache.set("persons", video_public_id, version, res)
 
-    return
 
 @router.get(
     "/video_analysis/alerts",
@@ -181,38 +364,16 @@ def callbackHuidAnnotate(
 def getVideoAnalysisAlert(
     db_conn: Annotated[Connection, Depends(get_sqllite_db_connection)],
     videoAnalysisAlertReq: api_schema.VideoAnalysisAlertsRequest = Depends(),
-    
+    if_none_match: Annotated[str | None, Header()] = None,
 ):
     """
     Endpoint to get the alerts analysis results for a footage.
     """
     try:
 
-        cursor = db_conn.cursor()
-
-        sql_cmd = """
-        SELECT alerts
-        FROM videos
-        WHERE public_id = ? AND alerts is NOT NULL
-        """
-
-        cursor.execute(sql_cmd,(videoAnalysisAlertReq.video_public_id,))
-        res = cursor.fetchall()
+        etag, body = _get_alerts_payload(videoAnalysisAlertReq.video_public_id, db_conn)
+        return _build_cached_response(etag, body, if_none_match)
 
-        if(len(res) == 0):
-            raise HTTPException(
-                status_code=status.HTTP_204_NO_CONTENT,
-                detail="No Alerts found for the video"
-            )
-        
-        res = res[0][0]
-        res = json.loads(res)
-        
-        logger.info(f"Alert resp - {res}")
-        res = api_schema.VideoAnalysisAlertResponse(alert_results=res)
-        return res
-        
-    
     except sqlite3.Error as e:
         logger.error(f"Failed to get alerts for video [{videoAnalysisAlertReq.video_public_id}] due to error {e}")
 
@@ -230,6 +391,7 @@ def getVideoAnalysisAlert(
 def getVideoAnalysisSOP(
     db_conn: Annotated[Connection, Depends(get_sqllite_db_connection)],
     videoAnalysisSopReq: api_schema.VideoAnalysisSOPRequest = Depends(),
+    if_none_match: Annotated[str | None, Header()] = None,
 ):
     """
     Endpoint to get the SOP analysis results for a footage.
@@ -237,36 +399,9 @@ def getVideoAnalysisSOP(
 
     try:
 
-        cursor = db_conn.cursor()
-
-        sql_cmd = """
-        SELECT huid,sop
-        FROM people
-        WHERE video_public_id = ? AND sop is NOT NULL
-        """
-
-        resp_list: List[api_schema_helper.HUIDSOPResultsMap] = []
-
-        cursor.execute(sql_cmd,(videoAnalysisSopReq.video_public_id,))
-        res = cursor.fetchall()
+        etag, body = _get_sop_payload(videoAnalysisSopReq.video_public_id, db_conn)
+        return _build_cached_response(etag, body, if_none_match)
 
-        if len(res) == 0:
-            raise HTTPException(
-                status_code=status.HTTP_204_NO_CONTENT,
-                detail="No Analysis present yet"
-            )
-
-        for r in res:
-            huid = r['huid']
-            sop = json.loads(r['sop'])
-
-            logger.info(f"HUID - {huid}, sop {sop}")
-
-            resp_list.append(api_schema_helper.HUIDSOPResultsMap(huid=huid,sop_results=sop))
-
-        return api_schema.VideoAnalysisSOPResponse(sop_results=resp_list)
-        
-    
     except sqlite3.Error as e:
         logger.error(f"Failed to get sop for video [{videoAnalysisSopReq.video_public_id}] due to error {e}")
 
@@ -284,6 +419,7 @@ def getVideoAnalysisSOP(
 def getVideoAnalysisPersons(
     db_conn: Annotated[Connection, Depends(get_sqllite_db_connection)],
     videoAnalysisPersonsReq: api_schema.VideoAnalysisPersonsRequest = Depends(),
+    if_none_match: Annotated[str | None, Header()] = None,
 ):
     """
     Endpoint to get the per person analysis results for a footage.
@@ -291,52 +427,585 @@ def getVideoAnalysisPersons(
 
     try:
 
-        cursor = db_conn.cursor()
+        etag, body = _get_persons_payload(videoAnalysisPersonsReq.video_public_id, db_conn)
+        return _build_cached_response(etag, body, if_none_match)
 
-        sql_cmd = """
-        SELECT huid,annotation
-        FROM people
-        WHERE video_public_id = ? AND annotation is NOT NULL
-        """
+    except sqlite3.Error as e:
+        logger.error(f"Failed to get annotation for video [{videoAnalysisPersonsReq.video_public_id}] due to error {e}")
 
-        resp_list: List[api_schema_helper.HUIDPersonActionsMap] = []
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to get per person annotation for the video"
+        )
 
-        cursor.execute(sql_cmd,(videoAnalysisPersonsReq.video_public_id,))
-        res = cursor.fetchall()
 
-        if len(res) == 0:
-            raise HTTPException(
-                status_code=status.HTTP_204_NO_CONTENT,
-                detail="No Analysis present yet"
+def _read_analysis_state(video_public_id, db_conn: Connection):
+    """
+    Returns (progress row as a dict or None, results_version, terminal), terminal is None while the analysis goes on,
+    else (stage, error). Done once every request memories.ai accepted has been called back and processed and every
+    annotated person got their SOP verified, timed out when that didn't happen within SSE_RESULTS_DEADLINE_SECONDS.
+    Failed when the job failed, or when the worker stopped writing progress in a stage it owns
+    (SSE_STALE_PROGRESS_SECONDS), e.g. it crashed.
+    """
+
+    cursor = db_conn.cursor()
+
+    cursor.execute("SELECT * FROM analysis_progress WHERE video_public_id = ?", (video_public_id,))
+    progress = cursor.fetchone()
+    progress = None if progress is None else dict(progress)
+
+    results_version = _get_results_version(video_public_id, db_conn)
+
+    if progress is None:
+        return progress, results_version, None
+
+    if progress['stage'] == AnalysisStage.Failed:
+        return progress, results_version, (AnalysisStage.Failed, progress['error'])
+
+    sql_cmd = """
+    SELECT
+        (SELECT status FROM analysis_jobs WHERE video_public_id = ? ORDER BY id DESC LIMIT 1) AS job_status,
+        (SELECT error FROM analysis_jobs WHERE video_public_id = ? ORDER BY id DESC LIMIT 1) AS job_error,
+        (julianday('now') - julianday(?)) * 86400 AS idle_seconds
+    """
+
+    cursor.execute(sql_cmd, (video_public_id, video_public_id, progress['updated_at']))
+    job = cursor.fetchone()
+
+    if job['job_status'] == "failed":
+        return progress, results_version, (AnalysisStage.Failed, job['job_error'])
+
+    if (
+        progress['stage'] in (AnalysisStage.Tracking, AnalysisStage.Annotating)
+        and job['idle_seconds'] is not None
+        and job['idle_seconds'] > app_settings.SSE_STALE_PROGRESS_SECONDS
+    ):
+        return progress, results_version, (AnalysisStage.Failed, f"No progress for {int(job['idle_seconds'])}s")
+
+    if progress['stage'] != AnalysisStage.AwaitingResults:
+        return progress, results_version, None
+
+    sql_cmd = """
+    SELECT
+        (SELECT COUNT(*) FROM callback_events WHERE video_public_id = ? AND status IN ('done', 'failed')) AS processed,
+        (SELECT COUNT(*) FROM callback_events WHERE video_public_id = ? AND status IN ('pending', 'running')) AS unprocessed,
+        (SELECT COUNT(*) FROM people WHERE video_public_id = ? AND annotation IS NOT NULL AND sop IS NULL) AS sop_pending
+    """
+
+    cursor.execute(sql_cmd, (video_public_id, video_public_id, video_public_id))
+    counts = cursor.fetchone()
+
+    settled = (
+        counts['processed'] >= progress['external_requested']
+        and counts['unprocessed'] == 0
+        and counts['sop_pending'] == 0
+    )
+
+    if settled:
+        return progress, results_version, (AnalysisStage.Done, None)
+
+    # the progress row is last written when the analysis starts awaiting its results
+    if job['idle_seconds'] is not None and job['idle_seconds'] > app_settings.SSE_RESULTS_DEADLINE_SECONDS:
+        missing = max(0, progress['external_requested'] - counts['processed']) + counts['unprocessed']
+        error = f"{missing} callback(s) and {counts['sop_pending']} SOP verification(s) still pending after {int(job['idle_seconds'])}s"
+        return progress, results_version, (AnalysisStage.TimedOut, error)
+
+    return progress, results_version, None
+
+
+def _format_sse(event, data: bytes | str):
+
+    if isinstance(data, bytes):
+        data = data.decode("utf-8")
+
+    return f"event: {event}\ndata: {data}\n\n"
+
+
+async def _analysis_event_stream(request: Request, video_public_id):
+    """
+    Poll the progress written by the worker and push every change, plus the result payloads whenever the
+    results of the video change, until the analysis settles, fails or the client goes away
+    """
+
+    db_conn = sqlite_connection_pool.acquire()
+
+    payload_builders = [("alerts", _get_alerts_payload), ("persons", _get_persons_payload), ("sop", _get_sop_payload)]
+
+    last_progress_version = None
+    last_results_version = None
+    last_sent = started = time.monotonic()
+
+    try:
+        while not await request.is_disconnected():
+
+            progress, results_version, terminal = await asyncio.to_thread(_read_analysis_state, video_public_id, db_conn)
+
+            if progress is not None and progress['version'] != last_progress_version:
+                last_progress_version = progress['version']
+                last_sent = time.monotonic()
+                yield _format_sse("progress", json.dumps(progress))
+
+            if results_version > 0 and results_version != last_results_version:
+                last_results_version = results_version
+
+                for kind, build_payload in payload_builders:
+                    try:
+                        _, body = await asyncio.to_thread(build_payload, video_public_id, db_conn)
+                    except HTTPException:
+                        continue
+
+                    last_sent = time.monotonic()
+                    yield _format_sse(kind, body)
+
+            if terminal is not None:
+                stage, error = terminal
+                yield _format_sse(stage, json.dumps({"video_public_id": video_public_id, "stage": stage, "error": error}))
+                return
+
+            now = time.monotonic()
+
+            if now - started > app_settings.SSE_MAX_STREAM_SECONDS:
+                return
+
+            # comment line, keeps proxies from closing an idle stream
+            if now - last_sent > app_settings.SSE_KEEPALIVE_SECONDS:
+                last_sent = now
+                yield ": keep-alive\n\n"
+
+            await asyncio.sleep(app_settings.SSE_POLL_INTERVAL_SECONDS)
+
+    except sqlite3.Error as e:
+        logger.error(f"Analysis event stream for video [{video_public_id}] failed due to error {e}")
+        yield _format_sse("error", json.dumps({"detail": "Failed to read the analysis progress"}))
+
+    finally:
+        sqlite_connection_pool.release(db_conn)
+
+
+@router.get("/video_analysis/events", status_code=status.HTTP_200_OK)
+async def streamVideoAnalysisEvents(
+    request: Request,
+    videoAnalysisEventsReq: api_schema.VideoAnalysisEventsRequest = Depends(),
+):
+    """
+    Server-sent events endpoint streaming the analysis progress of a footage (progress events) and its
+    alerts / persons / sop results as they are written, ends with a done, timed_out or failed event.
+    """
+
+    return StreamingResponse(
+        _analysis_event_stream(request, videoAnalysisEventsReq.video_public_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/video_analysis/profile", status_code=status.HTTP_200_OK)
+def getVideoAnalysisProfile(
+    profileReq: api_schema.VideoAnalysisProfileRequest = Depends(),
+):
+    """
+    Endpoint to download the profile of a video analysis that was registered with profile (or ran with PROFILE_ALL_JOBS),
+    the JSON summary (top functions, memory) or the collapsed stacks for a flamegraph.
+    """
+
+    file_name = PROFILE_SUMMARY_FILE if profileReq.artifact == "summary" else PROFILE_STACKS_FILE
+    path = os.path.realpath(f"{build_local_uri_for_profile(profileReq.video_public_id)}/{file_name}")
+
+    # public ids may contain folders, but must never lead out of the profiles directory
+    profiles_root = os.path.realpath(build_local_uri_for_profile(""))
+
+    if os.path.commonpath([path, profiles_root]) != profiles_root:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid video_public_id"
+        )
+
+    if not os.path.exists(path):
+        raise HTTPException(
+            status_code=status.HTTP_204_NO_CONTENT,
+            detail="No profile present for the video"
+        )
+
+    return FileResponse(
+        path,
+        media_type="application/json" if profileReq.artifact == "summary" else "text/plain",
+        filename=f"{profileReq.video_public_id}_{file_name}",
+    )
+
+
+@router.get(
+    "/video_analysis/person_intervals",
+    status_code=status.HTTP_200_OK,
+    response_model=api_schema.VideoAnalysisPersonIntervalsResponse,
+)
+def getVideoAnalysisPersonIntervals(
+    personIntervalsReq: api_schema.VideoAnalysisPersonIntervalsRequest = Depends(),
+):
+    """
+    Endpoint to get the intervals in which a person appears in a footage, served from the stored track timeline.
+    """
+
+    try:
+        timeline = TrackTimeline.load(build_local_uri_for_tracks(personIntervalsReq.video_public_id))
+
+    except FileNotFoundError:
+        raise HTTPException(
+            status_code=status.HTTP_204_NO_CONTENT,
+            detail="No tracking results present yet"
+        )
+
+    except (OSError, ValueError) as e:
+        logger.error(f"Failed to load track timeline for video [{personIntervalsReq.video_public_id}] due to error {e}")
+
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to get the person intervals for the video"
+        )
+
+    fps = timeline.fps
+
+    # timelines stored before the frame rate fallback may have none
+    if not fps > 0:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="The video has no frame rate, re-analyse it to get the person intervals"
+        )
+
+    start_frame = None if personIntervalsReq.start_seconds is None else int(personIntervalsReq.start_seconds * fps)
+    end_frame = None if personIntervalsReq.end_seconds is None else int(personIntervalsReq.end_seconds * fps)
+
+    intervals = timeline.get_appearance_intervals(
+        personIntervalsReq.huid,
+        max_gap_frames=max(1, int(personIntervalsReq.max_gap_seconds * fps)),
+        start_frame=start_frame,
+        end_frame=end_frame,
+    )
+
+    if len(intervals) == 0:
+        raise HTTPException(
+            status_code=status.HTTP_204_NO_CONTENT,
+            detail="Person doesn't appear in the video"
+        )
+
+    return api_schema.VideoAnalysisPersonIntervalsResponse(
+        huid=personIntervalsReq.huid,
+        intervals=[
+            api_schema_helper.AppearanceInterval(
+                start_frame=start,
+                end_frame=end,
+                start_seconds=round(start / fps, 3),
+                end_seconds=round((end + 1) / fps, 3),
             )
+            for start, end in intervals
+        ],
+    )
+
 
-        for r in res:
-            huid = r['huid']
-            annotation = json.loads(r['annotation'])
+def _to_sqlite_timestamp(dt: datetime):
 
-            logger.info(f"HUID - {huid}, Annotation {annotation}")
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
 
-            resp_list.append(api_schema_helper.HUIDPersonActionsMap(huid=huid,person_actions=annotation))
+    return dt.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _query_report_page(table, columns, filters, reportReq: api_schema.ReportPageRequest, db_conn: Connection):
+    """
+    One page (newest first) of a reporting table, filters are (condition, value) pairs and only the ones that are
+    set end up in the WHERE clause so SQLite can pick the matching index. Returns (rows, next_offset)
+    """
+
+    filters = filters + [
+        ("env_id = ?", reportReq.env_id),
+        ("video_public_id = ?", reportReq.video_public_id),
+        ("created_at >= ?", None if reportReq.since is None else _to_sqlite_timestamp(reportReq.since)),
+        ("created_at < ?", None if reportReq.until is None else _to_sqlite_timestamp(reportReq.until)),
+    ]
+
+    filters = [(condition, value) for condition, value in filters if value is not None]
+
+    where = " AND ".join(condition for condition, _ in filters) or "1"
+
+    # table and columns are never user input, only the values are
+    sql_cmd = f"""
+    SELECT {", ".join(columns)}
+    FROM {table}
+    WHERE {where}
+    ORDER BY created_at DESC, id DESC
+    LIMIT ? OFFSET ?
+    """
+
+    cursor = db_conn.cursor()
+    cursor.execute(sql_cmd, [value for _, value in filters] + [reportReq.limit + 1, reportReq.offset])
+    rows = cursor.fetchall()
+
+    next_offset = reportReq.offset + reportReq.limit if len(rows) > reportReq.limit else None
+
+    return rows[:reportReq.limit], next_offset
+
+
+@router.get(
+    "/reports/alerts",
+    status_code=status.HTTP_200_OK,
+    response_model=api_schema.AlertsReportResponse,
+)
+def getAlertsReport(
+    db_conn: Annotated[Connection, Depends(get_sqllite_db_connection)],
+    alertsReportReq: api_schema.AlertsReportRequest = Depends(),
+):
+    """
+    Endpoint to page through the alerts of all footage, e.g. every critical alert of an env this week.
+    """
+
+    try:
+        rows, next_offset = _query_report_page(
+            "alert_events",
+            ["video_public_id", "env_id", "alert_level", "description", "start_timestamp", "end_timestamp", "created_at"],
+            [("alert_level = ?", None if alertsReportReq.alert_level is None else alertsReportReq.alert_level.lower())],
+            alertsReportReq,
+            db_conn,
+        )
 
-        return api_schema.VideoAnalysisPersonsResponse(person_video_results=resp_list)
-        
-    
     except sqlite3.Error as e:
-        logger.error(f"Failed to get annotation for video [{videoAnalysisPersonsReq.video_public_id}] due to error {e}")
+        logger.error(f"Failed to get alerts report due to error {e}")
 
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Failed to get per person annotation for the video"
+            detail="Failed to get the alerts report"
         )
 
+    return api_schema.AlertsReportResponse(
+        alerts=[
+            api_schema_helper.AlertEventRow(
+                video_public_id=r['video_public_id'],
+                env_id=r['env_id'],
+                alert_level=r['alert_level'],
+                description=r['description'],
+                start=r['start_timestamp'],
+                end=r['end_timestamp'],
+                created_at=r['created_at'],
+            )
+            for r in rows
+        ],
+        next_offset=next_offset,
+    )
+
+
+@router.get(
+    "/reports/person_actions",
+    status_code=status.HTTP_200_OK,
+    response_model=api_schema.PersonActionsReportResponse,
+)
+def getPersonActionsReport(
+    db_conn: Annotated[Connection, Depends(get_sqllite_db_connection)],
+    actionsReportReq: api_schema.PersonActionsReportRequest = Depends(),
+):
+    """
+    Endpoint to page through the annotated actions of people across footage.
+    """
+
+    try:
+        rows, next_offset = _query_report_page(
+            "person_actions",
+            ["huid", "video_public_id", "env_id", "action", "start_timestamp", "end_timestamp", "created_at"],
+            [
+                ("huid = ?", actionsReportReq.huid),
+                ("action LIKE ?", None if actionsReportReq.action_contains is None else f"%{actionsReportReq.action_contains}%"),
+            ],
+            actionsReportReq,
+            db_conn,
+        )
+
+    except sqlite3.Error as e:
+        logger.error(f"Failed to get person actions report due to error {e}")
+
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to get the person actions report"
+        )
+
+    return api_schema.PersonActionsReportResponse(
+        actions=[
+            api_schema_helper.PersonActionRow(
+                huid=r['huid'],
+                video_public_id=r['video_public_id'],
+                env_id=r['env_id'],
+                action=r['action'],
+                start=r['start_timestamp'],
+                end=r['end_timestamp'],
+                created_at=r['created_at'],
+            )
+            for r in rows
+        ],
+        next_offset=next_offset,
+    )
+
+
+@router.get(
+    "/reports/sop_results",
+    status_code=status.HTTP_200_OK,
+    response_model=api_schema.SopResultsReportResponse,
+)
+def getSopResultsReport(
+    db_conn: Annotated[Connection, Depends(get_sqllite_db_connection)],
+    sopReportReq: api_schema.SopResultsReportRequest = Depends(),
+):
+    """
+    Endpoint to page through the per step SOP verdicts across footage, e.g. everyone who skipped step 5.
+    """
+
+    try:
+        rows, next_offset = _query_report_page(
+            "sop_step_results",
+            [
+                "huid", "video_public_id", "env_id", "step_number", "sop_event", "done", "confidence",
+                "start_timestamp", "end_timestamp", "created_at",
+            ],
+            [
+                ("huid = ?", sopReportReq.huid),
+                ("step_number = ?", sopReportReq.step_number),
+                ("done = ?", None if sopReportReq.done is None else int(sopReportReq.done)),
+                ("sop_event LIKE ?", None if sopReportReq.sop_event_contains is None else f"%{sopReportReq.sop_event_contains}%"),
+            ],
+            sopReportReq,
+            db_conn,
+        )
+
+    except sqlite3.Error as e:
+        logger.error(f"Failed to get SOP results report due to error {e}")
+
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to get the SOP results report"
+        )
+
+    return api_schema.SopResultsReportResponse(
+        sop_results=[
+            api_schema_helper.SopStepResultRow(
+                huid=r['huid'],
+                video_public_id=r['video_public_id'],
+                env_id=r['env_id'],
+                step_number=r['step_number'],
+                sop_event=r['sop_event'],
+                done=bool(r['done']),
+                confidence=r['confidence'],
+                start=r['start_timestamp'],
+                end=r['end_timestamp'],
+                created_at=r['created_at'],
+            )
+            for r in rows
+        ],
+        next_offset=next_offset,
+    )
+
 
 @router.get(
     "/persons",
     status_code=status.HTTP_200_OK,
     response_model=api_schema.PersonDetailResponse,
 )
-def getPersonDetail(personDetailRequest: api_schema.PersonDetailRequest):
+def getPersonDetail(
+    db_conn: Annotated[Connection, Depends(get_sqllite_db_connection)],
+    personDetailRequest: api_schema.PersonDetailRequest = Depends(),
+):
     """
-    Endpoint to get the detail of a given person.
+    Endpoint to get the detail of a given person, served from the person_summary table.
     """
-    pass
+
+    try:
+        cursor = db_conn.cursor()
+
+        cursor.execute("SELECT name, thumbnail_url FROM person_summary WHERE huid = ?", (personDetailRequest.huid,))
+        summary = cursor.fetchone()
+
+        if summary is None:
+            raise HTTPException(
+                status_code=status.HTTP_204_NO_CONTENT,
+                detail="Person not found"
+            )
+
+        cursor.execute("SELECT video_public_id FROM person_videos WHERE huid = ?", (personDetailRequest.huid,))
+        video_ids = [r['video_public_id'] for r in cursor.fetchall()]
+
+    except sqlite3.Error as e:
+        logger.error(f"Failed to get person detail for huid [{personDetailRequest.huid}] due to error {e}")
+
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to get the person detail"
+        )
+
+    return api_schema.PersonDetailResponse(
+        person_details=api_schema_helper.PersonDetail(
+            name=summary['name'] or personDetailRequest.huid,
+            thumbnail=summary['thumbnail_url'] or "",
+            video_ids=video_ids,
+        )
+    )
+
+
+@router.get(
+    "/persons/list",
+    status_code=status.HTTP_200_OK,
+    response_model=api_schema.PersonListResponse,
+)
+def getPersonList(
+    db_conn: Annotated[Connection, Depends(get_sqllite_db_connection)],
+    personListRequest: api_schema.PersonListRequest = Depends(),
+):
+    """
+    Endpoint to page through all known persons, most recently seen first.
+    """
+
+    try:
+        cursor = db_conn.cursor()
+
+        sql_cmd = """
+        SELECT huid, name, thumbnail_url, video_count, last_seen_at
+        FROM person_summary
+        ORDER BY last_seen_at DESC
+        LIMIT ? OFFSET ?
+        """
+
+        cursor.execute(sql_cmd, (personListRequest.limit + 1, personListRequest.offset))
+        summaries = cursor.fetchall()
+
+        next_offset = None
+        if len(summaries) > personListRequest.limit:
+            next_offset = personListRequest.offset + personListRequest.limit
+            summaries = summaries[:personListRequest.limit]
+
+        # one primary key range scan per page, never a GROUP BY over people
+        huid_to_videos = {r['huid']: [] for r in summaries}
+
+        if len(summaries) > 0:
+            cursor.execute(
+                f"SELECT huid, video_public_id FROM person_videos WHERE huid IN ({', '.join('?' * len(summaries))})",
+                [r['huid'] for r in summaries],
+            )
+
+            for r in cursor.fetchall():
+                huid_to_videos[r['huid']].append(r['video_public_id'])
+
+    except sqlite3.Error as e:
+        logger.error(f"Failed to list persons due to error {e}")
+
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to list the persons"
+        )
+
+    return api_schema.PersonListResponse(
+        persons=[
+            api_schema_helper.PersonSummary(
+                huid=r['huid'],
+                name=r['name'] or r['huid'],
+                thumbnail=r['thumbnail_url'] or "",
+                video_ids=huid_to_videos[r['huid']],
+                video_count=r['video_count'],
+                last_seen_at=r['last_seen_at'],
+            )
+            for r in summaries
+        ],
+        next_offset=next_offset,
+    )
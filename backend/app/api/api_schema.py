@@ -1,17 +1,38 @@
-from typing import List
+from datetime import datetime
+from typing import List, Literal, Optional
 
 import pydantic
 
-from app.api.api_schema_helper import HUIDSOPResultsMap, HUIDPersonActionsMap, PersonDetail, AlertResult
+from app.api.api_schema_helper import (
+    AlertEventRow,
+    AlertResult,
+    AppearanceInterval,
+    BulkRegisterVideoResult,
+    HUIDPersonActionsMap,
+    HUIDSOPResultsMap,
+    PersonActionRow,
+    PersonDetail,
+    PersonSearchImage,
+    PersonSearchMatch,
+    PersonSummary,
+    SopStepResultRow,
+)
 
 class RegisterVideoRequest(pydantic.BaseModel):
     video_public_id: str
     video_url: str
     env_id: int
+    profile: bool = False # profile the analysis of this video, see /video_analysis/profile
 
 class RegisterVideoResponse(pydantic.BaseModel):
     reg_status: bool
 
+class BulkRegisterVideoRequest(pydantic.BaseModel):
+    videos: List[RegisterVideoRequest] = pydantic.Field(min_length=1, max_length=500)
+
+class BulkRegisterVideoResponse(pydantic.BaseModel):
+    results: List[BulkRegisterVideoResult]
+
 class VideoAnalysisAlertsRequest(pydantic.BaseModel):
     video_public_id: str
 
@@ -30,8 +51,75 @@ class VideoAnalysisPersonsRequest(pydantic.BaseModel):
 class VideoAnalysisPersonsResponse(pydantic.BaseModel):
     person_video_results: List[HUIDPersonActionsMap]
 
+class VideoAnalysisEventsRequest(pydantic.BaseModel):
+    video_public_id: str
+
+class VideoAnalysisProfileRequest(pydantic.BaseModel):
+    video_public_id: str
+    artifact: Literal["summary", "stacks"] = "summary"
+
+class VideoAnalysisPersonIntervalsRequest(pydantic.BaseModel):
+    video_public_id: str
+    huid: str
+    start_seconds: Optional[float] = None
+    end_seconds: Optional[float] = None
+    max_gap_seconds: float = 1.0
+
+class VideoAnalysisPersonIntervalsResponse(pydantic.BaseModel):
+    huid: str
+    intervals: List[AppearanceInterval]
+
 class PersonDetailRequest(pydantic.BaseModel):
     huid: str
 
 class PersonDetailResponse(pydantic.BaseModel):
     person_details: PersonDetail
+
+class PersonListRequest(pydantic.BaseModel):
+    limit: int = pydantic.Field(default=50, ge=1, le=500)
+    offset: int = pydantic.Field(default=0, ge=0)
+
+class PersonListResponse(pydantic.BaseModel):
+    persons: List[PersonSummary]
+    next_offset: Optional[int] = None
+
+class ReportPageRequest(pydantic.BaseModel):
+    env_id: Optional[int] = None
+    video_public_id: Optional[str] = None
+    since: Optional[datetime] = None # analysis time, not footage time
+    until: Optional[datetime] = None
+    limit: int = pydantic.Field(default=50, ge=1, le=500)
+    offset: int = pydantic.Field(default=0, ge=0)
+
+class AlertsReportRequest(ReportPageRequest):
+    alert_level: Optional[str] = None
+
+class AlertsReportResponse(pydantic.BaseModel):
+    alerts: List[AlertEventRow]
+    next_offset: Optional[int] = None
+
+class PersonActionsReportRequest(ReportPageRequest):
+    huid: Optional[str] = None
+    action_contains: Optional[str] = None
+
+class PersonActionsReportResponse(pydantic.BaseModel):
+    actions: List[PersonActionRow]
+    next_offset: Optional[int] = None
+
+class SopResultsReportRequest(ReportPageRequest):
+    huid: Optional[str] = None
+    step_number: Optional[int] = None
+    sop_event_contains: Optional[str] = None
+    done: Optional[bool] = None
+
+class SopResultsReportResponse(pydantic.BaseModel):
+    sop_results: List[SopStepResultRow]
+    next_offset: Optional[int] = None
+
+class PersonSearchRequest(pydantic.BaseModel):
+    images: List[PersonSearchImage] = pydantic.Field(min_length=1, max_length=16)
+    top_k: int = pydantic.Field(default=5, ge=1, le=50)
+    max_distance: Optional[float] = None
+
+class PersonSearchResponse(pydantic.BaseModel):
+    matches: List[PersonSearchMatch]
@@ -1,7 +1,12 @@
-from typing import List
+from typing import List, Optional
 
 import pydantic
 
+class BulkRegisterVideoResult(pydantic.BaseModel):
+    video_public_id: str
+    reg_status: bool
+    status: str # queued, duplicate, invalid_env, failed
+
 class AlertResult(pydantic.BaseModel):
     start: str
     end: str
@@ -14,6 +19,7 @@ class SopResult(pydantic.BaseModel):
     end: str
     sop_event: str
     done: bool
+    confidence: Optional[float] = None
 
 class HUIDSOPResultsMap(pydantic.BaseModel):
     huid: str
@@ -28,7 +34,65 @@ class HUIDPersonActionsMap(pydantic.BaseModel):
     huid: str
     person_actions: List[PersonAction]
 
+class AppearanceInterval(pydantic.BaseModel):
+    start_frame: int
+    end_frame: int
+    start_seconds: float
+    end_seconds: float
+
 class PersonDetail(pydantic.BaseModel):
     name: str
     thumbnail: str
-    video_ids: List[str]
\ No newline at end of file
+    video_ids: List[str]
+
+class PersonSummary(PersonDetail):
+    huid: str
+    video_count: int
+    last_seen_at: str
+
+class PersonIdSOPResultsMap(pydantic.BaseModel):
+    person_id: int
+    sop_results: List[SopResult]
+
+class AlertEventRow(pydantic.BaseModel):
+    video_public_id: str
+    env_id: int
+    alert_level: str
+    description: str
+    start: Optional[str] = None
+    end: Optional[str] = None
+    created_at: str
+
+class PersonActionRow(pydantic.BaseModel):
+    huid: str
+    video_public_id: str
+    env_id: int
+    action: str
+    start: Optional[str] = None
+    end: Optional[str] = None
+    created_at: str
+
+class SopStepResultRow(pydantic.BaseModel):
+    huid: str
+    video_public_id: str
+    env_id: int
+    step_number: int
+    sop_event: str
+    done: bool
+    confidence: Optional[float] = None
+    start: Optional[str] = None
+    end: Optional[str] = None
+    created_at: str
+
+class PersonSearchImage(pydantic.BaseModel):
+    image_base64: Optional[str] = None
+    image_url: Optional[str] = None
+    box: Optional[List[int]] = pydantic.Field(default=None, min_length=4, max_length=4) # x1, y1, x2, y2 crop region
+
+class PersonSearchMatch(pydantic.BaseModel):
+    huid: str
+    score: float
+    best_distance: float
+    matched_images: int
+    thumbnail: Optional[str] = None
+    video_ids: List[str]
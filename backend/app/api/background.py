@@ -1,19 +1,85 @@
+import asyncio
 import logging
+from app.constants import AnalysisStage
+from app.db import open_sqllite_db_connection
+from app.exceptions import AssetDownloadFailed, GenericFSIOError
+from app.progress import AnalysisProgressReporter
+from app.services.asset_management_service import AssetManagementService
 from app.services.video_analysis_service import VideoAnalysisService
 
 logger = logging.getLogger(__name__)
 
 
-def analyse_video(video_public_id):
+async def _check_alert(video_analysis_service: VideoAnalysisService, video_public_id, progress: AnalysisProgressReporter):
+
+    progress.external_call_started()
+    accepted = False
+
+    try:
+        accepted = await video_analysis_service.check_alert(video_public_id)
+    finally:
+        # a raising (or cancelled) call must not stay pending forever
+        progress.external_call_finished(accepted)
+
+    return accepted
+
+
+def _download_video(video_public_id):
+    """
+    Bulk registered videos are downloaded by their job rather than by the request, a no-op for the ones registerVideo downloaded
+    """
+
+    asset_management_service = AssetManagementService()
+
+    db_conn = open_sqllite_db_connection()
+    try:
+        video_url = asset_management_service.get_video_url(video_public_id, db_conn)
+    finally:
+        db_conn.close()
+
+    if video_url is None:
+        raise AssetDownloadFailed(f"Video [{video_public_id}] is not registered")
+
+    try:
+        asset_management_service.download_video_for_analysis(video_public_id, video_url)
+    except (AssetDownloadFailed, GenericFSIOError) as e:
+        raise AssetDownloadFailed(f"Failed to download video [{video_public_id}]") from e
+
+
+async def analyse_video(video_public_id):
 
     logger.info(f"Analysing video with video_public_id {video_public_id}")
 
     video_analysis_service = VideoAnalysisService()
 
-    # alert analysis
+    # alert analysis and per person analysis are independent, run them concurrently
     logger.info(f"Checking for suspicions and alerts in video [{video_public_id}]")
-    video_analysis_service.check_alert(video_public_id)
-
-    # Per person analysis
     logger.info(f"Analysis People in video [{video_public_id}]")
-    video_analysis_service.analyse_people_from_video(video_public_id)
+
+    progress = AnalysisProgressReporter(video_public_id)
+
+    try:
+        await asyncio.to_thread(_download_video, video_public_id)
+
+        progress.set_stage(AnalysisStage.Tracking)
+
+        # a failing half cancels the other one, nothing of the job may outlive it on the worker's loop
+        async with asyncio.TaskGroup() as task_group:
+            task_group.create_task(_check_alert(video_analysis_service, video_public_id, progress))
+            task_group.create_task(video_analysis_service.analyse_people_from_video(video_public_id, progress))
+
+        # the results of the requests memories.ai accepted come back through the callbacks
+        progress.set_stage(AnalysisStage.AwaitingResults)
+
+    except ExceptionGroup as e:
+        # the job is failed with the first error rather than the group
+        error = e.exceptions[0]
+        progress.set_stage(AnalysisStage.Failed, str(error))
+        raise error from e
+
+    except Exception as e:
+        progress.set_stage(AnalysisStage.Failed, str(e))
+        raise
+
+    finally:
+        progress.close()
@@ -0,0 +1,13 @@
+from fastapi import APIRouter, Response
+
+from app.metrics import registry
+
+# Prometheus scrape endpoint, at the root since that is where scrapers look by default.
+# The standalone worker serves the same registry of its own process (app.metrics.start_metrics_server)
+
+metrics_router = APIRouter()
+
+
+@metrics_router.get("/metrics", include_in_schema=False)
+def getMetrics():
+    return Response(content=registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,101 @@
+from sqlite3 import Connection
+import sqlite3
+from typing import Annotated
+
+from fastapi import (
+    APIRouter,
+    Depends,
+    HTTPException,
+    status,
+)
+
+import logging
+
+from app.api import api_schema, api_schema_helper
+from app.db import get_sqllite_db_connection
+from app.exceptions import InvalidSearchImage
+from app.services.person_search_service import person_search_service
+
+logger = logging.getLogger(__name__)
+
+# Needs the OSNet model and the re-ID gallery, so it is only mounted by the all-in-one app (main.py),
+# the lean API (api.py) never imports this module
+
+search_router = APIRouter(prefix="/api/v1")
+
+
+@search_router.post(
+    "/search/persons",
+    status_code=status.HTTP_200_OK,
+    response_model=api_schema.PersonSearchResponse,
+)
+def searchPersonsByImage(
+    db_conn: Annotated[Connection, Depends(get_sqllite_db_connection)],
+    personSearchReq: api_schema.PersonSearchRequest,
+):
+    """
+    Endpoint to find where a person has appeared, given one or more images (or crop regions of frames) of them.
+    """
+
+    try:
+        matches = person_search_service.search(
+            [(image.image_base64, image.image_url, image.box) for image in personSearchReq.images],
+            personSearchReq.top_k,
+            personSearchReq.max_distance,
+        )
+
+    except InvalidSearchImage as e:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=str(e)
+        )
+
+    except Exception as e:
+        logger.error(f"Person search failed due to error {e}")
+
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to search the person"
+        )
+
+    if len(matches) == 0:
+        raise HTTPException(
+            status_code=status.HTTP_204_NO_CONTENT,
+            detail="No matching person found"
+        )
+
+    huids = [huid for huid, _, _, _ in matches]
+    placeholders = ", ".join("?" * len(huids))
+
+    try:
+        cursor = db_conn.cursor()
+
+        cursor.execute(f"SELECT huid, thumbnail_url FROM person_summary WHERE huid IN ({placeholders})", huids)
+        thumbnails = {r['huid']: r['thumbnail_url'] for r in cursor.fetchall()}
+
+        cursor.execute(f"SELECT huid, video_public_id FROM person_videos WHERE huid IN ({placeholders})", huids)
+        huid_to_videos = {huid: [] for huid in huids}
+        for r in cursor.fetchall():
+            huid_to_videos[r['huid']].append(r['video_public_id'])
+
+    except sqlite3.Error as e:
+        logger.error(f"Failed to get the videos of the matched persons due to error {e}")
+
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to search the person"
+        )
+
+    return api_schema.PersonSearchResponse(
+        matches=[
+            api_schema_helper.PersonSearchMatch(
+                huid=huid,
+                score=score,
+                best_distance=best_distance,
+                matched_images=matched_images,
+                thumbnail=thumbnails.get(huid),
+                video_ids=huid_to_videos[huid],
+            )
+            for huid, score, best_distance, matched_images in matches
+        ]
+    )
@@ -0,0 +1,198 @@
+import hashlib
+import json
+import logging
+from sqlite3 import Connection
+import sqlite3
+import time
+
+from app.config import app_settings
+from app.exceptions import CallbackProcessingFailed, DBOperationFailed
+from app.metrics import CALLBACK_EVENTS_TOTAL, record_stage
+from app.results_store import store_alert_rows, store_person_action_rows, store_sop_result_rows
+from app.services.video_clip_service import VideoClipService
+from app.utils import get_structured_output
+
+logger = logging.getLogger(__name__)
+
+
+def store_callback_event(kind, video_public_id, huid, payload, db_conn: Connection):
+    """
+    Durably store a raw webhook payload for the worker, duplicates (same kind/video/huid/payload) are ignored.
+    Returns True if the event is new.
+    """
+
+    raw_payload = json.dumps(payload, sort_keys=True)
+    payload_hash = hashlib.sha256(raw_payload.encode("utf-8")).hexdigest()
+
+    try:
+        cursor = db_conn.cursor()
+
+        sql_cmd = """
+        INSERT OR IGNORE INTO callback_events (kind, video_public_id, huid, payload, payload_hash)
+        VALUES (?,?,?,?,?)
+        """
+
+        cursor.execute(sql_cmd, (kind, video_public_id, huid, raw_payload, payload_hash))
+        db_conn.commit()
+
+        return cursor.rowcount == 1
+
+    except sqlite3.Error as e:
+        logger.error(f"Failed to store {kind} callback for video [{video_public_id}] due to error {e}")
+
+        if db_conn:
+            db_conn.rollback()
+
+        raise DBOperationFailed()
+
+
+def claim_next_callback_event(db_conn: Connection):
+    """
+    Atomically move the oldest pending event to running and return it, events being retried wait CALLBACK_RETRY_DELAY_SECONDS.
+    A running event whose lease expired (its worker died) is claimed again, or failed once it used up its attempts.
+    """
+
+    lease = f"-{int(app_settings.CALLBACK_EVENT_LEASE_SECONDS)} seconds"
+
+    expire_cmd = """
+    UPDATE callback_events
+    SET status = 'failed', error = 'Lease expired, worker lost on every attempt', updated_at = CURRENT_TIMESTAMP
+    WHERE status = 'running' AND COALESCE(claimed_at, updated_at) <= datetime('now', ?) AND attempts >= ?
+    """
+
+    sql_cmd = """
+    UPDATE callback_events
+    SET status = 'running', attempts = attempts + 1, claimed_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+    WHERE id = (
+        SELECT id FROM callback_events
+        WHERE (status = 'pending' AND (attempts = 0 OR updated_at <= datetime('now', ?)))
+            OR (status = 'running' AND COALESCE(claimed_at, updated_at) <= datetime('now', ?))
+        ORDER BY id
+        LIMIT 1
+    )
+    RETURNING id, kind, video_public_id, huid, payload, attempts
+    """
+
+    cursor = db_conn.cursor()
+    cursor.execute(expire_cmd, (lease, app_settings.CALLBACK_MAX_ATTEMPTS))
+    cursor.execute(sql_cmd, (f"-{int(app_settings.CALLBACK_RETRY_DELAY_SECONDS)} seconds", lease))
+    event = cursor.fetchone()
+    db_conn.commit()
+
+    return event
+
+
+def _mark_callback_event(event_id, status, cursor, error=None):
+
+    sql_cmd = """
+    UPDATE callback_events
+    SET status = ?, error = ?, updated_at = CURRENT_TIMESTAMP
+    WHERE id = ?
+    """
+
+    cursor.execute(sql_cmd, (status, error, event_id))
+
+
+def _store_alerts(video_public_id, alert_resp, cursor):
+
+    sql_cmd = """
+    UPDATE videos
+    SET alerts = ?
+    WHERE public_id = ?
+    """
+
+    cursor.execute(sql_cmd, (json.dumps(alert_resp), video_public_id,))
+    store_alert_rows(video_public_id, alert_resp, cursor)
+
+
+def _store_annotation(video_public_id, huid, annotate_resp, cursor):
+
+    # the person may have been annotated on a sub clip, bring the timestamps back to the original video
+    clip_service = VideoClipService()
+    segments = clip_service.get_person_clip_segments(video_public_id, huid, cursor)
+
+    if segments:
+        # new dicts, the response may be the cached object of the LLM cache
+        annotate_resp = [
+            {
+                **action,
+                "start": clip_service.remap_clip_timestamp(action["start"], segments),
+                "end": clip_service.remap_clip_timestamp(action["end"], segments),
+            }
+            for action in annotate_resp
+        ]
+
+    # update in place so a reprocessed event never creates a second row for the same person
+    update_cmd = """
+    UPDATE people
+    SET annotation = ?, sop = NULL, sop_attempts = 0
+    WHERE huid = ? AND video_public_id = ?
+    """
+
+    cursor.execute(update_cmd, (json.dumps(annotate_resp), huid, video_public_id))
+
+    if cursor.rowcount == 0:
+        insert_cmd = """
+        INSERT INTO people (huid, video_public_id, annotation)
+        VALUES (?,?,?)
+        """
+
+        cursor.execute(insert_cmd, (huid, video_public_id, json.dumps(annotate_resp)))
+
+    cursor.execute("SELECT id FROM people WHERE huid = ? AND video_public_id = ?", (huid, video_public_id))
+    person_id = cursor.fetchone()[0]
+
+    store_person_action_rows(person_id, annotate_resp, cursor)
+    store_sop_result_rows(person_id, None, cursor)
+
+
+def process_callback_event(event, db_conn: Connection):
+    """
+    Structure the payload of a claimed callback event with the LLM and store the results,
+    the results and the event status are committed together so an event is applied exactly once
+    """
+
+    event_id, kind, video_public_id, huid = event["id"], event["kind"], event["video_public_id"], event["huid"]
+    start = time.perf_counter()
+
+    try:
+        text = json.loads(event["payload"])["data"]["text"]
+
+        logger.info(f"Processing {kind} callback [{event_id}] for video_public_id - {video_public_id}")
+
+        structured_resp = get_structured_output(text, kind)
+
+        if structured_resp is None:
+            raise CallbackProcessingFailed("LLM didn't return a structured output")
+
+        cursor = db_conn.cursor()
+
+        if kind == "alert":
+            _store_alerts(video_public_id, structured_resp, cursor)
+        elif kind == "annotate":
+            # SOP is verified in bulk by the SOP scheduler of the analysis worker (app.worker.run_sop_scheduler)
+            _store_annotation(video_public_id, huid, structured_resp, cursor)
+        else:
+            raise CallbackProcessingFailed(f"Unknown callback kind {kind}")
+
+        _mark_callback_event(event_id, "done", cursor)
+        db_conn.commit()
+
+        record_stage(f"callback_{kind}", time.perf_counter() - start)
+        CALLBACK_EVENTS_TOTAL.inc(kind=kind, status="done")
+
+        logger.info(f"{kind} callback [{event_id}] stored successfully into db for video - {video_public_id}")
+
+    except (CallbackProcessingFailed, KeyError, TypeError, json.JSONDecodeError, sqlite3.Error) as e:
+        logger.error(f"Failed to process {kind} callback [{event_id}] for video [{video_public_id}] due to error {e}")
+
+        db_conn.rollback()
+
+        # transient failures (LLM, db locked) get retried, a payload that keeps failing is parked as failed
+        status = "pending" if event["attempts"] < app_settings.CALLBACK_MAX_ATTEMPTS else "failed"
+
+        _mark_callback_event(event_id, status, db_conn.cursor(), str(e))
+        db_conn.commit()
+
+        record_stage(f"callback_{kind}", time.perf_counter() - start)
+        CALLBACK_EVENTS_TOTAL.inc(kind=kind, status="retry" if status == "pending" else status)
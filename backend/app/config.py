@@ -11,11 +11,8 @@ from pydantic_settings import BaseSettings, SettingsConfigDict
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-import torchreid
-
 from google import genai
 
-from app.db import get_huid_collection, setup_sqllite_database, setup_vector_db
 
 logger = logging.getLogger(__name__)
 
@@ -30,24 +27,208 @@ class AppSecrets(BaseSettings):
 
     model_config = SettingsConfigDict(env_file="secrets.env", env_file_encoding="utf-8")
 
+class AppSettings(BaseSettings):
+    """
+    Non secret tunables, can be overridden through environment variables or settings.env
+    """
+
+    WORKER_POLL_INTERVAL_SECONDS: float = 2.0
+
+    # a running job renews its lease every third of this, a job whose lease expired is claimed again,
+    # up to ANALYSIS_JOB_MAX_ATTEMPTS times (a video that keeps killing the worker is parked as failed)
+    ANALYSIS_JOB_LEASE_SECONDS: float = 300.0
+    ANALYSIS_JOB_MAX_ATTEMPTS: int = 3
+
+    # memories.ai, point these to a local stub server for testing
+    MEMORIES_AI_UPLOAD_URL: str = "https://security.memories.ai/v1/understand/upload"
+    CALLBACK_BASE_URL: str = "https://20da56df2fe66e.lhr.life"
+
+    # analysis downloads a Cloudinary proxy rendition instead of the original upload, sized for the detector input
+    PROXY_INGEST_ENABLED: bool = True
+    PROXY_MAX_WIDTH: int = 640
+    PROXY_FPS: float | None = None
+    # assumed when the container doesn't report a frame rate (OpenCV returns 0)
+    VIDEO_DEFAULT_FPS: float = 25.0
+
+    # detection and re-identification, see VideoAnalysisService._get_and_insert_huids_from_video
+    DETECTION_CONF_THRESHOLD: float = 0.7
+    REID_DISTANCE_THRESHOLD: float = 0.3
+    GALLERY_UPDATE_EVERY_N_FRAMES: int = 10
+    GALLERY_SIZE: int = 5
+
+    # record raw detections + embeddings per video for replay / threshold sweeps (replay.py)
+    DETECTION_CACHE_ENABLED: bool = False
+    DETECTION_CACHE_MIN_CONF: float = 0.25
+
+    # max number of people of a video whose crop upload + annotation request are in flight at once
+    PERSON_ANALYSIS_CONCURRENCY: int = 8
+
+    # a returning person's thumbnail is re-uploaded only if the new best crop has this many times more pixels
+    THUMBNAIL_MIN_RESOLUTION_GAIN: float = 1.5
+
+    # per person sub clips sent for annotation instead of the full video
+    PERSON_CLIPS_ENABLED: bool = True
+    CLIP_PADDING_SECONDS: float = 2.0
+    CLIP_MERGE_GAP_SECONDS: float = 3.0
+    CLIP_MAX_FRACTION: float = 0.8
+
+    # LLM used to structure the memories.ai responses
+    GEMINI_MODEL: str = "gemini-2.5-flash"
+    LLM_MAX_CONCURRENCY: int = 4
+
+    # webhook payloads are processed by the worker, failing ones are retried up to this many times
+    CALLBACK_MAX_ATTEMPTS: int = 3
+    CALLBACK_RETRY_DELAY_SECONDS: float = 30.0
+    # a running event not finished within its lease lost its worker and is claimed again
+    CALLBACK_EVENT_LEASE_SECONDS: float = 600.0
+
+    # SOP verification runs in bulk on a timer, packing many people into one LLM call
+    SOP_BATCH_INTERVAL_SECONDS: float = 300.0
+    SOP_BATCH_MAX_PEOPLE_PER_CALL: int = 10
+    # rounds a person may go without an LLM verdict (failed call, left out of the response), then the local
+    # verdicts are stored with the undecided steps as not done and no confidence
+    SOP_MAX_ATTEMPTS: int = 3
+
+    # local SOP matcher, steps scoring in between the two are escalated to the LLM
+    SOP_MATCH_ACCEPT_SCORE: float = 0.35
+    SOP_MATCH_REJECT_SCORE: float = 0.1
+
+    # cache of structured LLM outputs, see app/llm_cache.py
+    LLM_CACHE_PATH: str = "llm_cache.db"
+    LLM_CACHE_MAX_ENTRIES: int = 50000
+    LLM_CACHE_MEMORY_ENTRIES: int = 2048
+    LLM_CACHE_TTL_SECONDS: float = 7 * 24 * 60 * 60
+
+    # outbound HTTP client
+    HTTP_TIMEOUT_SECONDS: float = 30.0
+    HTTP_CONNECT_TIMEOUT_SECONDS: float = 5.0
+    HTTP_MAX_CONNECTIONS: int = 50
+    HTTP_MAX_CONNECTIONS_PER_HOST: int = 10
+    HTTP_KEEPALIVE_EXPIRY_SECONDS: float = 30.0
+    HTTP_MAX_RETRIES: int = 3
+    HTTP_BACKOFF_BASE_SECONDS: float = 0.5
+    HTTP_BACKOFF_MAX_SECONDS: float = 8.0
+
+    # pre-serialized /video_analysis/* responses kept by every API process, see app/response_cache.py
+    RESPONSE_CACHE_MAX_ENTRIES: int = 1024
+
+    # search by image over the re-ID gallery (all-in-one app only), see app/services/person_search_service.py
+    PERSON_SEARCH_EMBEDDING_CACHE_ENTRIES: int = 1024
+    PERSON_SEARCH_RESULT_CACHE_ENTRIES: int = 256
+    PERSON_SEARCH_RESULT_TTL_SECONDS: float = 30.0
+    # image_url may only point at our Cloudinary cloud, images above the cap are rejected before decoding
+    PERSON_SEARCH_IMAGE_HOST: str = "res.cloudinary.com"
+    PERSON_SEARCH_MAX_IMAGE_BYTES: int = 10 * 1024 * 1024
+
+    # analysis progress, written by the worker (app/progress.py) and streamed over SSE by the API
+    PROGRESS_FLUSH_INTERVAL_SECONDS: float = 1.0
+    SSE_POLL_INTERVAL_SECONDS: float = 1.0
+    SSE_KEEPALIVE_SECONDS: float = 15.0
+    SSE_MAX_STREAM_SECONDS: float = 2 * 60 * 60
+    # a video tracking or annotating without a progress write for this long lost its worker, streamed as failed
+    SSE_STALE_PROGRESS_SECONDS: float = 10 * 60
+    # results still missing this long after the analysis requested them (memories.ai never called back, SOP never
+    # verified) end the stream as timed out instead of keeping it open until SSE_MAX_STREAM_SECONDS
+    SSE_RESULTS_DEADLINE_SECONDS: float = 30 * 60
+
+    # Prometheus metrics (app/metrics.py), the API serves /metrics itself, the standalone worker on this port (0 disables it)
+    WORKER_METRICS_PORT: int = 9100
+
+    # memory budget of the tracking of one video (app/memory.py), on top of the RSS the job starts with, 0 disables it
+    ANALYSIS_MEMORY_BUDGET_MB: int = 0
+    ANALYSIS_MEMORY_CHECK_EVERY_N_FRAMES: int = 30
+    ANALYSIS_MEMORY_DEGRADE_RATIO: float = 0.8
+    ANALYSIS_MEMORY_RECOVER_RATIO: float = 0.5
+    ANALYSIS_MAX_FRAME_STRIDE: int = 8
+    # tracks unseen for this many frames are dropped from the tracking state, keep it well above BoT-SORT's track_buffer
+    TRACK_STATE_MAX_IDLE_FRAMES: int = 300
+
+    # per job profiling (app/profiling.py), opt in per video at registration or for every job here
+    PROFILE_ALL_JOBS: bool = False
+    PROFILE_SAMPLE_INTERVAL_SECONDS: float = 0.01
+
+    # SQLite, see app/db.py
+    SQLITE_DB_PATH: str = "app.db"
+    SQLITE_POOL_SIZE: int = 8
+    SQLITE_STATEMENT_CACHE_SIZE: int = 256
+    SQLITE_CACHE_SIZE_KB: int = 16 * 1024
+    SQLITE_MMAP_SIZE_BYTES: int = 256 * 1024 * 1024
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
+
+    # quota aware rate limiting of the external AI APIs, see app/rate_limit.py
+    MEMORIES_AI_RATE_PER_SECOND: float = 2.0
+    MEMORIES_AI_BURST: int = 5
+    MEMORIES_AI_MAX_CONCURRENCY: int = 8
+    GEMINI_RATE_PER_SECOND: float = 5.0
+    GEMINI_BURST: int = 10
+    RATE_LIMIT_MAX_REQUEUES: int = 10
+
+    model_config = SettingsConfigDict(env_file="settings.env", env_file_encoding="utf-8", extra="ignore")
+
+def reset_local_state():
+
+    shutil.rmtree("app/crops/",ignore_errors=True)
+
+    # WAL mode keeps the -wal and -shm files next to the database
+    for suffix in ("", "-wal", "-shm"):
+        try:
+            os.remove(f"{app_settings.SQLITE_DB_PATH}{suffix}")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"Failed to remove {app_settings.SQLITE_DB_PATH}{suffix}")
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    """
+    Lifespan of the all-in-one app, API and analysis worker share a single process
+    """
 
-    shutil.rmtree("app/crops/",ignore_errors=True)
+    # imported here so that the lean API (api_lifespan) never pulls in the models
+    from app.db import setup_sqllite_database, sqlite_connection_pool
+    from app.services.person_search_service import person_search_service
+    from app.vector_db import setup_vector_db
+    from app.worker import start_background_threads, start_worker_thread
 
-    try:
-        os.remove("app.db")
-    except Exception as e:
-        logger.warning("Failed to remove app.db")
+    reset_local_state()
     
     logger.info("------FastAPI is starting UP------")
 
     setup_sqllite_database()
     setup_vector_db()
+    person_search_service.warm_up()
+
+    threads = [start_worker_thread(app_settings.WORKER_POLL_INTERVAL_SECONDS)] + start_background_threads()
 
     yield
     logger.info("------FastAPI is shutting DOWN------")
 
+    for _, stop_event in threads:
+        stop_event.set()
+
+    for thread, _ in threads:
+        thread.join(timeout=5)
+
+    sqlite_connection_pool.close()
+
+@asynccontextmanager
+async def api_lifespan(app: FastAPI):
+    """
+    Lifespan of the lean API process, it never touches the models and never resets state
+    since it can run as many replicas next to a separate analysis worker
+    """
+
+    from app.db import setup_sqllite_database, sqlite_connection_pool
+
+    logger.info("------FastAPI (API only) is starting UP------")
+
+    setup_sqllite_database()
+
+    yield
+    logger.info("------FastAPI (API only) is shutting DOWN------")
+
+    sqlite_connection_pool.close()
+
 
 def init_cors(app: FastAPI):
     origins = ["*"] # Allow all origins; modify as needed for production
@@ -74,13 +255,6 @@ def configure_cloudinary(app_secrets : AppSecrets):
     logger.info(f"Cloudinary Configured")
 
 app_secrets = AppSecrets()
-
-osnet_feature_extractor = torchreid.utils.FeatureExtractor(
-    model_name="osnet_ain_x1_0",
-    device="cuda",
-)
-
-huid_collection = get_huid_collection()
+app_settings = AppSettings()
 
 gemini_client = genai.Client(api_key=app_secrets.GEMINI_API_KEY.get_secret_value())
-chat = gemini_client.chats.create(model="gemini-2.5-flash")
@@ -1,4 +1,20 @@
-from enum import Enum
+from enum import Enum, IntEnum, StrEnum
 
 class Environment(Enum):
-    JewelleryShop = 1
\ No newline at end of file
+    JewelleryShop = 1
+
+class RequestPriority(IntEnum):
+    """Priority of calls to the external AI APIs, lower goes first"""
+    Alert = 0
+    Annotation = 10
+    Sop = 20
+
+class AnalysisStage(StrEnum):
+    """Stages of a video analysis as streamed to the clients, Done and TimedOut are derived by the API from the results"""
+    Queued = "queued"
+    Tracking = "tracking"
+    Annotating = "annotating"
+    AwaitingResults = "awaiting_results"
+    Done = "done"
+    TimedOut = "timed_out"
+    Failed = "failed"
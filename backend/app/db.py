@@ -1,19 +1,375 @@
+from contextlib import suppress
+import json
 import logging
-import os
+import queue
 import sqlite3
 
-import chromadb
+from app.config import app_settings
 
 logger = logging.getLogger(__name__)
 
+
+def _mmss_to_seconds(timestamp):
+
+    try:
+        minutes, seconds = timestamp.split(":")
+        return int(minutes) * 60 + int(seconds)
+    except (AttributeError, ValueError):
+        return None
+
+
+def _backfill_result_rows(cursor: sqlite3.Cursor):
+    """
+    Migration 3, fills the typed result rows from the JSON columns. The SQL is frozen here on purpose, it must keep
+    matching the schema as of migration 3 whatever app/results_store.py writes later on.
+    """
+
+    cursor.execute("SELECT public_id, alerts FROM videos WHERE alerts IS NOT NULL")
+    alert_rows = [
+        (
+            str(alert.get("alert_level", "")).lower(),
+            alert.get("description", ""),
+            alert.get("start"),
+            alert.get("end"),
+            _mmss_to_seconds(alert.get("start")),
+            _mmss_to_seconds(alert.get("end")),
+            r[0],
+        )
+        for r in cursor.fetchall()
+        for alert in json.loads(r[1])
+    ]
+
+    cursor.execute("SELECT id, annotation, sop FROM people WHERE annotation IS NOT NULL")
+    action_rows, sop_rows = [], []
+
+    for r in cursor.fetchall():
+        action_rows.extend(
+            (
+                action.get("action", ""),
+                action.get("start"),
+                action.get("end"),
+                _mmss_to_seconds(action.get("start")),
+                _mmss_to_seconds(action.get("end")),
+                r[0],
+            )
+            for action in json.loads(r[1])
+        )
+
+        sop_rows.extend(
+            (
+                step_number,
+                result.get("sop_event", ""),
+                int(bool(result.get("done"))),
+                result.get("confidence"),
+                result.get("start"),
+                result.get("end"),
+                _mmss_to_seconds(result.get("start")),
+                _mmss_to_seconds(result.get("end")),
+                r[0],
+            )
+            for step_number, result in enumerate(json.loads(r[2]) if r[2] else [], start=1)
+        )
+
+    cursor.executemany("""
+    INSERT INTO alert_events
+        (video_public_id, env_id, alert_level, description, start_timestamp, end_timestamp, start_seconds, end_seconds)
+    SELECT public_id, env_id, ?, ?, ?, ?, ?, ?
+    FROM videos
+    WHERE public_id = ?
+    """, alert_rows)
+
+    cursor.executemany("""
+    INSERT INTO person_actions
+        (person_id, huid, video_public_id, env_id, action, start_timestamp, end_timestamp, start_seconds, end_seconds)
+    SELECT people.id, people.huid, people.video_public_id, videos.env_id, ?, ?, ?, ?, ?
+    FROM people
+    JOIN videos ON people.video_public_id = videos.public_id
+    WHERE people.id = ?
+    """, action_rows)
+
+    cursor.executemany("""
+    INSERT INTO sop_step_results
+        (person_id, huid, video_public_id, env_id, step_number, sop_event, done, confidence,
+         start_timestamp, end_timestamp, start_seconds, end_seconds)
+    SELECT people.id, people.huid, people.video_public_id, videos.env_id, ?, ?, ?, ?, ?, ?, ?, ?
+    FROM people
+    JOIN videos ON people.video_public_id = videos.public_id
+    WHERE people.id = ?
+    """, sop_rows)
+
+
+# Versioned schema changes on top of the CREATE TABLE IF NOT EXISTS baseline, applied in order and tracked
+# through PRAGMA user_version. A step is either a statement or a callable taking the cursor.
+# Only ever append to this list, never edit an entry that has shipped.
+
+MIGRATIONS = [
+    # 1: lookups used by the endpoints, the SOP join and the job / callback queues
+    [
+        "CREATE INDEX IF NOT EXISTS idx_people_video_huid ON people (video_public_id, huid)",
+        "CREATE INDEX IF NOT EXISTS idx_people_huid ON people (huid)",
+        "CREATE INDEX IF NOT EXISTS idx_videos_env_id ON videos (env_id)",
+        "CREATE INDEX IF NOT EXISTS idx_analysis_jobs_status ON analysis_jobs (status, id)",
+        "CREATE INDEX IF NOT EXISTS idx_callback_events_status ON callback_events (status, id)",
+    ],
+    # 2: results_version of a video, bumped whenever any of its analysis results change (ETags of the result endpoints)
+    [
+        "ALTER TABLE videos ADD COLUMN results_version INT NOT NULL DEFAULT 0",
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_videos_alerts_version AFTER UPDATE OF alerts ON videos
+        BEGIN
+            UPDATE videos SET results_version = results_version + 1 WHERE id = NEW.id;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_people_insert_version AFTER INSERT ON people
+        BEGIN
+            UPDATE videos SET results_version = results_version + 1 WHERE public_id = NEW.video_public_id;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_people_update_version AFTER UPDATE OF annotation, sop ON people
+        BEGIN
+            UPDATE videos SET results_version = results_version + 1 WHERE public_id = NEW.video_public_id;
+        END
+        """,
+    ],
+    # 3: typed rows mirroring the alerts / annotation / sop JSON columns for indexed cross video reporting,
+    #    backfilled from the JSON that is already stored
+    [
+        """
+        CREATE TABLE IF NOT EXISTS alert_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            video_public_id TEXT NOT NULL,
+            env_id INT NOT NULL,
+            alert_level TEXT NOT NULL,
+            description TEXT NOT NULL,
+            start_timestamp TEXT,
+            end_timestamp TEXT,
+            start_seconds INT,
+            end_seconds INT,
+            created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+
+            FOREIGN KEY (video_public_id) REFERENCES videos (public_id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS person_actions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            person_id INTEGER NOT NULL,
+            huid TEXT NOT NULL,
+            video_public_id TEXT NOT NULL,
+            env_id INT NOT NULL,
+            action TEXT NOT NULL,
+            start_timestamp TEXT,
+            end_timestamp TEXT,
+            start_seconds INT,
+            end_seconds INT,
+            created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+
+            FOREIGN KEY (person_id) REFERENCES people (id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS sop_step_results (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            person_id INTEGER NOT NULL,
+            huid TEXT NOT NULL,
+            video_public_id TEXT NOT NULL,
+            env_id INT NOT NULL,
+            step_number INT NOT NULL,
+            sop_event TEXT NOT NULL,
+            done INT NOT NULL,
+            confidence REAL,
+            start_timestamp TEXT,
+            end_timestamp TEXT,
+            start_seconds INT,
+            end_seconds INT,
+            created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+
+            FOREIGN KEY (person_id) REFERENCES people (id)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_alert_events_level ON alert_events (alert_level, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_alert_events_env ON alert_events (env_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_alert_events_video ON alert_events (video_public_id)",
+        "CREATE INDEX IF NOT EXISTS idx_person_actions_person ON person_actions (person_id)",
+        "CREATE INDEX IF NOT EXISTS idx_person_actions_env ON person_actions (env_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_person_actions_video_huid ON person_actions (video_public_id, huid)",
+        "CREATE INDEX IF NOT EXISTS idx_sop_step_results_person ON sop_step_results (person_id)",
+        "CREATE INDEX IF NOT EXISTS idx_sop_step_results_step ON sop_step_results (env_id, step_number, done, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_sop_step_results_video_huid ON sop_step_results (video_public_id, huid)",
+        _backfill_result_rows,
+    ],
+    # 4: materialized per person summary (huid -> videos, cached thumbnail) for /persons, kept up to date by
+    #    triggers on people and huid_thumbnails so a request never has to aggregate people
+    [
+        """
+        CREATE TABLE IF NOT EXISTS person_summary (
+            huid TEXT PRIMARY KEY,
+            name TEXT,
+            thumbnail_url TEXT,
+            video_count INT NOT NULL DEFAULT 0,
+            first_seen_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            last_seen_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS person_videos (
+            huid TEXT NOT NULL,
+            video_public_id TEXT NOT NULL,
+            created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+
+            PRIMARY KEY (huid, video_public_id)
+        ) WITHOUT ROWID
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_person_summary_last_seen ON person_summary (last_seen_at)",
+        """
+        INSERT OR IGNORE INTO person_summary (huid, video_count)
+        SELECT huid, COUNT(DISTINCT video_public_id) FROM people GROUP BY huid
+        """,
+        "INSERT OR IGNORE INTO person_videos (huid, video_public_id) SELECT DISTINCT huid, video_public_id FROM people",
+        """
+        INSERT INTO person_summary (huid, thumbnail_url)
+        SELECT huid, url FROM huid_thumbnails WHERE true
+        ON CONFLICT (huid) DO UPDATE SET thumbnail_url = excluded.thumbnail_url
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_people_insert_summary AFTER INSERT ON people
+        BEGIN
+            INSERT INTO person_summary (huid) VALUES (NEW.huid)
+            ON CONFLICT (huid) DO UPDATE SET last_seen_at = CURRENT_TIMESTAMP;
+
+            INSERT OR IGNORE INTO person_videos (huid, video_public_id) VALUES (NEW.huid, NEW.video_public_id);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_person_videos_insert_summary AFTER INSERT ON person_videos
+        BEGIN
+            UPDATE person_summary SET video_count = video_count + 1 WHERE huid = NEW.huid;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_huid_thumbnails_insert_summary AFTER INSERT ON huid_thumbnails
+        BEGIN
+            INSERT INTO person_summary (huid, thumbnail_url) VALUES (NEW.huid, NEW.url)
+            ON CONFLICT (huid) DO UPDATE SET thumbnail_url = excluded.thumbnail_url;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_huid_thumbnails_update_summary AFTER UPDATE OF url ON huid_thumbnails
+        BEGIN
+            INSERT INTO person_summary (huid, thumbnail_url) VALUES (NEW.huid, NEW.url)
+            ON CONFLICT (huid) DO UPDATE SET thumbnail_url = excluded.thumbnail_url;
+        END
+        """,
+    ],
+    # 5: live progress of the analysis of every video, written by the worker and streamed by the API (SSE)
+    [
+        """
+        CREATE TABLE IF NOT EXISTS analysis_progress (
+            video_public_id TEXT PRIMARY KEY,
+            stage TEXT NOT NULL,
+            frames_processed INT NOT NULL DEFAULT 0,
+            total_frames INT NOT NULL DEFAULT 0,
+            frames_per_second REAL,
+            people_found INT NOT NULL DEFAULT 0,
+            external_pending INT NOT NULL DEFAULT 0,
+            external_requested INT NOT NULL DEFAULT 0,
+            external_failed INT NOT NULL DEFAULT 0,
+            error TEXT DEFAULT NULL,
+            version INT NOT NULL DEFAULT 0,
+            updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+
+            FOREIGN KEY (video_public_id) REFERENCES videos (public_id)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_callback_events_video ON callback_events (video_public_id, status)",
+    ],
+    # 6: per stage timings and counters of every finished analysis job (JSON, app.metrics.JobStats.summary)
+    [
+        "ALTER TABLE analysis_jobs ADD COLUMN metrics TEXT DEFAULT NULL",
+    ],
+    # 7: opt in profiling of a job, requested at registration
+    [
+        "ALTER TABLE analysis_jobs ADD COLUMN profile INT NOT NULL DEFAULT 0",
+    ],
+    # 8: lease of a running analysis job, one whose lease expired lost its worker and is claimed again
+    [
+        "ALTER TABLE analysis_jobs ADD COLUMN claimed_at TEXT DEFAULT NULL",
+    ],
+    # 9: lease of a running callback event, same as 8
+    [
+        "ALTER TABLE callback_events ADD COLUMN claimed_at TEXT DEFAULT NULL",
+    ],
+    # 10: SOP verification rounds a person went through without a verdict from the LLM
+    [
+        "ALTER TABLE people ADD COLUMN sop_attempts INT NOT NULL DEFAULT 0",
+    ],
+]
+
+
+def _configure_connection(conn: sqlite3.Connection):
+    """
+    Per connection pragmas, WAL lets the API read while the worker writes
+    """
+
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute(f"PRAGMA cache_size = {-int(app_settings.SQLITE_CACHE_SIZE_KB)}")
+    conn.execute(f"PRAGMA mmap_size = {int(app_settings.SQLITE_MMAP_SIZE_BYTES)}")
+    conn.execute(f"PRAGMA busy_timeout = {int(app_settings.SQLITE_BUSY_TIMEOUT_MS)}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+
+
+def _connect(check_same_thread=True):
+
+    conn = sqlite3.connect(
+        app_settings.SQLITE_DB_PATH,
+        timeout=app_settings.SQLITE_BUSY_TIMEOUT_MS / 1000,
+        # sqlite3 keeps this many compiled statements per connection, reusing connections is what makes it pay off
+        cached_statements=app_settings.SQLITE_STATEMENT_CACHE_SIZE,
+        check_same_thread=check_same_thread,
+    )
+    _configure_connection(conn)
+
+    return conn
+
+
+def apply_migrations(conn: sqlite3.Connection):
+    """
+    Apply every migration newer than the database's user_version, each one in its own transaction
+    """
+
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+
+    for i, statements in enumerate(MIGRATIONS[version:], start=version + 1):
+        try:
+            cursor = conn.cursor()
+
+            for statement in statements:
+                if callable(statement):
+                    statement(cursor)
+                else:
+                    cursor.execute(statement)
+
+            conn.execute(f"PRAGMA user_version = {i}")
+            conn.commit()
+            logger.info(f"Applied database migration {i}")
+
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+
 def setup_sqllite_database():
     """
     Creates all the necessary Tables if they don't exist, it will be useful when the app is being run first time
     """
 
+    conn = None
+
     try:
 
-        conn = sqlite3.connect("app.db")
+        conn = _connect()
         cursor = conn.cursor()
             
         sql_create_videos_table = """
@@ -77,12 +433,84 @@ def setup_sqllite_database():
         VALUES (?,1)
         """
 
+        # Work queue shared by the API process (producer) and the analysis worker (consumer)
+
+        sql_create_analysis_jobs_table = """
+        CREATE TABLE IF NOT EXISTS analysis_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            video_public_id TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INT NOT NULL DEFAULT 0,
+            error TEXT DEFAULT NULL,
+            created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+
+            FOREIGN KEY (video_public_id) REFERENCES videos (public_id)
+        )
+        """
+
+        # Best known crop of every person, reused across videos instead of re-uploading it
+
+        sql_create_huid_thumbnails_table = """
+        CREATE TABLE IF NOT EXISTS huid_thumbnails (
+            huid TEXT PRIMARY KEY,
+            image_public_id TEXT NOT NULL,
+            url TEXT NOT NULL,
+            content_hash TEXT NOT NULL,
+            resolution INT NOT NULL,
+            updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+
+            FOREIGN KEY (image_public_id) REFERENCES images (public_id)
+        )
+        """
+
+        # Which parts of the original video the per person clip sent for annotation is made of
+
+        sql_create_person_clips_table = """
+        CREATE TABLE IF NOT EXISTS person_clips (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            huid TEXT NOT NULL,
+            video_public_id TEXT NOT NULL,
+            clip_public_id TEXT NOT NULL,
+            segments TEXT NOT NULL,
+
+            UNIQUE (video_public_id, huid),
+            FOREIGN KEY (video_public_id) REFERENCES videos (public_id)
+        )
+        """
+
+        # Raw webhook payloads, stored by the API and processed by the worker, the unique key makes retries idempotent
+
+        sql_create_callback_events_table = """
+        CREATE TABLE IF NOT EXISTS callback_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            video_public_id TEXT NOT NULL,
+            huid TEXT NOT NULL DEFAULT '',
+            payload TEXT NOT NULL,
+            payload_hash TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INT NOT NULL DEFAULT 0,
+            error TEXT DEFAULT NULL,
+            created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+
+            UNIQUE (kind, video_public_id, huid, payload_hash)
+        )
+        """
+
         cursor.execute(sql_create_videos_table)
         cursor.execute(sql_create_images_table)
         cursor.execute(sql_create_people_table)
         cursor.execute(sql_sop_defs_table)
+        cursor.execute(sql_create_analysis_jobs_table)
+        cursor.execute(sql_create_callback_events_table)
+        cursor.execute(sql_create_person_clips_table)
+        cursor.execute(sql_create_huid_thumbnails_table)
         cursor.execute(sql_insert_env_1,(jew_sop_checks,))
         conn.commit()
+
+        apply_migrations(conn)
         logger.info("Database tables checked/created successfully.")
         
     except sqlite3.Error as e:
@@ -92,40 +520,65 @@ def setup_sqllite_database():
         if conn:
             conn.close()
 
-def setup_vector_db():
+def open_sqllite_db_connection():
+    """
+    Dedicated connection for a long lived thread (worker, schedulers), the thread owns it until it closes it
+    """
+
+    conn = _connect()
+    conn.row_factory = sqlite3.Row
+    return conn
 
-    try:
-        chroma_client = chromadb.Client()
-        collection_name = "huid_collection"
-        chroma_client.get_or_create_collection(name=collection_name, 
-            configuration={ 
-                "hnsw:space": "cosine",
-            }
-        )
 
-        logger.info(f"Collection '{collection_name}' is ready.")
+class SqliteConnectionPool:
+    """
+    Bounded pool of tuned connections reused across API requests. A connection is checked out by one request
+    at a time, FastAPI may run the dependency and the endpoint on different threadpool threads so the
+    connections are not pinned to the thread that opened them.
+    """
 
-    except Exception as e:
-        logger.error(f"Failed to setup vector db due to error {e}")
+    def __init__(self, max_idle):
+        self.idle: queue.LifoQueue[sqlite3.Connection] = queue.LifoQueue(maxsize=max_idle)
 
+    def acquire(self) -> sqlite3.Connection:
+
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            conn = _connect(check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            return conn
+
+    def release(self, conn: sqlite3.Connection):
+
+        try:
+            # never hand a half done transaction to the next request
+            if conn.in_transaction:
+                conn.rollback()
+
+            self.idle.put_nowait(conn)
+
+        except (sqlite3.Error, queue.Full):
+            with suppress(sqlite3.Error):
+                conn.close()
+
+    def close(self):
+
+        while True:
+            try:
+                conn = self.idle.get_nowait()
+            except queue.Empty:
+                return
+
+            with suppress(sqlite3.Error):
+                conn.close()
+
+
+sqlite_connection_pool = SqliteConnectionPool(app_settings.SQLITE_POOL_SIZE)
 
 def get_sqllite_db_connection():
-    conn = None
+    conn = sqlite_connection_pool.acquire()
     try:
-        conn = sqlite3.connect(f"app.db")
-        conn.row_factory = sqlite3.Row
         yield conn
     finally:
-        if conn:
-            conn.close()
-
-def get_huid_collection():
-    chroma_client = chromadb.PersistentClient(path="chromadb_data")
-
-    collection_name = "huid_collection"
-
-    return chroma_client.get_or_create_collection(name=collection_name, 
-            configuration={
-                "hnsw:space": "cosine",
-            }
-        )
\ No newline at end of file
+        sqlite_connection_pool.release(conn)
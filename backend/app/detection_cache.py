@@ -0,0 +1,202 @@
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+from app.config import app_settings
+from app.utils import select_most_diverse_subset
+
+logger = logging.getLogger(__name__)
+
+DETECTION_DTYPE = np.dtype([
+    ("frame", "<i4"),
+    ("track_id", "<i4"),
+    ("box", "<i2", (4,)),
+    ("conf", "<f4"),
+])
+
+
+class DetectionCacheWriter:
+    """
+    Appends the raw per frame detections and per crop embeddings of a video to flat binary files,
+    which DetectionCache later memory maps
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.count = 0
+        self.embedding_dim = None
+
+        os.makedirs(folder, exist_ok=True)
+
+        self.detections_file = open(f"{folder}/detections.bin", "wb")
+        self.embeddings_file = open(f"{folder}/embeddings.bin", "wb")
+
+    def add_frame(self, frame_idx, track_ids, boxes, confs, embeddings: np.ndarray):
+
+        if len(track_ids) == 0:
+            return
+
+        detections = np.zeros(len(track_ids), dtype=DETECTION_DTYPE)
+        detections["frame"] = frame_idx
+        detections["track_id"] = track_ids
+        detections["box"] = np.clip(boxes, -32768, 32767)
+        detections["conf"] = confs
+
+        embeddings = np.ascontiguousarray(embeddings, dtype="<f4")
+        self.embedding_dim = embeddings.shape[1]
+
+        self.detections_file.write(detections.tobytes())
+        self.embeddings_file.write(embeddings.tobytes())
+        self.count += len(track_ids)
+
+    def close(self):
+
+        self.detections_file.close()
+        self.embeddings_file.close()
+
+        with open(f"{self.folder}/meta.json", "w") as f:
+            json.dump({"count": self.count, "embedding_dim": self.embedding_dim or 0}, f)
+
+
+class DetectionCache:
+    """
+    Read only, memory mapped view of a recorded detection cache
+    """
+
+    def __init__(self, folder):
+
+        if not Path(f"{folder}/meta.json").exists():
+            raise FileNotFoundError(f"No detection cache at {folder}")
+
+        with open(f"{folder}/meta.json") as f:
+            meta = json.load(f)
+
+        self.count = meta["count"]
+
+        if self.count == 0:
+            self.detections = np.zeros(0, dtype=DETECTION_DTYPE)
+            self.embeddings = np.zeros((0, meta["embedding_dim"]), dtype="<f4")
+            return
+
+        self.detections = np.memmap(f"{folder}/detections.bin", dtype=DETECTION_DTYPE, mode="r", shape=(self.count,))
+        self.embeddings = np.memmap(
+            f"{folder}/embeddings.bin", dtype="<f4", mode="r", shape=(self.count, meta["embedding_dim"])
+        )
+
+
+class _InMemoryGallery:
+    """
+    Stand in for the Chroma huid collection during a replay, same cosine distance and the same diverse gallery policy
+    """
+
+    def __init__(self, gallery_size):
+        self.gallery_size = gallery_size
+        self.huid_embeddings: Dict[int, List[np.ndarray]] = dict()
+
+    @staticmethod
+    def _normalize(embedding):
+        return embedding / (np.linalg.norm(embedding) + 1e-8)
+
+    def query(self, embedding):
+        """
+        Returns (huid, cosine distance) of the closest gallery entry, (None, inf) for an empty gallery
+        """
+
+        if len(self.huid_embeddings) == 0:
+            return None, np.inf
+
+        huids = []
+        vectors = []
+        for huid, embeddings in self.huid_embeddings.items():
+            huids.extend([huid] * len(embeddings))
+            vectors.extend(embeddings)
+
+        distances = 1 - np.stack(vectors) @ self._normalize(embedding)
+        best = int(np.argmin(distances))
+
+        return huids[best], float(distances[best])
+
+    def add(self, embedding, huid=None):
+
+        if huid is None:
+            huid = len(self.huid_embeddings)
+
+        self.huid_embeddings.setdefault(huid, []).append(self._normalize(embedding))
+        return huid
+
+    def upsert_if_novel(self, huid, embedding):
+
+        embeddings = self.huid_embeddings[huid]
+
+        if len(embeddings) < self.gallery_size:
+            self.add(embedding, huid)
+            return
+
+        all_embeddings = np.vstack(embeddings + [self._normalize(embedding)])
+        diverse_indices = select_most_diverse_subset(all_embeddings, self.gallery_size)
+
+        self.huid_embeddings[huid] = [all_embeddings[i] for i in sorted(diverse_indices)]
+
+
+def replay_association(
+    cache: DetectionCache,
+    threshold_conf: float | None = None,
+    reid_distance: float | None = None,
+    gallery_every: int | None = None,
+    gallery_size: int | None = None,
+):
+    """
+    Re-run only the track -> huid association of _get_and_insert_huids_from_video on a recorded cache,
+    with the thresholds as parameters. The gallery starts empty and lives in memory, track ids are the ones
+    recorded (the tracker itself is not re-run), so this is meant for comparing settings against each other.
+    Detections below the analysis threshold were recorded untracked (track id -1), each is re-identified on its own.
+    """
+
+    threshold_conf = app_settings.DETECTION_CONF_THRESHOLD if threshold_conf is None else threshold_conf
+    reid_distance = app_settings.REID_DISTANCE_THRESHOLD if reid_distance is None else reid_distance
+    gallery_every = app_settings.GALLERY_UPDATE_EVERY_N_FRAMES if gallery_every is None else gallery_every
+    gallery_size = app_settings.GALLERY_SIZE if gallery_size is None else gallery_size
+
+    gallery = _InMemoryGallery(gallery_size)
+    trackid_to_huid: Dict[int, int] = dict()
+    huid_detections: Dict[int, int] = dict()
+
+    detections = cache.detections
+    kept = np.flatnonzero(detections["conf"] >= threshold_conf)
+
+    for i in kept:
+        trackid = int(detections["track_id"][i])
+        frame_idx = int(detections["frame"][i])
+        embedding = np.asarray(cache.embeddings[i])
+
+        if trackid < 0 or trackid not in trackid_to_huid:
+            huid, distance = gallery.query(embedding)
+
+            if huid is None or distance >= reid_distance:
+                huid = gallery.add(embedding)
+
+            if trackid >= 0:
+                trackid_to_huid[trackid] = huid
+        else:
+            huid = trackid_to_huid[trackid]
+
+        huid_detections[huid] = huid_detections.get(huid, 0) + 1
+
+        if frame_idx % gallery_every == 0:
+            gallery.upsert_if_novel(huid, embedding)
+
+    return {
+        "threshold_conf": threshold_conf,
+        "reid_distance": reid_distance,
+        "gallery_every": gallery_every,
+        "gallery_size": gallery_size,
+        "detections": len(kept),
+        "tracks": len(trackid_to_huid),
+        "huids": len(huid_detections),
+        "detections_per_huid": {str(k): v for k, v in huid_detections.items()},
+        "trackid_to_huid": {str(k): v for k, v in trackid_to_huid.items()},
+    }
@@ -19,6 +19,18 @@ class DBOperationFailed(Exception):
 class GenericFSIOError(Exception):
     """It's a Generic Exception which is raised when any Filesystem IO operation fails"""
 
+class CallbackProcessingFailed(Exception):
+    """It's a Generic Exception which is raised when a stored webhook payload can't be turned into results"""
+    pass
+
+class InvalidSearchImage(Exception):
+    """It's a Generic Exception which is raised when an image given to the person search can't be decoded or cropped"""
+    pass
+
+class VideoTrackingFailed(Exception):
+    """It's a Generic Exception which is raised when detecting, tracking or re-identifying the people of a video fails"""
+    pass
+
 class ErrorCode(Enum):
     # DB Related errors
     DBOperationFailed = 1
@@ -31,4 +43,13 @@ class ErrorCode(Enum):
     UploadFailed = 202
 
     # Download Related errors
-    AssetDownloadFailed = 301
\ No newline at end of file
+    AssetDownloadFailed = 301
+
+    # Callback Related errors
+    CallbackProcessingFailed = 401
+
+    # Search Related errors
+    InvalidSearchImage = 501
+
+    # Analysis Related errors
+    VideoTrackingFailed = 601
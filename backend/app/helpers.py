@@ -1,49 +1,132 @@
 import json
 import logging
 from sqlite3 import Connection
+import sqlite3
 
+from app.config import app_settings
+from app.results_store import store_sop_result_rows
+from app.sop_matcher import match_sop_locally
 from app.utils import get_structured_output
 
 logger = logging.getLogger(__name__)
 
-def verify_sop(video_public_id, huid, db_conn:  Connection):
-
-    # The below design is for hackathon only, but ideally in general we will every day once run all SOP for that store for each person at the end of the day
-
-
-    # fetch env, sop, annotation of huid for video, and ask LLM to verify
+def verify_pending_sops(db_conn: Connection, video_public_id=None):
+    """
+    Verify SOPs in bulk for every annotated person that has no SOP result yet (optionally only for one video).
+    Clear-cut cases are settled by the local matcher, the remaining people sharing an SOP are packed into as few
+    LLM calls as possible and all verdicts are written in a single transaction. A person still without an LLM verdict
+    after SOP_MAX_ATTEMPTS runs gets the local verdicts, undecided steps as not done without a confidence.
+    Returns the number of people whose SOP got verified.
+    """
 
     cursor = db_conn.cursor()
 
-    get_env_id_cmd = """
-    SELECT sop_checks, annotation
-    FROM videos
-    JOIN sopdefs ON videos.env_id = sopdefs.env_id 
-    JOIN people ON people.video_public_id = videos.public_id
-    where public_id = ? and huid = ? 
+    get_pending_cmd = """
+    SELECT people.id, people.huid, people.video_public_id, people.annotation, people.sop_attempts, sopdefs.sop_checks
+    FROM people
+    JOIN videos ON people.video_public_id = videos.public_id
+    JOIN sopdefs ON videos.env_id = sopdefs.env_id
+    WHERE people.annotation IS NOT NULL AND people.sop IS NULL
+    AND (? IS NULL OR people.video_public_id = ?)
+    ORDER BY sopdefs.env_id, people.id
     """
 
-    cursor.execute(get_env_id_cmd,(video_public_id,huid))
+    cursor.execute(get_pending_cmd, (video_public_id, video_public_id))
     results = cursor.fetchall()
 
-    if(len(results) == 0):
-        logger.error(f"Unexpected Failure Failed to get env for video - [{video_public_id}]")
-        return
+    if len(results) == 0:
+        return 0
+
+    updates = []
+    # people who went through another round without a verdict
+    attempt_updates = []
+
+    # group by SOP, only people verified against the same SOP can share a call
+    people_by_sop = dict()
+
+    for r in results:
+        annotation = json.loads(r['annotation'])
+        local_results, ambiguous_steps = match_sop_locally(annotation, r['sop_checks'])
+
+        if len(local_results) > 0 and len(ambiguous_steps) == 0:
+            updates.append((json.dumps([res.model_dump() for res in local_results]), r['id']))
+            continue
+
+        people_by_sop.setdefault(r['sop_checks'], []).append((r['id'], annotation, local_results, ambiguous_steps, r['sop_attempts']))
+
+    logger.info(f"Local SOP matcher settled {len(updates)}/{len(results)} pending people")
+
+    batch_size = max(1, app_settings.SOP_BATCH_MAX_PEOPLE_PER_CALL)
+
+    for sop_checks, people in people_by_sop.items():
+        for i in range(0, len(people), batch_size):
 
-    # verify_sops
-    sop_checks, annotation = results[0]['sop_checks'], json.loads(results[0]['annotation'])
+            batch = {person_id: (local_results, ambiguous_steps) for person_id, _, local_results, ambiguous_steps, _ in people[i:i + batch_size]}
 
-    sop_resp = get_structured_output(annotation,"sop",sop_checks)
+            people_actions = json.dumps([
+                {"person_id": person_id, "actions": annotation}
+                for person_id, annotation, _, _, _ in people[i:i + batch_size]
+            ])
 
-    logger.info(f"SOP Resp - {sop_resp}")
+            sop_resp = get_structured_output(people_actions, "sop_batch", sop_checks)
 
-    if sop_resp is not None and sop_resp != '':
+            if sop_resp is None:
+                logger.error(f"SOP verification failed for people {sorted(batch)}, will be retried on next run")
+                sop_resp = []
+
+            verified = set()
+
+            for person in sop_resp:
+                if person['person_id'] not in batch:
+                    continue
+
+                local_results, ambiguous_steps = batch[person['person_id']]
+                sop_results = person['sop_results']
+
+                # keep the confident local verdicts, take the LLM ones only for the ambiguous steps
+                if len(sop_results) == len(local_results):
+                    sop_results = [
+                        sop_results[k] if k in ambiguous_steps else local_results[k].model_dump()
+                        for k in range(len(local_results))
+                    ]
+
+                updates.append((json.dumps(sop_results), person['person_id']))
+                verified.add(person['person_id'])
+
+            # failed call or left out of the response
+            for person_id, _, local_results, _, sop_attempts in people[i:i + batch_size]:
+                if person_id in verified:
+                    continue
+
+                if sop_attempts + 1 >= app_settings.SOP_MAX_ATTEMPTS:
+                    logger.error(f"No SOP verdict for person [{person_id}] after {sop_attempts + 1} attempts, storing the local verdicts")
+                    updates.append((json.dumps([res.model_dump() for res in local_results]), person_id))
+                else:
+                    attempt_updates.append((person_id,))
+
+    if len(updates) == 0 and len(attempt_updates) == 0:
+        return 0
+
+    try:
+        cursor.executemany("UPDATE people SET sop_attempts = sop_attempts + 1 WHERE id = ?", attempt_updates)
 
         update_sop_cmd = """
         UPDATE people
-        set sop = ?
-        where video_public_id = ? AND huid = ?
-        """ 
-        cursor.execute(update_sop_cmd,(json.dumps(sop_resp),video_public_id,huid))
+        SET sop = ?
+        WHERE id = ?
+        """
+
+        cursor.executemany(update_sop_cmd, updates)
+
+        for sop_json, person_id in updates:
+            store_sop_result_rows(person_id, json.loads(sop_json), cursor)
+
+        db_conn.commit()
+
+    except sqlite3.Error as e:
+        logger.error(f"Failed to store SOP results due to error {e}")
+        db_conn.rollback()
+        return 0
 
-    db_conn.commit()
\ No newline at end of file
+    logger.info(f"SOP verified for {len(updates)}/{len(results)} pending people")
+    return len(updates)
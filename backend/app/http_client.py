@@ -0,0 +1,168 @@
+import asyncio
+import logging
+import random
+import time
+from urllib.parse import urlsplit
+import weakref
+
+import httpx
+
+from app.config import app_settings
+from app.metrics import record_external_call
+from app.rate_limit import AdaptiveRateLimiter
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+# responses telling the limiter the upstream is overloaded, a 501 or 505 is a bad request, not congestion
+THROTTLING_STATUS_CODES = {code for code in RETRYABLE_STATUS_CODES if code == 429 or code >= 500}
+
+
+class AsyncHTTPClient:
+    """
+    Thin wrapper over a pooled httpx.AsyncClient adding per-host connection limits and retries with jittered backoff
+    """
+
+    def __init__(self):
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(
+                app_settings.HTTP_TIMEOUT_SECONDS,
+                connect=app_settings.HTTP_CONNECT_TIMEOUT_SECONDS,
+            ),
+            limits=httpx.Limits(
+                max_connections=app_settings.HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=app_settings.HTTP_MAX_CONNECTIONS,
+                keepalive_expiry=app_settings.HTTP_KEEPALIVE_EXPIRY_SECONDS,
+            ),
+        )
+        self.host_semaphores: dict[str, asyncio.Semaphore] = dict()
+
+    def _get_host_semaphore(self, url):
+
+        host = urlsplit(url).netloc
+
+        if host not in self.host_semaphores:
+            self.host_semaphores[host] = asyncio.Semaphore(app_settings.HTTP_MAX_CONNECTIONS_PER_HOST)
+
+        return self.host_semaphores[host]
+
+    def _get_backoff_delay(self, attempt, response=None):
+
+        # honour the server if it tells us how long to wait
+        if response is not None and "Retry-After" in response.headers:
+            try:
+                return min(float(response.headers["Retry-After"]), app_settings.HTTP_BACKOFF_MAX_SECONDS)
+            except ValueError:
+                pass
+
+        # full jitter, spreads the retries of concurrent callers so they don't hit the upstream in lock step
+        cap = min(app_settings.HTTP_BACKOFF_MAX_SECONDS, app_settings.HTTP_BACKOFF_BASE_SECONDS * (2 ** attempt))
+        return random.uniform(0, cap)
+
+    async def request(self, method, url, limiter: AdaptiveRateLimiter | None = None, priority: int = 0, **kwargs) -> httpx.Response:
+        """
+        Send a request, retrying transport errors and retryable status codes, raises httpx.HTTPError once retries are exhausted.
+        With a limiter every attempt waits for its turn, and requests throttled with 429 are requeued at the same priority
+        (up to RATE_LIMIT_MAX_REQUEUES times) instead of consuming the retry budget.
+        """
+
+        service = limiter.name if limiter is not None else urlsplit(url).netloc
+        start = time.perf_counter()
+
+        try:
+            response = await self._request(method, url, limiter, priority, **kwargs)
+        except httpx.HTTPStatusError as e:
+            record_external_call(service, time.perf_counter() - start, error=str(e.response.status_code))
+            raise
+        except httpx.HTTPError as e:
+            record_external_call(service, time.perf_counter() - start, error=type(e).__name__)
+            raise
+
+        error = str(response.status_code) if response.status_code >= 400 else None
+        record_external_call(service, time.perf_counter() - start, error=error)
+
+        return response
+
+    async def _request(self, method, url, limiter: AdaptiveRateLimiter | None, priority: int, **kwargs) -> httpx.Response:
+
+        max_retries = app_settings.HTTP_MAX_RETRIES
+        attempt = 0
+        requeues = 0
+
+        while True:
+
+            response = None
+            throttled = False
+
+            if limiter is not None:
+                await limiter.acquire_async(priority)
+
+            try:
+                async with self._get_host_semaphore(url):
+                    response = await self.client.request(method, url, **kwargs)
+
+                throttled = response.status_code in THROTTLING_STATUS_CODES
+
+            except httpx.TransportError as e:
+                # timeouts and refused / reset connections are congestion as well
+                throttled = True
+
+                if attempt == max_retries:
+                    raise
+
+                logger.warning(f"{method} {url} failed with error {e}, retrying (attempt {attempt + 1}/{max_retries})")
+
+            finally:
+                if limiter is not None:
+                    limiter.release(throttled)
+
+            if response is not None and response.status_code not in RETRYABLE_STATUS_CODES:
+                return response
+
+            if response is not None and response.status_code == 429 and requeues < app_settings.RATE_LIMIT_MAX_REQUEUES:
+                requeues += 1
+                logger.warning(f"{method} {url} throttled, requeued ({requeues}/{app_settings.RATE_LIMIT_MAX_REQUEUES})")
+
+                await asyncio.sleep(self._get_backoff_delay(min(requeues, max_retries), response))
+                continue
+
+            if response is not None:
+                if attempt == max_retries:
+                    response.raise_for_status()
+
+                logger.warning(f"{method} {url} returned {response.status_code}, retrying (attempt {attempt + 1}/{max_retries})")
+
+            await asyncio.sleep(self._get_backoff_delay(attempt, response))
+            attempt += 1
+
+    async def post(self, url, **kwargs) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+# httpx connections are bound to the event loop that opened them, so keep one pooled client per loop
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncHTTPClient]" = weakref.WeakKeyDictionary()
+
+
+def get_async_http_client() -> AsyncHTTPClient:
+    """
+    Shared client of the running event loop, must be called from within a coroutine
+    """
+
+    loop = asyncio.get_running_loop()
+
+    if loop not in _clients:
+        _clients[loop] = AsyncHTTPClient()
+
+    return _clients[loop]
+
+
+async def close_async_http_client():
+
+    client = _clients.pop(asyncio.get_running_loop(), None)
+
+    if client is not None:
+        await client.aclose()
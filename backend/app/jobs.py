@@ -0,0 +1,178 @@
+from contextlib import contextmanager
+import json
+import logging
+from sqlite3 import Connection
+import sqlite3
+import threading
+
+from app.config import app_settings
+from app.db import sqlite_connection_pool
+from app.exceptions import DBOperationFailed
+from app.metrics import QUEUE_DEPTH, registry
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_analysis_job(video_public_id, db_conn: Connection, commit=True, profile=False):
+    """
+    Queue a video for analysis, the analysis worker picks it up from the analysis_jobs table.
+    With profile the worker profiles the job (app/profiling.py)
+    """
+
+    try:
+        cursor = db_conn.cursor()
+
+        sql_cmd = """
+        INSERT INTO analysis_jobs (video_public_id, profile)
+        VALUES (?,?)
+        """
+
+        cursor.execute(sql_cmd, (video_public_id, int(profile)))
+
+        job_id = cursor.lastrowid
+
+        progress_cmd = """
+        INSERT INTO analysis_progress (video_public_id, stage)
+        VALUES (?, 'queued')
+        ON CONFLICT (video_public_id) DO UPDATE SET
+            stage = 'queued', frames_processed = 0, total_frames = 0, frames_per_second = NULL, people_found = 0,
+            external_pending = 0, external_requested = 0, external_failed = 0, error = NULL,
+            updated_at = CURRENT_TIMESTAMP, version = version + 1
+        """
+
+        cursor.execute(progress_cmd, (video_public_id,))
+
+        if commit:
+            db_conn.commit()
+
+        logger.info(f"Queued analysis job [{job_id}] for video [{video_public_id}]")
+        return job_id
+
+    except sqlite3.Error as e:
+        logger.error(f"Failed to queue analysis job for video [{video_public_id}] due to error {e}")
+
+        if db_conn:
+            db_conn.rollback()
+
+        raise DBOperationFailed()
+
+
+def claim_next_analysis_job(db_conn: Connection):
+    """
+    Atomically move the oldest pending job to running and return it, None if the queue is empty.
+    A running job whose lease expired (its worker died) is claimed again, or failed once it used up its attempts.
+    """
+
+    lease = f"-{int(app_settings.ANALYSIS_JOB_LEASE_SECONDS)} seconds"
+
+    expire_cmd = """
+    UPDATE analysis_jobs
+    SET status = 'failed', error = 'Lease expired, worker lost on every attempt', updated_at = CURRENT_TIMESTAMP
+    WHERE status = 'running' AND COALESCE(claimed_at, updated_at) <= datetime('now', ?) AND attempts >= ?
+    """
+
+    sql_cmd = """
+    UPDATE analysis_jobs
+    SET status = 'running', attempts = attempts + 1, claimed_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+    WHERE id = (
+        SELECT id FROM analysis_jobs
+        WHERE status = 'pending' OR (status = 'running' AND COALESCE(claimed_at, updated_at) <= datetime('now', ?))
+        ORDER BY id
+        LIMIT 1
+    )
+    RETURNING id, video_public_id, profile, attempts
+    """
+
+    cursor = db_conn.cursor()
+    cursor.execute(expire_cmd, (lease, app_settings.ANALYSIS_JOB_MAX_ATTEMPTS))
+
+    if cursor.rowcount > 0:
+        logger.error(f"Failed {cursor.rowcount} analysis job(s) whose lease expired {app_settings.ANALYSIS_JOB_MAX_ATTEMPTS} times")
+
+    cursor.execute(sql_cmd, (lease,))
+    job = cursor.fetchone()
+    db_conn.commit()
+
+    if job is not None and job["attempts"] > 1:
+        logger.warning(f"Reclaimed analysis job [{job['id']}] for video [{job['video_public_id']}], attempt {job['attempts']}")
+
+    return job
+
+
+@contextmanager
+def analysis_job_lease(job_id):
+    """
+    Keep renewing the lease of a running job while the block runs, so only a dead worker ever lets it expire
+    """
+
+    stop_event = threading.Event()
+
+    def renew():
+
+        db_conn = sqlite_connection_pool.acquire()
+
+        try:
+            while not stop_event.wait(app_settings.ANALYSIS_JOB_LEASE_SECONDS / 3):
+                try:
+                    db_conn.execute("UPDATE analysis_jobs SET claimed_at = CURRENT_TIMESTAMP WHERE id = ? AND status = 'running'", (job_id,))
+                    db_conn.commit()
+                except sqlite3.Error as e:
+                    logger.warning(f"Failed to renew the lease of analysis job [{job_id}] due to error {e}")
+                    db_conn.rollback()
+        finally:
+            sqlite_connection_pool.release(db_conn)
+
+    thread = threading.Thread(target=renew, name=f"job-lease-{job_id}", daemon=True)
+    thread.start()
+
+    try:
+        yield
+    finally:
+        stop_event.set()
+        thread.join()
+
+
+def finish_analysis_job(job_id, db_conn: Connection, error=None, metrics=None):
+    """
+    metrics is the per stage summary of the job (app.metrics.JobStats.summary), stored as JSON
+    """
+
+    sql_cmd = """
+    UPDATE analysis_jobs
+    SET status = ?, error = ?, metrics = ?, updated_at = CURRENT_TIMESTAMP
+    WHERE id = ?
+    """
+
+    status = "failed" if error is not None else "done"
+
+    cursor = db_conn.cursor()
+    cursor.execute(sql_cmd, (status, error, None if metrics is None else json.dumps(metrics), job_id))
+    db_conn.commit()
+
+
+def _collect_queue_depths():
+    """
+    Scrape time gauge of the pending / running items of the SQLite queues
+    """
+
+    db_conn = sqlite_connection_pool.acquire()
+
+    try:
+        for queue in ("analysis_jobs", "callback_events"):
+
+            depths = {"pending": 0, "running": 0}
+
+            rows = db_conn.execute(
+                f"SELECT status, COUNT(*) FROM {queue} WHERE status IN ('pending', 'running') GROUP BY status"
+            ).fetchall()
+
+            for status, depth in rows:
+                depths[status] = depth
+
+            for status, depth in depths.items():
+                QUEUE_DEPTH.set(depth, queue=queue, status=status)
+    finally:
+        sqlite_connection_pool.release(db_conn)
+
+
+registry.add_collector(_collect_queue_depths)
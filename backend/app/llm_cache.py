@@ -0,0 +1,192 @@
+from collections import OrderedDict
+import copy
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+from app.config import app_settings
+
+logger = logging.getLogger(__name__)
+
+# once the persistent tier outgrows max_entries it is trimmed to this fraction of it, so eviction runs once per
+# many writes instead of on every one
+EVICT_TO_FRACTION = 0.9
+
+
+class LLMResponseCache:
+    """
+    Two tier (in memory LRU + SQLite file) cache of structured LLM outputs keyed by a content hash.
+    The SQLite tier lives in its own file so it survives the app.db reset on startup and is shared by all processes.
+    """
+
+    def __init__(self, db_path, max_entries, memory_entries, ttl_seconds):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self.ttl_seconds = ttl_seconds
+
+        self.memory: OrderedDict[str, tuple[float, object]] = OrderedDict()
+        self.lock = threading.Lock()
+        self.conn = None
+
+        # rows of the persistent tier, counted when it is opened, replaced keys are counted again (evicts a bit early)
+        self.entries = 0
+
+        # recency updates for the persistent tier are batched, a hit must not pay for a commit
+        self.pending_touches: dict[str, float] = dict()
+
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def build_key(prompt_type, template_version, response_text, sop_events=None):
+
+        content = json.dumps(
+            [prompt_type, template_version, response_text, sop_events],
+            sort_keys=True,
+            default=str,
+        )
+
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def _get_conn(self):
+
+        if self.conn is None:
+            self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """)
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_access ON llm_cache (last_access)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_created_at ON llm_cache (created_at)")
+            self.conn.commit()
+
+            self.entries = self.conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+
+        return self.conn
+
+    def _remember(self, key, created_at, value):
+
+        self.memory[key] = (created_at, value)
+        self.memory.move_to_end(key)
+
+        while len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
+
+    def _flush_touches(self):
+
+        self._get_conn().executemany(
+            "UPDATE llm_cache SET last_access = ? WHERE key = ?",
+            [(ts, key) for key, ts in self.pending_touches.items()],
+        )
+        self.pending_touches.clear()
+
+    def _evict(self, now):
+        """
+        Drop the expired entries, then the least recently used ones down to EVICT_TO_FRACTION of max_entries,
+        both walk an index instead of the table
+        """
+
+        conn = self._get_conn()
+        conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+
+        entries = conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        excess = entries - int(self.max_entries * EVICT_TO_FRACTION)
+
+        if excess > 0:
+            conn.execute("""
+            DELETE FROM llm_cache WHERE key IN (
+                SELECT key FROM llm_cache ORDER BY last_access LIMIT ?
+            )
+            """, (excess,))
+            entries -= excess
+
+        self.entries = entries
+
+    def get(self, key):
+        """
+        Cached value for key or None, expired entries count as misses
+        """
+
+        now = time.time()
+
+        with self.lock:
+            try:
+                entry = self.memory.get(key)
+
+                if entry is None:
+                    row = self._get_conn().execute(
+                        "SELECT created_at, value FROM llm_cache WHERE key = ?", (key,)
+                    ).fetchone()
+
+                    if row is not None:
+                        entry = (row[0], json.loads(row[1]))
+
+                if entry is None or now - entry[0] > self.ttl_seconds:
+                    self.memory.pop(key, None)
+                    self.misses += 1
+                    return None
+
+                self._remember(key, entry[0], entry[1])
+
+                self.pending_touches[key] = now
+
+                if len(self.pending_touches) >= 256:
+                    self._flush_touches()
+                    self._get_conn().commit()
+
+                self.hits += 1
+                # callers own what they get, mutating it must not change the cached entry
+                return copy.deepcopy(entry[1])
+
+            except sqlite3.Error as e:
+                logger.error(f"LLM cache lookup failed due to error {e}")
+                self.misses += 1
+                return None
+
+    def set(self, key, value):
+
+        now = time.time()
+
+        with self.lock:
+            self._remember(key, now, copy.deepcopy(value))
+
+            try:
+                conn = self._get_conn()
+                self._flush_touches()
+
+                conn.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, value, created_at, last_access) VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(value), now, now),
+                )
+                self.entries += 1
+
+                if self.entries > self.max_entries:
+                    self._evict(now)
+
+                conn.commit()
+
+            except sqlite3.Error as e:
+                logger.error(f"LLM cache write failed due to error {e}")
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "memory_entries": len(self.memory),
+        }
+
+
+llm_response_cache = LLMResponseCache(
+    db_path=app_settings.LLM_CACHE_PATH,
+    max_entries=app_settings.LLM_CACHE_MAX_ENTRIES,
+    memory_entries=app_settings.LLM_CACHE_MEMORY_ENTRIES,
+    ttl_seconds=app_settings.LLM_CACHE_TTL_SECONDS,
+)
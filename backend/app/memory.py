@@ -0,0 +1,124 @@
+import gc
+import logging
+import os
+import resource
+import sys
+
+from app.config import app_settings
+from app.metrics import FRAME_STRIDE, JOB_RSS_BYTES, current_job_stats
+
+logger = logging.getLogger(__name__)
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+_MIB = 1024 * 1024
+
+
+def current_rss_bytes():
+    """
+    Resident set size right now (Linux), None where /proc is not available
+    """
+
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def peak_rss_bytes():
+
+    # ru_maxrss is in KiB on Linux, in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def release_cached_memory():
+    """
+    Hand back what the process can give up cheaply, the CUDA caching allocator only when the worker loaded torch
+    """
+
+    gc.collect()
+
+    torch = sys.modules.get("torch")
+    if torch is not None and torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+
+class AnalysisMemoryGuard:
+    """
+    Memory budget of the tracking of one video, ANALYSIS_MEMORY_BUDGET_MB on top of the RSS the job started with
+    (models and gallery are already loaded by then). Past ANALYSIS_MEMORY_DEGRADE_RATIO of the budget the frame
+    stride doubles (up to ANALYSIS_MAX_FRAME_STRIDE) so tracking state and detections grow slower, it halves again
+    once usage is back under ANALYSIS_MEMORY_RECOVER_RATIO. Without a budget it only tracks the peak for the report.
+    """
+
+    def __init__(self, video_public_id):
+        self.video_public_id = video_public_id
+
+        budget_mb = app_settings.ANALYSIS_MEMORY_BUDGET_MB
+        self.budget_bytes = budget_mb * _MIB if budget_mb > 0 else None
+
+        self.rss_start = current_rss_bytes()
+        self.rss_peak = self.rss_start
+        self.stride = 1
+        self.max_stride_used = 1
+
+    def usage(self, rss):
+        """
+        Fraction of the budget in use, 0 without a budget or RSS
+        """
+
+        if self.budget_bytes is None or rss is None or self.rss_start is None:
+            return 0.0
+
+        return max(0, rss - self.rss_start) / self.budget_bytes
+
+    def check(self):
+        """
+        Sample the RSS and adapt the frame stride, returns True while under memory pressure
+        """
+
+        rss = current_rss_bytes()
+
+        if rss is None:
+            return False
+
+        self.rss_peak = max(self.rss_peak or 0, rss)
+        JOB_RSS_BYTES.set(rss)
+
+        usage = self.usage(rss)
+        pressure = usage >= app_settings.ANALYSIS_MEMORY_DEGRADE_RATIO
+
+        if pressure and self.stride < app_settings.ANALYSIS_MAX_FRAME_STRIDE:
+            self.stride = min(self.stride * 2, app_settings.ANALYSIS_MAX_FRAME_STRIDE)
+            self.max_stride_used = max(self.max_stride_used, self.stride)
+
+            logger.warning(f"Analysis of video [{self.video_public_id}] at {usage:.0%} of its memory budget, frame stride raised to {self.stride}")
+            release_cached_memory()
+
+        elif usage < app_settings.ANALYSIS_MEMORY_RECOVER_RATIO and self.stride > 1:
+            self.stride //= 2
+            logger.info(f"Analysis of video [{self.video_public_id}] back at {usage:.0%} of its memory budget, frame stride lowered to {self.stride}")
+
+        FRAME_STRIDE.set(self.stride)
+        return pressure
+
+    def report(self, **extra):
+        """
+        Memory summary of the job, also recorded with the job's metrics (analysis_jobs.metrics)
+        """
+
+        report = {
+            "budget_bytes": self.budget_bytes,
+            "rss_start_bytes": self.rss_start,
+            "rss_peak_bytes": self.rss_peak,
+            "rss_growth_bytes": None if self.rss_start is None else (self.rss_peak or 0) - self.rss_start,
+            "max_frame_stride": self.max_stride_used,
+            **extra,
+        }
+
+        stats = current_job_stats.get()
+        if stats is not None:
+            stats.set_section("memory", report)
+
+        return report
@@ -0,0 +1,338 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import logging
+import math
+import threading
+import time
+from typing import Callable, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Minimal Prometheus text format (0.0.4) instrumentation, a lock and a dict update per observation.
+# Every process keeps its own registry, the API serves it at /metrics and the worker through start_metrics_server.
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _format_labels(label_names, label_values, extra=()):
+
+    pairs = list(zip(label_names, label_values)) + list(extra)
+
+    if len(pairs) == 0:
+        return ""
+
+    escaped = (str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, v in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+
+    return repr(float(value))
+
+
+class _Metric:
+
+    type_name = ""
+
+    def __init__(self, name, documentation, label_names: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.values: Dict[tuple, object] = dict()
+        self.lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def render(self) -> List[str]:
+
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+
+        # snapshot under the lock, observations mutate the histogram state in place
+        with self.lock:
+            items = [(key, self._copy_value(value)) for key, value in self.values.items()]
+
+        for key, value in items:
+            lines.extend(self._render_value(key, value))
+
+        return lines
+
+    def _copy_value(self, value):
+        return value
+
+    def _render_value(self, key, value) -> List[str]:
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+
+    type_name = "counter"
+
+    def inc(self, amount=1.0, **labels):
+
+        key = self._key(labels)
+
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+
+class Gauge(_Metric):
+
+    type_name = "gauge"
+
+    def set(self, value, **labels):
+
+        with self.lock:
+            self.values[self._key(labels)] = float(value)
+
+
+class Histogram(_Metric):
+
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, label_names: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+
+        with self.lock:
+            state = self.values.get(key)
+
+            if state is None:
+                # per bucket (non cumulative) counts, +Inf last, then sum and count
+                state = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def _copy_value(self, value):
+
+        counts, total, count = value
+        return [list(counts), total, count]
+
+    def _render_value(self, key, value) -> List[str]:
+
+        counts, total, count = value
+        lines = []
+        cumulative = 0
+
+        for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+            cumulative += bucket_count
+            labels = _format_labels(self.label_names, key, [("le", _format_value(bound))])
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+
+        labels = _format_labels(self.label_names, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {count}")
+
+        return lines
+
+
+class MetricsRegistry:
+
+    def __init__(self):
+        self.metrics: List[_Metric] = []
+        self.collectors: List[Callable[[], None]] = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], None]):
+        """
+        collector runs right before every scrape, for gauges that are cheaper to read on demand (queue depths)
+        """
+        self.collectors.append(collector)
+
+    def render(self) -> str:
+
+        for collector in self.collectors:
+            try:
+                collector()
+            except Exception as e:
+                logger.warning(f"Metrics collector failed due to error {e}")
+
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+STAGE_SECONDS = registry.register(Histogram(
+    "sentinel_stage_seconds", "Time spent per pipeline stage and call", ("stage",),
+))
+FRAMES_TOTAL = registry.register(Counter("sentinel_frames_total", "Video frames run through detection and tracking"))
+CROPS_TOTAL = registry.register(Counter("sentinel_crops_total", "Person crops above the confidence threshold"))
+EXTERNAL_REQUEST_SECONDS = registry.register(Histogram(
+    "sentinel_external_request_seconds", "Latency of calls to external services, retries included", ("service", "outcome"),
+))
+EXTERNAL_REQUEST_ERRORS = registry.register(Counter(
+    "sentinel_external_request_errors_total", "Failed calls to external services", ("service", "reason"),
+))
+CALLBACK_EVENTS_TOTAL = registry.register(Counter(
+    "sentinel_callback_events_total", "Processed callback events", ("kind", "status"),
+))
+ANALYSIS_JOB_SECONDS = registry.register(Histogram(
+    "sentinel_analysis_job_seconds", "Wall time of analysis jobs", ("status",),
+    buckets=(10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1200.0, 1800.0, 3600.0, 7200.0),
+))
+QUEUE_DEPTH = registry.register(Gauge("sentinel_queue_depth", "Items waiting in the SQLite queues", ("queue", "status")))
+FRAMES_SKIPPED_TOTAL = registry.register(Counter("sentinel_frames_skipped_total", "Video frames skipped by the memory guard"))
+TRACKS_PRUNED_TOTAL = registry.register(Counter("sentinel_tracks_pruned_total", "Idle tracks dropped from the tracking state"))
+JOB_RSS_BYTES = registry.register(Gauge("sentinel_job_rss_bytes", "Resident memory of the worker during tracking"))
+FRAME_STRIDE = registry.register(Gauge("sentinel_frame_stride", "Current frame stride of the tracking, above 1 under memory pressure"))
+
+
+class JobStats:
+    """
+    Totals of one analysis job (seconds and calls per stage, counters), stored with the job once it finishes
+    """
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.stages: Dict[str, List[float]] = dict()
+        self.counters: Dict[str, float] = dict()
+        self.sections: Dict[str, dict] = dict()
+        self.lock = threading.Lock()
+
+    def record(self, stage, seconds):
+
+        with self.lock:
+            totals = self.stages.setdefault(stage, [0, 0.0])
+            totals[0] += 1
+            totals[1] += seconds
+
+    def inc(self, name, amount=1):
+
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def set_section(self, name, values: dict):
+        """
+        Attach a free form block to the summary, e.g. the memory report of the job
+        """
+
+        with self.lock:
+            self.sections[name] = dict(values)
+
+    def summary(self):
+
+        wall_seconds = time.perf_counter() - self.started_at
+
+        with self.lock:
+            stages = {
+                stage: {"calls": int(calls), "total_seconds": round(total, 4), "mean_ms": round(1000 * total / calls, 3)}
+                for stage, (calls, total) in sorted(self.stages.items(), key=lambda item: -item[1][1])
+            }
+            counters = dict(self.counters)
+            sections = {name: dict(values) for name, values in self.sections.items()}
+
+        tracking_seconds = sum(
+            stages.get(stage, {}).get("total_seconds", 0.0) for stage in ("decode", "yolo", "tracker", "osnet", "chroma_query", "chroma_insert", "chroma_upsert", "crop_write")
+        )
+
+        return {
+            "wall_seconds": round(wall_seconds, 3),
+            "frames_per_second": round(counters.get("frames", 0) / tracking_seconds, 2) if tracking_seconds > 0 else None,
+            "counters": counters,
+            "stages": stages,
+            **sections,
+        }
+
+
+# set by the worker around a job, asyncio tasks and asyncio.to_thread inherit it so every stage lands in the job
+current_job_stats: ContextVar[JobStats | None] = ContextVar("current_job_stats", default=None)
+
+
+def record_stage(stage, seconds):
+
+    STAGE_SECONDS.observe(seconds, stage=stage)
+
+    stats = current_job_stats.get()
+    if stats is not None:
+        stats.record(stage, seconds)
+
+
+@contextmanager
+def timed_stage(stage):
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start)
+
+
+def record_external_call(service, seconds, error=None):
+    """
+    Latency of a call to an external service (memories.ai, gemini, cloudinary), error is a short reason if it failed
+    """
+
+    EXTERNAL_REQUEST_SECONDS.observe(seconds, service=service, outcome="ok" if error is None else "error")
+
+    if error is not None:
+        EXTERNAL_REQUEST_ERRORS.inc(service=service, reason=error)
+
+    stats = current_job_stats.get()
+    if stats is not None:
+        stats.record(service, seconds)
+
+        if error is not None:
+            stats.inc(f"{service}_errors")
+
+
+def count(counter: Counter, name, amount=1):
+    """
+    Increment a label-less counter and the matching counter of the current job
+    """
+
+    counter.inc(amount)
+
+    stats = current_job_stats.get()
+    if stats is not None:
+        stats.inc(name, amount)
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+
+        body = registry.render().encode("utf-8")
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port):
+    """
+    Serve /metrics from a daemon thread, for processes without an API (the standalone worker)
+    """
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsRequestHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+
+    logger.info(f"Serving metrics on port {port}")
+    return server
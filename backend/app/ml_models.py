@@ -0,0 +1,12 @@
+import torchreid
+
+from app.vector_db import get_huid_collection
+
+# Heavy model handles live here so that only the analysis worker pays for them, the API process never imports this module
+
+osnet_feature_extractor = torchreid.utils.FeatureExtractor(
+    model_name="osnet_ain_x1_0",
+    device="cuda",
+)
+
+huid_collection = get_huid_collection()
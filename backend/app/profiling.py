@@ -0,0 +1,174 @@
+from collections import Counter
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+from app.config import app_settings
+from app.memory import current_rss_bytes, peak_rss_bytes
+from app.utils import build_local_uri_for_profile
+
+logger = logging.getLogger(__name__)
+
+PROFILE_SUMMARY_FILE = "summary.json"
+PROFILE_STACKS_FILE = "stacks.txt"
+
+# thread name prefix of the default executor of the worker's event loop (app/worker.py), where to_thread runs the tracking
+JOB_EXECUTOR_THREAD_PREFIX = "analysis-job"
+
+
+def _format_frame(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class JobProfiler:
+    """
+    Sampling profiler of one analysis job. A daemon thread snapshots the stacks of the job's threads (the thread
+    that started it and the worker loop's executor threads running the tracking) every PROFILE_SAMPLE_INTERVAL_SECONDS,
+    cProfile would only see the thread it was enabled in. Also tracks the RSS and, when torch is loaded, the CUDA
+    memory of the job. Artifacts go to build_local_uri_for_profile(video_public_id):
+    stacks.txt in collapsed stack format (flamegraph.pl, speedscope) and summary.json.
+    """
+
+    def __init__(self, video_public_id, job_id=None):
+        self.video_public_id = video_public_id
+        self.job_id = job_id
+        self.interval = app_settings.PROFILE_SAMPLE_INTERVAL_SECONDS
+
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.rss_start = None
+        self.rss_peak = None
+
+        self.owner_thread_id = None
+        self.started_at = None
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def _is_job_thread(self, thread_id, names):
+        # not every asyncio* thread, in the all-in-one app those include the API's
+        return thread_id == self.owner_thread_id or names.get(thread_id, "").startswith(JOB_EXECUTOR_THREAD_PREFIX)
+
+    def _sample(self):
+
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+
+        for thread_id, frame in sys._current_frames().items():
+
+            if not self._is_job_thread(thread_id, names):
+                continue
+
+            stack = []
+            while frame is not None:
+                stack.append(_format_frame(frame))
+                frame = frame.f_back
+
+            stack.append(names.get(thread_id, str(thread_id)))
+            self.stacks[";".join(reversed(stack))] += 1
+
+        self.samples += 1
+
+        rss = current_rss_bytes()
+        if rss is not None:
+            self.rss_peak = rss if self.rss_peak is None else max(self.rss_peak, rss)
+
+    def _run(self):
+
+        while not self.stop_event.wait(self.interval):
+            try:
+                self._sample()
+            except Exception as e:
+                # never take the job down with the profiler
+                logger.warning(f"Profiler sample of video [{self.video_public_id}] failed due to error {e}")
+
+    def _get_torch(self):
+        # only when the worker already loaded it, profiling must not pull torch into the process
+        torch = sys.modules.get("torch")
+        return torch if torch is not None and torch.cuda.is_available() else None
+
+    def start(self):
+
+        self.owner_thread_id = threading.get_ident()
+        self.started_at = time.perf_counter()
+        self.rss_start = current_rss_bytes()
+
+        torch = self._get_torch()
+        if torch is not None:
+            torch.cuda.reset_peak_memory_stats()
+
+        self.thread = threading.Thread(target=self._run, name=f"profiler-{self.video_public_id}", daemon=True)
+        self.thread.start()
+
+        logger.info(f"Profiling analysis of video [{self.video_public_id}] every {self.interval}s")
+
+    def _top(self, by_self, limit=30):
+
+        counts: Counter = Counter()
+
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")[1:]
+
+            if len(frames) == 0:
+                continue
+
+            if by_self:
+                counts[frames[-1]] += count
+            else:
+                # recursion must not count a frame twice
+                for name in set(frames):
+                    counts[name] += count
+
+        total = max(1, sum(self.stacks.values()))
+        return [{"function": name, "samples": count, "percent": round(100 * count / total, 2)} for name, count in counts.most_common(limit)]
+
+    def stop(self):
+        """
+        Stop sampling and write the artifacts, returns the summary
+        """
+
+        self.stop_event.set()
+        self.thread.join(timeout=5)
+
+        summary = {
+            "video_public_id": self.video_public_id,
+            "job_id": self.job_id,
+            "wall_seconds": round(time.perf_counter() - self.started_at, 3),
+            "sample_interval_seconds": self.interval,
+            "samples": self.samples,
+            "memory": {
+                "rss_start_bytes": self.rss_start,
+                "rss_peak_bytes": self.rss_peak,
+                "rss_end_bytes": current_rss_bytes(),
+                # since process start, not only this job
+                "process_peak_rss_bytes": peak_rss_bytes(),
+            },
+            "top_self": self._top(by_self=True),
+            "top_total": self._top(by_self=False),
+        }
+
+        torch = self._get_torch()
+        if torch is not None:
+            summary["memory"]["cuda_peak_allocated_bytes"] = torch.cuda.max_memory_allocated()
+            summary["memory"]["cuda_peak_reserved_bytes"] = torch.cuda.max_memory_reserved()
+
+        folder = build_local_uri_for_profile(self.video_public_id)
+
+        try:
+            os.makedirs(folder, exist_ok=True)
+
+            with open(f"{folder}/{PROFILE_STACKS_FILE}", "w") as f:
+                for stack, count in self.stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+
+            with open(f"{folder}/{PROFILE_SUMMARY_FILE}", "w") as f:
+                json.dump(summary, f, indent=2)
+
+            logger.info(f"Stored profile of video [{self.video_public_id}] ({self.samples} samples) at {folder}")
+
+        except OSError as e:
+            logger.error(f"Failed to store profile of video [{self.video_public_id}] due to error {e}")
+
+        return summary
@@ -0,0 +1,129 @@
+import logging
+import sqlite3
+import threading
+import time
+
+from app.config import app_settings
+from app.constants import AnalysisStage
+from app.db import sqlite_connection_pool
+
+logger = logging.getLogger(__name__)
+
+
+class AnalysisProgressReporter:
+    """
+    Progress of the analysis of one video, written to the analysis_progress table so any API process can stream it.
+    Counters are updated in memory on every call, the row is written at most every PROGRESS_FLUSH_INTERVAL_SECONDS
+    and on every stage change. Safe to use from the event loop and from executor threads.
+    """
+
+    def __init__(self, video_public_id):
+        self.video_public_id = video_public_id
+
+        self.stage = AnalysisStage.Queued
+        self.stage_started_at = time.monotonic()
+        self.frames_processed = 0
+        self.total_frames = 0
+        self.people_found = 0
+        self.external_pending = 0
+        self.external_requested = 0
+        self.external_failed = 0
+        self.error = None
+
+        self.last_flush = 0.0
+        self.lock = threading.Lock()
+        self.conn = sqlite_connection_pool.acquire()
+
+    def _flush(self, force=False):
+
+        now = time.monotonic()
+
+        if not force and now - self.last_flush < app_settings.PROGRESS_FLUSH_INTERVAL_SECONDS:
+            return
+
+        self.last_flush = now
+
+        elapsed = now - self.stage_started_at
+        frames_per_second = self.frames_processed / elapsed if self.stage == AnalysisStage.Tracking and elapsed > 0 else None
+
+        sql_cmd = """
+        INSERT INTO analysis_progress
+            (video_public_id, stage, frames_processed, total_frames, frames_per_second, people_found,
+             external_pending, external_requested, external_failed, error, updated_at)
+        VALUES (?,?,?,?,?,?,?,?,?,?,CURRENT_TIMESTAMP)
+        ON CONFLICT (video_public_id) DO UPDATE SET
+            stage = excluded.stage,
+            frames_processed = excluded.frames_processed,
+            total_frames = excluded.total_frames,
+            frames_per_second = excluded.frames_per_second,
+            people_found = excluded.people_found,
+            external_pending = excluded.external_pending,
+            external_requested = excluded.external_requested,
+            external_failed = excluded.external_failed,
+            error = excluded.error,
+            updated_at = CURRENT_TIMESTAMP,
+            version = version + 1
+        """
+
+        try:
+            self.conn.execute(sql_cmd, (
+                self.video_public_id,
+                self.stage,
+                self.frames_processed,
+                self.total_frames,
+                None if frames_per_second is None else round(frames_per_second, 2),
+                self.people_found,
+                self.external_pending,
+                self.external_requested,
+                self.external_failed,
+                self.error,
+            ))
+            self.conn.commit()
+
+        except sqlite3.Error as e:
+            # progress is best effort, never fail the analysis because of it
+            logger.warning(f"Failed to store analysis progress of video [{self.video_public_id}] due to error {e}")
+            self.conn.rollback()
+
+    def set_stage(self, stage, error=None):
+
+        with self.lock:
+            self.stage = stage
+            self.stage_started_at = time.monotonic()
+            self.error = error
+            self._flush(force=True)
+
+    def frame_processed(self, frames_processed, total_frames, people_found):
+
+        with self.lock:
+            self.frames_processed = frames_processed
+            self.total_frames = total_frames
+            self.people_found = people_found
+            self._flush()
+
+    def external_call_started(self):
+
+        with self.lock:
+            self.external_pending += 1
+            self._flush()
+
+    def external_call_finished(self, accepted):
+        """
+        accepted means memories.ai took the request, its result arrives later through a callback
+        """
+
+        with self.lock:
+            self.external_pending -= 1
+
+            if accepted:
+                self.external_requested += 1
+            else:
+                self.external_failed += 1
+
+            self._flush()
+
+    def close(self):
+
+        with self.lock:
+            self._flush(force=True)
+            sqlite_connection_pool.release(self.conn)
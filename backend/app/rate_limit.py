@@ -0,0 +1,194 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+from app.config import app_settings
+
+logger = logging.getLogger(__name__)
+
+
+class AdaptiveRateLimiter:
+    """
+    Per upstream limiter combining a token bucket (request rate / quota), an AIMD concurrency window
+    (halved on throttling, grown by ~1 per window of successes) and a priority queue of waiters
+    (lower value goes first, FIFO within a priority). Thread safe, coroutines use acquire_async.
+    """
+
+    def __init__(self, name, rate_per_second, burst, max_concurrency, min_concurrency=1):
+        self.name = name
+        self.rate_per_second = rate_per_second
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+
+        self.cond = threading.Condition()
+        self.tokens = float(burst)
+        self.last_refill = time.monotonic()
+        self.concurrency_limit = float(max_concurrency)
+        self.in_flight = 0
+
+        self.waiters: list[tuple[int, int]] = []
+        self.async_waiters: dict[tuple[int, int], tuple[asyncio.AbstractEventLoop, asyncio.Event]] = dict()
+        self.ticket_counter = itertools.count()
+
+        self.completed = 0
+        self.throttled = 0
+
+    def _refill(self):
+
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.rate_per_second)
+        self.last_refill = now
+
+    def _notify(self):
+        """
+        Wake every waiter, threads on the condition and coroutines on their event loop. Called with the lock held.
+        """
+
+        self.cond.notify_all()
+
+        for loop, wakeup in self.async_waiters.values():
+            try:
+                loop.call_soon_threadsafe(wakeup.set)
+            except RuntimeError:
+                # loop already closed, its waiter is gone with it
+                pass
+
+    def _try_take(self, ticket):
+        """
+        Take a token and a concurrency slot if ticket is first in line and both are free. Called with the lock held,
+        returns (granted, seconds until the next token or None)
+        """
+
+        self._refill()
+
+        if self.waiters[0] == ticket and self.tokens >= 1 and self.in_flight < int(self.concurrency_limit):
+            heapq.heappop(self.waiters)
+            self.tokens -= 1
+            self.in_flight += 1
+
+            # the next waiter may be able to go as well
+            self._notify()
+            return True, None
+
+        if self.tokens < 1:
+            return False, (1 - self.tokens) / self.rate_per_second
+
+        return False, None
+
+    def _drop_waiter(self, ticket):
+
+        if ticket in self.waiters:
+            self.waiters.remove(ticket)
+            heapq.heapify(self.waiters)
+            self._notify()
+
+    def acquire(self, priority: int):
+        """
+        Block until this caller is the highest priority waiter and both a token and a concurrency slot are free
+        """
+
+        with self.cond:
+            ticket = (priority, next(self.ticket_counter))
+            heapq.heappush(self.waiters, ticket)
+
+            try:
+                while True:
+                    granted, timeout = self._try_take(ticket)
+
+                    if granted:
+                        return
+
+                    self.cond.wait(timeout)
+
+            except BaseException:
+                self._drop_waiter(ticket)
+                raise
+
+    async def acquire_async(self, priority: int):
+        """
+        acquire for coroutines, waits on the event loop instead of a thread. The slot is only taken right before
+        returning, so a cancelled waiter just leaves the queue and never holds a slot it can't give back.
+        """
+
+        wakeup = asyncio.Event()
+
+        with self.cond:
+            ticket = (priority, next(self.ticket_counter))
+            heapq.heappush(self.waiters, ticket)
+            self.async_waiters[ticket] = (asyncio.get_running_loop(), wakeup)
+
+        try:
+            while True:
+                with self.cond:
+                    # cleared under the lock, a notify after the check below is never lost
+                    wakeup.clear()
+                    granted, timeout = self._try_take(ticket)
+
+                    if granted:
+                        return
+
+                try:
+                    await asyncio.wait_for(wakeup.wait(), timeout)
+                except TimeoutError:
+                    pass
+
+        except BaseException:
+            with self.cond:
+                self._drop_waiter(ticket)
+            raise
+
+        finally:
+            with self.cond:
+                self.async_waiters.pop(ticket, None)
+
+    def release(self, throttled: bool = False):
+        """
+        Give the slot back, throttled tells whether the upstream pushed back (429 / retryable 5xx / transport error)
+        """
+
+        with self.cond:
+            self.in_flight -= 1
+
+            if throttled:
+                self.throttled += 1
+                self.concurrency_limit = max(self.min_concurrency, self.concurrency_limit / 2)
+
+                # pause new requests briefly, the upstream just told us we're too fast
+                self.tokens = min(self.tokens, 0)
+
+                logger.warning(f"{self.name} throttled, concurrency limit lowered to {int(self.concurrency_limit)}")
+            else:
+                self.completed += 1
+                self.concurrency_limit = min(self.max_concurrency, self.concurrency_limit + 1 / self.concurrency_limit)
+
+            self._notify()
+
+    def stats(self):
+
+        with self.cond:
+            return {
+                "in_flight": self.in_flight,
+                "queued": len(self.waiters),
+                "concurrency_limit": int(self.concurrency_limit),
+                "completed": self.completed,
+                "throttled": self.throttled,
+            }
+
+
+memories_ai_limiter = AdaptiveRateLimiter(
+    "memories.ai",
+    rate_per_second=app_settings.MEMORIES_AI_RATE_PER_SECOND,
+    burst=app_settings.MEMORIES_AI_BURST,
+    max_concurrency=app_settings.MEMORIES_AI_MAX_CONCURRENCY,
+)
+
+gemini_limiter = AdaptiveRateLimiter(
+    "gemini",
+    rate_per_second=app_settings.GEMINI_RATE_PER_SECOND,
+    burst=app_settings.GEMINI_BURST,
+    max_concurrency=app_settings.LLM_MAX_CONCURRENCY,
+)
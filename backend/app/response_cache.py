@@ -0,0 +1,72 @@
+from collections import OrderedDict
+import hashlib
+import logging
+import threading
+
+import pydantic
+
+from app.config import app_settings
+
+logger = logging.getLogger(__name__)
+
+
+class ResultsResponseCache:
+    """
+    In process LRU of the pre-serialized analysis result responses, keyed by (endpoint, video) and tagged with
+    the video's results_version. The version lives in the database and is bumped by triggers whenever alerts,
+    annotations or SOP results are written, so entries go stale even when the worker runs in another process.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries: OrderedDict[tuple[str, str], tuple[int, str, bytes]] = OrderedDict()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def build_etag(body: bytes):
+        return f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+    @staticmethod
+    def etag_matches(if_none_match: str | None, etag: str):
+
+        if if_none_match is None:
+            return False
+
+        candidates = [c.strip() for c in if_none_match.split(",")]
+
+        # If-None-Match uses the weak comparison
+        return "*" in candidates or etag in [c.removeprefix("W/") for c in candidates]
+
+    def get(self, kind, video_public_id, version):
+        """
+        Returns (etag, body) if the cached response is still at version, None otherwise
+        """
+
+        with self.lock:
+            entry = self.entries.get((kind, video_public_id))
+
+            if entry is None or entry[0] != version:
+                return None
+
+            self.entries.move_to_end((kind, video_public_id))
+            return entry[1], entry[2]
+
+    def set(self, kind, video_public_id, version, response: pydantic.BaseModel):
+        """
+        Serialize the response once and remember it, returns (etag, body)
+        """
+
+        body = response.model_dump_json().encode("utf-8")
+        etag = self.build_etag(body)
+
+        with self.lock:
+            self.entries[(kind, video_public_id)] = (version, etag, body)
+            self.entries.move_to_end((kind, video_public_id))
+
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+        return etag, body
+
+
+results_response_cache = ResultsResponseCache(app_settings.RESPONSE_CACHE_MAX_ENTRIES)
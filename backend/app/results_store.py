@@ -0,0 +1,98 @@
+import logging
+from sqlite3 import Cursor
+from typing import List
+
+from app.utils import timestamp_to_seconds
+
+logger = logging.getLogger(__name__)
+
+# The JSON columns (videos.alerts, people.annotation, people.sop) stay the source of the per video endpoints,
+# these typed rows mirror them for indexed cross video reporting. Callers own the transaction.
+
+
+def store_alert_rows(video_public_id, alerts: List[dict], cursor: Cursor):
+
+    cursor.execute("DELETE FROM alert_events WHERE video_public_id = ?", (video_public_id,))
+
+    sql_cmd = """
+    INSERT INTO alert_events
+        (video_public_id, env_id, alert_level, description, start_timestamp, end_timestamp, start_seconds, end_seconds)
+    SELECT public_id, env_id, ?, ?, ?, ?, ?, ?
+    FROM videos
+    WHERE public_id = ?
+    """
+
+    cursor.executemany(sql_cmd, [
+        (
+            str(alert.get("alert_level", "")).lower(),
+            alert.get("description", ""),
+            alert.get("start"),
+            alert.get("end"),
+            timestamp_to_seconds(alert.get("start")),
+            timestamp_to_seconds(alert.get("end")),
+            video_public_id,
+        )
+        for alert in alerts
+    ])
+
+
+def store_person_action_rows(person_id, actions: List[dict], cursor: Cursor):
+
+    cursor.execute("DELETE FROM person_actions WHERE person_id = ?", (person_id,))
+
+    sql_cmd = """
+    INSERT INTO person_actions
+        (person_id, huid, video_public_id, env_id, action, start_timestamp, end_timestamp, start_seconds, end_seconds)
+    SELECT people.id, people.huid, people.video_public_id, videos.env_id, ?, ?, ?, ?, ?
+    FROM people
+    JOIN videos ON people.video_public_id = videos.public_id
+    WHERE people.id = ?
+    """
+
+    cursor.executemany(sql_cmd, [
+        (
+            action.get("action", ""),
+            action.get("start"),
+            action.get("end"),
+            timestamp_to_seconds(action.get("start")),
+            timestamp_to_seconds(action.get("end")),
+            person_id,
+        )
+        for action in actions
+    ])
+
+
+def store_sop_result_rows(person_id, sop_results: List[dict] | None, cursor: Cursor):
+    """
+    Replace the SOP step verdicts of a person, None only clears them (annotation changed, SOP pending again)
+    """
+
+    cursor.execute("DELETE FROM sop_step_results WHERE person_id = ?", (person_id,))
+
+    if not sop_results:
+        return
+
+    sql_cmd = """
+    INSERT INTO sop_step_results
+        (person_id, huid, video_public_id, env_id, step_number, sop_event, done, confidence,
+         start_timestamp, end_timestamp, start_seconds, end_seconds)
+    SELECT people.id, people.huid, people.video_public_id, videos.env_id, ?, ?, ?, ?, ?, ?, ?, ?
+    FROM people
+    JOIN videos ON people.video_public_id = videos.public_id
+    WHERE people.id = ?
+    """
+
+    cursor.executemany(sql_cmd, [
+        (
+            step_number,
+            result.get("sop_event", ""),
+            int(bool(result.get("done"))),
+            result.get("confidence"),
+            result.get("start"),
+            result.get("end"),
+            timestamp_to_seconds(result.get("start")),
+            timestamp_to_seconds(result.get("end")),
+            person_id,
+        )
+        for step_number, result in enumerate(sop_results, start=1)
+    ])
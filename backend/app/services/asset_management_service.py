@@ -1,13 +1,18 @@
+from contextlib import suppress
 import logging
 import os
 from pathlib import Path
 import sqlite3
+import time
 
 import cloudinary.uploader
 import requests
 
+from app.config import app_settings
 from app.constants import Environment
 from app.exceptions import AssetDownloadFailed, DBOperationFailed, GenericFSIOError, UploadFailed, UploadingUnsupportedResourceType
+from app.metrics import record_external_call
+from app.utils import build_local_uri_for_video
 
 logger = logging.getLogger(__name__)
 
@@ -44,6 +49,8 @@ class AssetManagementService:
         if resource_type not in self.supported_resource_types:
             raise UploadingUnsupportedResourceType()
         
+        start = time.perf_counter()
+
         try:
             resp = cloudinary.uploader.upload(
                 file_uri,
@@ -51,8 +58,10 @@ class AssetManagementService:
                 resource_type=resource_type
             )
 
+            record_external_call("cloudinary_upload", time.perf_counter() - start)
             return resp['public_id'], resp['secure_url']
-        except:
+        except Exception as e:
+            record_external_call("cloudinary_upload", time.perf_counter() - start, error=type(e).__name__)
             raise UploadFailed()
         
     def register_asset(self,file_public_id, file_url, resource_type, db_conn, env_id = None):
@@ -96,6 +105,94 @@ class AssetManagementService:
 
             raise DBOperationFailed()
         
+    def register_videos(self, videos, db_conn, commit=True):
+        """
+        Register many (public_id, url, env_id) videos in a single transaction, already registered ones are skipped.
+        Returns the set of public_ids that got registered.
+        """
+
+        try:
+            cursor = db_conn.cursor()
+
+            sql_cmd = """
+            INSERT OR IGNORE INTO videos (public_id, url, env_id)
+            VALUES (?, ?, ?)
+            """
+
+            registered = set()
+
+            for public_id, url, env_id in videos:
+                cursor.execute(sql_cmd, (public_id, url, Environment(env_id).value))
+
+                if cursor.rowcount == 1:
+                    registered.add(public_id)
+
+            if commit:
+                db_conn.commit()
+
+            logger.info(f"Successfully registered {len(registered)}/{len(videos)} videos")
+            return registered
+
+        except sqlite3.Error as e:
+
+            logger.error(f"Failed to register {len(videos)} videos due to error {e}")
+
+            if db_conn:
+                db_conn.rollback()
+
+            raise DBOperationFailed()
+
+    def get_huid_thumbnail(self, huid, db_conn):
+        """
+        Returns the stored thumbnail row (image_public_id, url, content_hash, resolution) of a huid or None
+        """
+
+        cursor = db_conn.cursor()
+
+        sql_cmd = """
+        SELECT image_public_id, url, content_hash, resolution
+        FROM huid_thumbnails
+        WHERE huid = ?
+        """
+
+        cursor.execute(sql_cmd, (huid,))
+        return cursor.fetchone()
+
+    def register_huid_thumbnail(self, huid, image_public_id, url, content_hash, resolution, db_conn):
+        """
+        Register the uploaded thumbnail into the images table and make it the thumbnail of the huid
+        """
+
+        self.register_asset(image_public_id, url, "image", db_conn)
+
+        try:
+            cursor = db_conn.cursor()
+
+            sql_cmd = """
+            INSERT INTO huid_thumbnails (huid, image_public_id, url, content_hash, resolution)
+            VALUES (?,?,?,?,?)
+            ON CONFLICT (huid) DO UPDATE SET
+                image_public_id = excluded.image_public_id,
+                url = excluded.url,
+                content_hash = excluded.content_hash,
+                resolution = excluded.resolution,
+                updated_at = CURRENT_TIMESTAMP
+            """
+
+            cursor.execute(sql_cmd, (huid, image_public_id, url, content_hash, resolution))
+            db_conn.commit()
+
+            logger.info(f"Successfully registered thumbnail {image_public_id} for huid: {huid}")
+
+        except sqlite3.Error as e:
+
+            logger.error(f"Failed to register thumbnail for huid : {huid} due to error {e}")
+
+            if db_conn:
+                db_conn.rollback()
+
+            raise DBOperationFailed()
+
     def download_asset_if_not_exist(self, file_path, url):
 
         file = Path(file_path)
@@ -109,19 +206,57 @@ class AssetManagementService:
         if(file.exists()):
             return
 
+        # download next to the target and rename, an interrupted download must never look like a complete file
+        part_file_path = f"{file_path}.part"
+        start = time.perf_counter()
+
         try:
             logger.info(f"Downloading asset from {url}")
-            with requests.get(url,stream=True) as r:
+
+            timeout = (app_settings.HTTP_CONNECT_TIMEOUT_SECONDS, app_settings.HTTP_TIMEOUT_SECONDS)
+            with requests.get(url,stream=True,timeout=timeout) as r:
                 r.raise_for_status()
-                with open (file_path,'wb') as f:
-                    for chunk in r.iter_content(chunk_size=8192):
+                with open (part_file_path,'wb') as f:
+                    for chunk in r.iter_content(chunk_size=1024 * 1024):
                         f.write(chunk)
+
+            os.replace(part_file_path, file_path)
+            record_external_call("asset_download", time.perf_counter() - start)
             logger.info(f"Successfully downloaded asset from {url}")
 
         except Exception as e:
+            record_external_call("asset_download", time.perf_counter() - start, error=type(e).__name__)
             logger.error(f"Failed to download asset from {url} due to error {e}")
+
+            with suppress(OSError):
+                os.remove(part_file_path)
+
             raise AssetDownloadFailed()
         
+    def get_video_url(self, video_public_id, db_conn):
+        """
+        Url the video was registered with, None for an unknown video
+        """
+
+        cursor = db_conn.cursor()
+        cursor.execute("SELECT url FROM videos WHERE public_id = ?", (video_public_id,))
+        res = cursor.fetchone()
+
+        return None if res is None else res[0]
+
+    def download_video_for_analysis(self, video_public_id, video_url):
+        """
+        Download the video to build_local_uri_for_video unless it is already there
+        """
+
+        download_url = video_url
+
+        # analysis only needs a detector sized rendition, thumbnails are cut from the original later on
+        if app_settings.PROXY_INGEST_ENABLED:
+            download_url = self.get_proxy_cloudinary_url(video_public_id)
+
+        self.download_asset_if_not_exist(build_local_uri_for_video(video_public_id), download_url)
+
     def get_downloadable_cloudinary_url(self,public_id,resource_type):
 
         if resource_type not in self.supported_resource_types:
@@ -130,3 +265,52 @@ class AssetManagementService:
         return cloudinary.utils.cloudinary_url(public_id,resource_type=resource_type,transformation=[
             {'flags': 'attachment'}
         ])[0]
+
+    def get_proxy_cloudinary_url(self, video_public_id):
+        """
+        Url of a downscaled (and optionally frame rate reduced) rendition of the video sized for the detector,
+        the analysis never needs the full resolution original
+        """
+
+        transformation = [{"width": app_settings.PROXY_MAX_WIDTH, "crop": "limit"}]
+
+        if app_settings.PROXY_FPS is not None:
+            transformation.append({"fps": app_settings.PROXY_FPS})
+
+        transformation.append({"flags": "attachment"})
+
+        return cloudinary.utils.cloudinary_url(
+            video_public_id, resource_type="video", format="mp4", transformation=transformation
+        )[0]
+
+    def get_original_frame_cloudinary_url(self, video_public_id, seconds):
+        """
+        Url of a single full resolution frame of the original video at the given offset
+        """
+
+        return cloudinary.utils.cloudinary_url(
+            video_public_id, resource_type="video", format="jpg", transformation=[{"start_offset": f"{seconds:.2f}"}]
+        )[0]
+
+    def get_original_clip_cloudinary_url(self, video_public_id, segments_in_seconds):
+        """
+        Url of the given (start, end) seconds of the original video played one after another, spliced by Cloudinary
+        so the full resolution original never has to be downloaded and re-uploaded
+        """
+
+        (first_start, first_end), *rest = segments_in_seconds
+
+        transformation = [{"start_offset": f"{first_start:.2f}", "end_offset": f"{first_end:.2f}"}]
+
+        # layers name folders with ':' instead of '/'
+        layer = f"video:{video_public_id.replace('/', ':')}"
+
+        for start, end in rest:
+            transformation.append({"overlay": layer, "start_offset": f"{start:.2f}", "end_offset": f"{end:.2f}", "flags": "splice"})
+            transformation.append({"flags": "layer_apply"})
+
+        transformation.append({"flags": "attachment"})
+
+        return cloudinary.utils.cloudinary_url(
+            video_public_id, resource_type="video", format="mp4", transformation=transformation
+        )[0]
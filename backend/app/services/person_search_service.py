@@ -0,0 +1,241 @@
+import base64
+import binascii
+from collections import OrderedDict
+import hashlib
+import logging
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import cloudinary
+import cv2
+import numpy as np
+import requests
+
+from app.config import app_settings
+from app.exceptions import InvalidSearchImage
+from app.ml_models import huid_collection, osnet_feature_extractor
+
+logger = logging.getLogger(__name__)
+
+
+class _LRUCache:
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries: OrderedDict = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+
+        with self.lock:
+            if key not in self.entries:
+                return None
+
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def set(self, key, value):
+
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+class PersonSearchService:
+    """
+    Finds the huids that look like the person in the given images by querying the re-ID gallery with their
+    OSNet embeddings. Embeddings are cached by image content, gallery lookups for a short while since the
+    gallery keeps changing while videos are analysed.
+    """
+
+    def __init__(self):
+        self.embedding_cache = _LRUCache(app_settings.PERSON_SEARCH_EMBEDDING_CACHE_ENTRIES)
+        self.result_cache = _LRUCache(app_settings.PERSON_SEARCH_RESULT_CACHE_ENTRIES)
+
+    def warm_up(self):
+        """
+        Run one dummy batch so the first search doesn't pay for CUDA init and kernel selection
+        """
+
+        try:
+            osnet_feature_extractor([np.zeros((256, 128, 3), dtype=np.uint8)])
+            logger.info("Person search embedder is warm")
+        except Exception as e:
+            logger.error(f"Failed to warm up the person search embedder due to error {e}")
+
+    def _check_image_url(self, image_url: str):
+        """
+        Only images of our own Cloudinary cloud are fetched, the URL comes from the client and must not reach internal hosts
+        """
+
+        parts = urlsplit(image_url)
+        cloud_name = cloudinary.config().cloud_name
+
+        if (
+            parts.scheme != "https"
+            or parts.hostname != app_settings.PERSON_SEARCH_IMAGE_HOST
+            or parts.port is not None
+            or parts.username is not None
+            or not parts.path.startswith(f"/{cloud_name}/image/")
+        ):
+            raise InvalidSearchImage(f"image_url must be an image of the Cloudinary cloud {cloud_name}")
+
+    def _download_image(self, image_url: str) -> bytes:
+
+        self._check_image_url(image_url)
+        max_bytes = app_settings.PERSON_SEARCH_MAX_IMAGE_BYTES
+
+        try:
+            # no redirects, they could leave the allowed host
+            with requests.get(image_url, timeout=app_settings.HTTP_TIMEOUT_SECONDS, stream=True, allow_redirects=False) as resp:
+                resp.raise_for_status()
+
+                content_type = resp.headers.get("Content-Type", "")
+                if not content_type.startswith("image/"):
+                    raise InvalidSearchImage(f"{image_url} is not an image (Content-Type {content_type or 'missing'})")
+
+                if int(resp.headers.get("Content-Length") or 0) > max_bytes:
+                    raise InvalidSearchImage(f"Image at {image_url} is larger than {max_bytes} bytes")
+
+                chunks = []
+                size = 0
+
+                # Content-Length may be missing or wrong, enforce the cap on what actually arrives
+                for chunk in resp.iter_content(chunk_size=64 * 1024):
+                    size += len(chunk)
+
+                    if size > max_bytes:
+                        raise InvalidSearchImage(f"Image at {image_url} is larger than {max_bytes} bytes")
+
+                    chunks.append(chunk)
+
+                return b"".join(chunks)
+
+        except (requests.RequestException, ValueError) as e:
+            raise InvalidSearchImage(f"Failed to download image from {image_url}: {e}")
+
+    def _load_image(self, image_base64: Optional[str], image_url: Optional[str]) -> bytes:
+
+        if image_base64 is not None:
+            # 4 base64 characters per 3 bytes, reject before decoding
+            if len(image_base64) > 4 * (app_settings.PERSON_SEARCH_MAX_IMAGE_BYTES // 3 + 1):
+                raise InvalidSearchImage(f"Image is larger than {app_settings.PERSON_SEARCH_MAX_IMAGE_BYTES} bytes")
+
+            try:
+                return base64.b64decode(image_base64, validate=True)
+            except binascii.Error as e:
+                raise InvalidSearchImage(f"Image is not valid base64: {e}")
+
+        if image_url is not None:
+            return self._download_image(image_url)
+
+        raise InvalidSearchImage("Either image_base64 or image_url is required")
+
+    def _crop(self, image_bytes: bytes, box: Optional[List[int]]) -> np.ndarray:
+
+        image = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+        if image is None:
+            raise InvalidSearchImage("Image could not be decoded")
+
+        if box is None:
+            return image
+
+        height, width = image.shape[:2]
+        x1, y1, x2, y2 = box
+        x1, x2 = np.clip([x1, x2], 0, width)
+        y1, y2 = np.clip([y1, y2], 0, height)
+
+        if x2 <= x1 or y2 <= y1:
+            raise InvalidSearchImage(f"Crop region {box} is empty for an image of {width}x{height}")
+
+        return image[y1:y2, x1:x2]
+
+    def get_embeddings(self, images: List[Tuple[Optional[str], Optional[str], Optional[List[int]]]]) -> Tuple[List[str], np.ndarray]:
+        """
+        Embed (image_base64, image_url, box) items, only the ones not seen before go through the model, in one batch.
+        Returns (content keys, embeddings)
+        """
+
+        keys = []
+        embeddings: Dict[str, np.ndarray] = dict()
+        crops_to_embed: Dict[str, np.ndarray] = dict()
+
+        for image_base64, image_url, box in images:
+            image_bytes = self._load_image(image_base64, image_url)
+            key = hashlib.sha256(image_bytes + repr(box).encode("utf-8")).hexdigest()
+            keys.append(key)
+
+            embedding = self.embedding_cache.get(key)
+
+            if embedding is not None:
+                embeddings[key] = embedding
+            elif key not in crops_to_embed:
+                crops_to_embed[key] = self._crop(image_bytes, box)
+
+        if len(crops_to_embed) > 0:
+            new_embeddings = osnet_feature_extractor(list(crops_to_embed.values())).cpu().numpy()
+
+            for key, embedding in zip(crops_to_embed, new_embeddings):
+                self.embedding_cache.set(key, embedding)
+                embeddings[key] = embedding
+
+        return keys, np.stack([embeddings[key] for key in keys])
+
+    def search(self, images, top_k: int, max_distance: Optional[float] = None):
+        """
+        Top k huids for the images, a huid scores the mean over the images of its best cosine similarity
+        (0 for images it didn't match). Returns a list of (huid, score, best_distance, matched_images)
+        """
+
+        keys, embeddings = self.get_embeddings(images)
+
+        # the exact inputs, a repeated image weighs twice in the mean score
+        cache_key = (tuple(keys), top_k, max_distance)
+        cached = self.result_cache.get(cache_key)
+
+        if cached is not None and time.monotonic() - cached[0] < app_settings.PERSON_SEARCH_RESULT_TTL_SECONDS:
+            return cached[1]
+
+        # every huid keeps up to GALLERY_SIZE crops, ask for enough neighbours to still see top_k distinct huids
+        results = huid_collection.query(
+            query_embeddings=embeddings.tolist(),
+            n_results=top_k * max(1, app_settings.GALLERY_SIZE),
+            include=["metadatas", "distances"],
+        )
+
+        best_distances: Dict[str, List[float]] = dict()
+
+        for image_idx, (metadatas, distances) in enumerate(zip(results["metadatas"], results["distances"])):
+            for metadata, distance in zip(metadatas, distances):
+
+                if max_distance is not None and distance > max_distance:
+                    continue
+
+                per_image = best_distances.setdefault(metadata["huid"], [np.inf] * len(embeddings))
+                per_image[image_idx] = min(per_image[image_idx], distance)
+
+        matches = []
+
+        for huid, per_image in best_distances.items():
+            similarities = [1 - d if np.isfinite(d) else 0.0 for d in per_image]
+
+            matches.append((
+                huid,
+                round(float(np.mean(similarities)), 4),
+                round(float(min(per_image)), 4),
+                int(np.count_nonzero(np.isfinite(per_image))),
+            ))
+
+        matches = sorted(matches, key=lambda m: m[1], reverse=True)[:top_k]
+
+        self.result_cache.set(cache_key, (time.monotonic(), matches))
+        return matches
+
+
+person_search_service = PersonSearchService()
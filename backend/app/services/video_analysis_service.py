@@ -1,19 +1,34 @@
+import asyncio
+import hashlib
 import logging
 import os
-from typing import Dict, Set
+from pathlib import Path
+import time
+from typing import Set
 import uuid
 
 import cv2
+import httpx
 import numpy as np
-import requests
 
 from ultralytics import YOLO
 
-from app.config import APP_ROOT_DIR, osnet_feature_extractor, huid_collection
+from app.config import APP_ROOT_DIR, app_settings
+from app.constants import AnalysisStage, RequestPriority
+from app.exceptions import VideoTrackingFailed
+from app.http_client import get_async_http_client
+from app.memory import AnalysisMemoryGuard
+from app.metrics import CROPS_TOTAL, FRAMES_SKIPPED_TOTAL, FRAMES_TOTAL, TRACKS_PRUNED_TOTAL, count, record_stage, timed_stage
+from app.rate_limit import memories_ai_limiter
+from app.ml_models import osnet_feature_extractor, huid_collection
 from app.utils import (
+    build_local_uri_for_clip,
+    build_local_uri_for_detection_cache,
+    build_local_uri_for_tracks,
     build_local_uri_for_video,
     build_uri_for_crop,
     build_uri_for_huid,
+    build_uri_for_thumbnail,
     generate_unique_id,
     select_most_diverse_subset,
     store_crop_at_path,
@@ -21,7 +36,12 @@ from app.utils import (
 
 from chromadb.errors import ChromaError
 
+from app.db import open_sqllite_db_connection
+from app.detection_cache import DetectionCacheWriter
+from app.progress import AnalysisProgressReporter
+from app.track_store import ActiveTracks, TrackTimeline, TrackTimelineBuilder
 from app.services.asset_management_service import AssetManagementService
+from app.services.video_clip_service import VideoClipService
 
 logger = logging.getLogger(__name__)
 
@@ -31,7 +51,7 @@ class VideoAnalysisService:
     def __init__(self):
         # not the most efficient way, but should be fine for now
         self.segmentation_model = YOLO(f"{APP_ROOT_DIR}/models/yolo11n.pt")
-        self.base_url = "https://20da56df2fe66e.lhr.life"
+        self.base_url = app_settings.CALLBACK_BASE_URL
 
     def _select_best_local_crop_for_huid(self,huid: str):
         """
@@ -64,9 +84,132 @@ class VideoAnalysisService:
                 # Catch other potential OS errors (like permission denied)
                 logger.error(f"Could not process file {file_path} due to error {e}")
 
-        return best_res_file_path
+        return best_res_file_path, best_res
 
-    def _get_next_frame_from_video(self,video_file_path):
+    def _get_best_detection_of_huid(self, huid, timeline: TrackTimeline):
+        """
+        (frame index, box) of the largest, most confident detection of the huid, the box in analysis pixels
+        """
+
+        detections = timeline.get_detections(huid)
+
+        if len(detections["frame"]) == 0:
+            raise ValueError(f"No detections for huid: {huid}")
+
+        boxes = detections["box"].astype(np.int64)
+        scores = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1]) * detections["conf"].astype(np.float32)
+        best = int(np.argmax(scores))
+
+        return int(detections["frame"][best]), boxes[best]
+
+    def _get_thumbnail_crop_from_original(self, video_public_id, huid, frame_idx, box, fps, asset_mgmt_service):
+        """
+        The analysis runs on a low resolution proxy, so cut the thumbnail of the huid out of the original video,
+        only the frame of its best detection is fetched. Returns the crop file path
+        """
+
+        frame_url = asset_mgmt_service.get_original_frame_cloudinary_url(video_public_id, frame_idx / fps)
+        # the best frame of a huid changes between analyses, a frame downloaded for another one must not be reused
+        frame_file_path = build_uri_for_thumbnail(video_public_id, f"{huid}_frame_{frame_idx}")
+
+        asset_mgmt_service.download_asset_if_not_exist(frame_file_path, frame_url)
+
+        original_frame = cv2.imread(frame_file_path)
+
+        if original_frame is None:
+            raise IOError(f"Could not read original frame {frame_file_path}")
+
+        _, _, proxy_width, proxy_height = self._get_video_properties(build_local_uri_for_video(video_public_id))
+
+        # per axis, the proxy isn't guaranteed to keep the aspect ratio of the original to the pixel
+        height, width = original_frame.shape[:2]
+        scale = np.array([width / proxy_width, height / proxy_height] * 2)
+
+        x1, y1, x2, y2 = (box * scale).astype(int)
+        x1, x2 = np.clip([x1, x2], 0, width)
+        y1, y2 = np.clip([y1, y2], 0, height)
+
+        crop = original_frame[y1:y2, x1:x2]
+        crop_file_path = build_uri_for_thumbnail(video_public_id, huid)
+        store_crop_at_path(crop, crop_file_path)
+
+        return crop_file_path
+
+    def _get_normalised_crop_hash(self, crop_file_path, size=None):
+        """
+        Hash of the crop pixels scaled to size (width, height) in analysis pixels, the same detection hashes the same
+        whether it was cut from the original or from the proxy. Proxy crops already are in analysis pixels.
+        """
+
+        crop = cv2.imread(crop_file_path)
+
+        if crop is None:
+            raise IOError(f"Could not read crop {crop_file_path}")
+
+        if size is not None and (crop.shape[1], crop.shape[0]) != size:
+            crop = cv2.resize(crop, size, interpolation=cv2.INTER_AREA)
+
+        return hashlib.sha256(crop.tobytes()).hexdigest()
+
+    def _get_or_upload_huid_thumbnail(self, huid, asset_mgmt_service, video_public_id=None, timeline: TrackTimeline | None = None):
+        """
+        Downloadable url of the huid's thumbnail, a new crop is only uploaded when the huid has no thumbnail yet
+        or the crop is meaningfully bigger (THUMBNAIL_MIN_RESOLUTION_GAIN) than the stored one. Resolutions are
+        in analysis pixels, so reuse is decided before anything is fetched from the original.
+        """
+
+        detection = None
+        local_uri = None
+        size = None
+
+        if app_settings.PROXY_INGEST_ENABLED and timeline is not None:
+            try:
+                detection = self._get_best_detection_of_huid(huid, timeline)
+            except ValueError as e:
+                logger.error(f"No detection to cut the thumbnail of huid [{huid}] from the original video due to error {e}, using proxy crops")
+
+        if detection is not None:
+            frame_idx, box = detection
+            size = (int(box[2] - box[0]), int(box[3] - box[1]))
+            resolution = size[0] * size[1]
+        else:
+            local_uri, resolution = self._select_best_local_crop_for_huid(huid)
+
+        db_conn = open_sqllite_db_connection()
+
+        try:
+            thumbnail = asset_mgmt_service.get_huid_thumbnail(huid, db_conn)
+
+            if thumbnail is not None and resolution < thumbnail["resolution"] * app_settings.THUMBNAIL_MIN_RESOLUTION_GAIN:
+                logger.info(f"Reusing stored thumbnail {thumbnail['image_public_id']} for huid [{huid}]")
+                return asset_mgmt_service.get_downloadable_cloudinary_url(thumbnail["image_public_id"], "image")
+
+            if detection is not None:
+                try:
+                    local_uri = self._get_thumbnail_crop_from_original(video_public_id, huid, frame_idx, box, timeline.fps, asset_mgmt_service)
+                except Exception as e:
+                    logger.error(f"Failed to crop thumbnail of huid [{huid}] from the original video due to error {e}, using proxy crops")
+                    local_uri, resolution = self._select_best_local_crop_for_huid(huid)
+                    size = None
+
+            content_hash = self._get_normalised_crop_hash(local_uri, size)
+
+            if thumbnail is not None and thumbnail["content_hash"] == content_hash:
+                logger.info(f"Reusing stored thumbnail {thumbnail['image_public_id']} for huid [{huid}]")
+                return asset_mgmt_service.get_downloadable_cloudinary_url(thumbnail["image_public_id"], "image")
+
+            public_id, url = asset_mgmt_service.upload_asset(local_uri, "image")
+            asset_mgmt_service.register_huid_thumbnail(huid, public_id, url, content_hash, resolution, db_conn)
+
+            return asset_mgmt_service.get_downloadable_cloudinary_url(public_id, "image")
+
+        finally:
+            db_conn.close()
+
+    def _get_next_frame_from_video(self, video_file_path, memory_guard: AnalysisMemoryGuard | None = None):
+        """
+        Yields (frame index, frame), with a memory guard only every memory_guard.stride-th frame
+        """
 
         if not os.path.exists(video_file_path):
             raise FileNotFoundError(f"Video file not found: {video_file_path}")
@@ -76,14 +219,58 @@ class VideoAnalysisService:
         if not video_capture.isOpened():
             raise IOError(f"Error: Could not open video file {video_file_path}")
 
+        frame_idx = 0
+
         try:
             while True:
+                stride = 1 if memory_guard is None else memory_guard.stride
+                start = time.perf_counter()
+
+                # under memory pressure the frames in between are only grabbed, never decoded into images,
+                # processed frames stay aligned to the stride so the every n frames work still happens
+                skipped = 0
+                while frame_idx % stride != 0 and video_capture.grab():
+                    frame_idx += 1
+                    skipped += 1
+
                 ret, frame = video_capture.read()
+                record_stage("decode", time.perf_counter() - start)
+
+                if skipped > 0:
+                    count(FRAMES_SKIPPED_TOTAL, "frames_skipped", skipped)
 
                 if not ret:
                     break
 
-                yield frame
+                yield frame_idx, frame
+                frame_idx += 1
+        finally:
+            video_capture.release()
+
+    def _get_video_properties(self, video_file_path):
+        """
+        Returns (fps, total_frames, width, height) of the video
+        """
+
+        video_capture = cv2.VideoCapture(video_file_path)
+
+        if not video_capture.isOpened():
+            raise IOError(f"Error: Could not open video file {video_file_path}")
+
+        try:
+            fps = video_capture.get(cv2.CAP_PROP_FPS)
+
+            # every frame <-> seconds conversion divides by it
+            if not fps > 0:
+                logger.warning(f"No frame rate reported for {video_file_path}, assuming {app_settings.VIDEO_DEFAULT_FPS}")
+                fps = app_settings.VIDEO_DEFAULT_FPS
+
+            return (
+                fps,
+                int(video_capture.get(cv2.CAP_PROP_FRAME_COUNT)),
+                int(video_capture.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                int(video_capture.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+            )
         finally:
             video_capture.release()
 
@@ -96,6 +283,8 @@ class VideoAnalysisService:
 
         # can use streaming mode later for better performance
 
+        start = time.perf_counter()
+
         results = self.segmentation_model.track(
             frame,
             tracker=f"{APP_ROOT_DIR}/models/botsort_tracker_config.yaml",
@@ -106,11 +295,18 @@ class VideoAnalysisService:
             verbose=False,
         )
 
+        # ultralytics reports its own pre/inference/post timings in ms, the rest of the call is the tracker update
+        elapsed = time.perf_counter() - start
+        detection_seconds = min(sum(results[0].speed.values()) / 1000, elapsed)
+        record_stage("yolo", detection_seconds)
+        record_stage("tracker", elapsed - detection_seconds)
+
         if results[0].boxes.id is None:
-            return [], []
+            return [], [], [], []
 
         boxes = results[0].boxes.xyxy.cpu().numpy().astype(int)
         track_ids = results[0].boxes.id.cpu().numpy().astype(int)
+        confs = results[0].boxes.conf.cpu().numpy()
 
         for box in boxes:
             x1, y1, x2, y2 = box
@@ -118,22 +314,52 @@ class VideoAnalysisService:
 
             # ToDo -> one more thing we can do is use a segmentation mask to get the object more precisely, segmentation mask will be black out everything except the object
 
-        return crops, track_ids
+        return crops, track_ids, boxes, confs
+
+    def _get_untracked_crops_from_frame(self, frame, min_conf, max_conf):
+        """
+        Detections in [min_conf, max_conf) from a plain predict pass, for the detection cache only. The tracker never
+        sees them, so recording them doesn't change the tracks of the analysis.
+        """
+
+        with timed_stage("yolo_cache"):
+            results = self.segmentation_model.predict(frame, conf=min_conf, classes=[0], device=0, verbose=False)
+
+        boxes = results[0].boxes.xyxy.cpu().numpy().astype(int)
+        confs = results[0].boxes.conf.cpu().numpy()
 
-    def _get_hu_obj_from_crop_from_db(self, crop, top_k):
+        kept = confs < max_conf
+        boxes, confs = boxes[kept], confs[kept]
+
+        crops = [frame[y1:y2, x1:x2] for x1, y1, x2, y2 in boxes]
+
+        return crops, boxes, confs
+
+    def _get_embedding(self, crop, embedding=None):
+        # reuse the embedding when the caller already has it (batched per frame in detection cache mode)
+        if embedding is not None:
+            return embedding
+
+        with timed_stage("osnet"):
+            return osnet_feature_extractor(crop)[0].cpu().numpy()
+
+    def _get_hu_obj_from_crop_from_db(self, crop, top_k, embedding=None):
 
         if top_k <= 0:
             raise ValueError("top_k should be greater than 0")
 
-        results = huid_collection.query(
-            query_embeddings=[osnet_feature_extractor(crop)[0].cpu().numpy()],
-            n_results=top_k,
-            include=["uris", "metadatas", "distances"],
-        )
+        embedding = self._get_embedding(crop, embedding)
+
+        with timed_stage("chroma_query"):
+            results = huid_collection.query(
+                query_embeddings=[embedding],
+                n_results=top_k,
+                include=["uris", "metadatas", "distances"],
+            )
 
         return results["metadatas"][0], results["distances"][0]
 
-    def _insert_huid_crop_to_db(self, crop, huid=None, id=None):
+    def _insert_huid_crop_to_db(self, crop, huid=None, id=None, embedding=None):
 
         if huid is None:
             huid = str(uuid.uuid4())
@@ -143,23 +369,27 @@ class VideoAnalysisService:
 
         uri = build_uri_for_crop(huid, id, "huid_crops")
 
-        huid_collection.add(
-            ids=[id],
-            embeddings=[osnet_feature_extractor(crop)[0].cpu().numpy()],
-            metadatas={"huid": huid},
-            uris=[uri],
-        )
+        embedding = self._get_embedding(crop, embedding)
+
+        with timed_stage("chroma_insert"):
+            huid_collection.add(
+                ids=[id],
+                embeddings=[embedding],
+                metadatas={"huid": huid},
+                uris=[uri],
+            )
 
         store_crop_at_path(crop, uri)
         return huid
 
-    def _upsert_crop_to_gallery_in_db_if_novel(self, huid, crop):
+    def _upsert_crop_to_gallery_in_db_if_novel(self, huid, crop, embedding=None):
 
         # query chromadb to get existing objects for this huid
-        results = huid_collection.get(
-            where={"huid": huid},
-            include=["uris", "metadatas", "embeddings"],
-        )
+        with timed_stage("chroma_upsert"):
+            results = huid_collection.get(
+                where={"huid": huid},
+                include=["uris", "metadatas", "embeddings"],
+            )
 
         ids = results["ids"]
         embeddings = results["embeddings"]
@@ -169,17 +399,19 @@ class VideoAnalysisService:
 
         # ToDo -> Instead of just adding the new crop directly see if its not too similar to existing ones, even if we don't have 5 crops yet
 
-        if len(ids) < 5:
-            self._insert_huid_crop_to_db(crop, huid)
+        gallery_size = app_settings.GALLERY_SIZE
+
+        if len(ids) < gallery_size:
+            self._insert_huid_crop_to_db(crop, huid, embedding=embedding)
             return
 
         new_id = generate_unique_id()
-        new_embedding = osnet_feature_extractor(crop)[0].cpu().numpy()
+        new_embedding = self._get_embedding(crop, embedding)
 
         all_ids = ids + [new_id]
         all_embeddings = np.vstack([embeddings, new_embedding])
 
-        diverse_indices = select_most_diverse_subset(all_embeddings, 5)
+        diverse_indices = select_most_diverse_subset(all_embeddings, gallery_size)
 
         original_ids_set = set(ids)
         diverse_ids_set = set([all_ids[i] for i in diverse_indices])
@@ -187,7 +419,8 @@ class VideoAnalysisService:
         ids_to_delete = list(original_ids_set - diverse_ids_set)
 
         if len(ids_to_delete) > 0:
-            huid_collection.delete(ids=ids_to_delete)
+            with timed_stage("chroma_upsert"):
+                huid_collection.delete(ids=ids_to_delete)
 
         for id in ids_to_delete:
             uri = build_uri_for_crop(huid, id, "huid_crops")
@@ -198,65 +431,130 @@ class VideoAnalysisService:
 
         for id in diverse_ids_set:
             if id == new_id:
-                self._insert_huid_crop_to_db(crop, huid, new_id)
+                self._insert_huid_crop_to_db(crop, huid, new_id, embedding=new_embedding)
+
+    def _get_and_insert_huids_from_video(self, video_path, detection_cache_folder=None, progress: AnalysisProgressReporter | None = None) -> TrackTimeline:
+        """
+        Track and re-identify everyone in the video, returns the track timeline (every detection indexed by huid).
+        With detection_cache_folder every detection down to DETECTION_CACHE_MIN_CONF and its embedding are recorded
+        for replay (app/detection_cache.py), the ones below the tracker threshold come from a separate untracked pass.
+        """
 
-    def _get_and_insert_huids_from_video(self, video_path):
+        threshold_conf = app_settings.DETECTION_CONF_THRESHOLD
+        reid_distance = app_settings.REID_DISTANCE_THRESHOLD
+        gallery_every = app_settings.GALLERY_UPDATE_EVERY_N_FRAMES
+        memory_check_every = app_settings.ANALYSIS_MEMORY_CHECK_EVERY_N_FRAMES
+
+        cache_writer = None
 
         try:
 
-            current_trackids: Set[int] = set()
-            current_huids: Set[int] = set()
-            trackid_to_huid: Dict[int, int] = dict()
-            huid_to_trackids: Dict[int, Set[int]] = dict()
+            active_tracks = ActiveTracks(app_settings.TRACK_STATE_MAX_IDLE_FRAMES)
+            current_huids: Set[str] = set()
 
-            for step, frame in enumerate(self._get_next_frame_from_video(video_path)):
-                crops, trackids = self._get_crops_and_trackid_from_frame(
-                    frame, threshold_conf=0.7
-                )
+            memory_guard = AnalysisMemoryGuard(Path(video_path).stem)
+            last_memory_check = 0
 
-                for crop, trackid in zip(crops, trackids):
+            fps, total_frames, _, _ = self._get_video_properties(video_path)
+            timeline_builder = TrackTimelineBuilder(fps)
 
-                    # new trackid
-                    if trackid not in current_trackids:
-                        current_trackids.add(trackid)
+            if detection_cache_folder is not None:
+                cache_writer = DetectionCacheWriter(detection_cache_folder)
+
+            for step, frame in self._get_next_frame_from_video(video_path, memory_guard):
+                crops, trackids, boxes, confs = self._get_crops_and_trackid_from_frame(frame, threshold_conf=threshold_conf)
 
+                embeddings = [None] * len(crops)
+
+                if cache_writer is not None:
+                    low_crops, low_boxes, low_confs = self._get_untracked_crops_from_frame(
+                        frame, app_settings.DETECTION_CACHE_MIN_CONF, threshold_conf
+                    )
+
+                    if len(crops) + len(low_crops) > 0:
+                        # one batched forward pass per frame, the tracked part is reused below for the gallery queries/inserts
+                        with timed_stage("osnet"):
+                            all_embeddings = osnet_feature_extractor(crops + low_crops).cpu().numpy()
+
+                        embeddings = all_embeddings[:len(crops)]
+
+                        # untracked detections are recorded with track id -1
+                        cache_writer.add_frame(
+                            step,
+                            np.concatenate([trackids, np.full(len(low_crops), -1)]).astype(int),
+                            np.concatenate([np.asarray(boxes).reshape(-1, 4), low_boxes.reshape(-1, 4)]),
+                            np.concatenate([confs, low_confs]),
+                            all_embeddings,
+                        )
+
+                for crop, trackid, box, conf, embedding in zip(crops, trackids, boxes, confs, embeddings):
+
+                    count(CROPS_TOTAL, "crops")
+
+                    huid = active_tracks.get(trackid, step)
+
+                    # new trackid
+                    if huid is None:
                         metadata, distances = self._get_hu_obj_from_crop_from_db(
-                            crop, top_k=1
+                            crop, top_k=1, embedding=embedding
                         )
 
-                        if len(metadata) != 0 and distances[0] < 0.3:
+                        if len(metadata) != 0 and distances[0] < reid_distance:
                             huid = metadata[0]["huid"]
                             distance = distances[0]
                         else:
-                            huid = self._insert_huid_crop_to_db(crop)
+                            huid = self._insert_huid_crop_to_db(crop, embedding=embedding)
 
                         # face not seen in this video yet
                         if huid not in current_huids:
                             current_huids.add(huid)
 
-                        trackid_to_huid[trackid] = huid
-                        huid_to_trackids.setdefault(huid, set()).add(trackid)
-                    else:
-                        huid = trackid_to_huid[trackid]
+                        active_tracks.add(trackid, huid, step)
+
+                    timeline_builder.add(step, trackid, huid, box, conf)
+
+                    if step % gallery_every == 0:
+                        self._upsert_crop_to_gallery_in_db_if_novel(huid, crop, embedding)
+
+                count(FRAMES_TOTAL, "frames")
 
-                    if step % 10 == 0:
-                        self._upsert_crop_to_gallery_in_db_if_novel(huid, crop)
+                if progress is not None:
+                    progress.frame_processed(step + 1, total_frames, len(current_huids))
 
-            return current_huids
+                if step - last_memory_check >= memory_check_every:
+                    last_memory_check = step
+                    memory_guard.check()
 
+                    pruned = active_tracks.prune(step)
+                    if pruned > 0:
+                        count(TRACKS_PRUNED_TOTAL, "tracks_pruned", pruned)
+
+            memory_report = memory_guard.report(timeline_bytes=timeline_builder.nbytes(), live_tracks=len(active_tracks))
+            logger.info(f"Tracking of {video_path} memory {memory_report}")
+
+            return timeline_builder.build()
+
+        # the job must fail with the cause, not with whatever trips over a missing timeline later
         except (FileNotFoundError,IOError) as e:
             logger.error(f"Some IO Error occured [{e}] while processing video {video_path}")
+            raise VideoTrackingFailed(f"IO error while processing video: {e}") from e
         except ValueError as e:
             logger.error(f"Internal Error occured [{e}] while processing video {video_path}")
+            raise VideoTrackingFailed(f"Internal error while processing video: {e}") from e
         except ChromaError as e:
             logger.error(f"Unexpected Failure on Chroma DB , error [{e}] while processing video {video_path}")
+            raise VideoTrackingFailed(f"Chroma DB failure while processing video: {e}") from e
         except Exception as e:
             logger.error(f"Internal Failure, Error [{e}] while processing video {video_path}")
+            raise VideoTrackingFailed(f"Internal failure while processing video: {e}") from e
+        finally:
+            if cache_writer is not None:
+                cache_writer.close()
 
 
-    def check_alert(self, video_public_id):
+    async def check_alert(self, video_public_id):
 
-        url = "https://security.memories.ai/v1/understand/upload"
+        url = app_settings.MEMORIES_AI_UPLOAD_URL
         headers = {"Authorization": "sk-c8edcd8a5c1f63fd7fb0c11d752ec559"}
 
         alert_prompt = """
@@ -275,7 +573,9 @@ class VideoAnalysisService:
 
         try:
             logger.info(f"Sending Caption API request for alert analysis for video [{video_public_id}]")
-            response = requests.post(url, json=data, headers=headers)
+            response = await get_async_http_client().post(
+                url, json=data, headers=headers, limiter=memories_ai_limiter, priority=RequestPriority.Alert
+            )
             resp = response.json()
             msg = resp.get("msg", "")
             if msg == "success":
@@ -284,13 +584,13 @@ class VideoAnalysisService:
             else:
                 logger.error(f"Caption API request for alert analysis for video [{video_public_id}]  failed with error msg {msg}")
                 return False
-        except requests.exceptions.RequestException as e:
+        except (httpx.HTTPError, ValueError) as e:
             logger.error(f"check_alert() failed with error {e} for video_id {video_public_id}")
             return False
         
-    def annotate_human(self,video_public_id: str, video_url: str, huid: str, img_url: str) -> bool:
+    async def annotate_human(self,video_public_id: str, video_url: str, huid: str, img_url: str) -> bool:
 
-        url = "https://security.memories.ai/v1/understand/upload"
+        url = app_settings.MEMORIES_AI_UPLOAD_URL
         headers = {"Authorization": "sk-c8edcd8a5c1f63fd7fb0c11d752ec559"}
 
         user_prompt_for_reid = """
@@ -312,7 +612,9 @@ class VideoAnalysisService:
 
         try:
             logger.info(f"Sending Caption API request for human analysis for video [{video_public_id}]")
-            response = requests.post(url, json=data, headers=headers)
+            response = await get_async_http_client().post(
+                url, json=data, headers=headers, limiter=memories_ai_limiter, priority=RequestPriority.Annotation
+            )
             resp = response.json()
             msg = resp.get("msg", "")
             if msg == "success":
@@ -322,27 +624,142 @@ class VideoAnalysisService:
                 logger.error(f"Caption API request for human analysis for video [{video_public_id}]  failed with error msg {msg}")
                 return False
             
-        except requests.exceptions.RequestException as e:
+        except (httpx.HTTPError, ValueError) as e:
             logger.error(f"annotatehuman() failed with error {e} for video [{video_public_id}]")
             return False
 
 
-    def analyse_people_from_video(self, video_public_id):
+    def _prepare_person_clip(self, video_public_id, video_file_path, huid, frame_intervals, asset_mgmt_service):
+        """
+        Clip of the parts of the video where the huid appears, returns the downloadable clip url
+        or None when the full video should be used instead (clip wouldn't be meaningfully shorter)
+        """
+
+        if not app_settings.PERSON_CLIPS_ENABLED or len(frame_intervals) == 0:
+            return None
+
+        clip_service = VideoClipService()
+        fps, total_frames, _, _ = self._get_video_properties(video_file_path)
+
+        segments = clip_service.build_segments(frame_intervals, fps, total_frames)
+        clip_frames = sum(end - start + 1 for start, end in segments)
+
+        if clip_frames >= app_settings.CLIP_MAX_FRACTION * total_frames:
+            return None
+
+        segments_in_seconds = [(start / fps, (end + 1) / fps) for start, end in segments]
+
+        if app_settings.PROXY_INGEST_ENABLED:
+            # the local file is the low resolution proxy, have Cloudinary cut the clip out of the original,
+            # the clip is a rendition of the video itself
+            clip_public_id = video_public_id
+            clip_url = asset_mgmt_service.get_original_clip_cloudinary_url(video_public_id, segments_in_seconds)
+        else:
+            clip_file_path = build_local_uri_for_clip(video_public_id, huid)
+            clip_service.cut_clip(video_file_path, segments, clip_file_path)
+
+            clip_public_id, _ = asset_mgmt_service.upload_asset(clip_file_path, "video")
+            clip_url = asset_mgmt_service.get_downloadable_cloudinary_url(clip_public_id, "video")
+
+        db_conn = open_sqllite_db_connection()
+        try:
+            clip_service.register_person_clip(video_public_id, huid, clip_public_id, segments_in_seconds, db_conn)
+        finally:
+            db_conn.close()
+
+        logger.info(f"Clip of huid [{huid}] covers {clip_frames}/{total_frames} frames of video [{video_public_id}]")
+
+        return clip_url
+
+    def _unregister_person_clip(self, video_public_id, huid):
+
+        db_conn = open_sqllite_db_connection()
+        try:
+            VideoClipService().unregister_person_clip(video_public_id, huid, db_conn)
+        finally:
+            db_conn.close()
+
+    async def _annotate_person_from_video(
+        self, video_public_id, video_url, huid, timeline: TrackTimeline, asset_mgmt_service, semaphore, progress: AnalysisProgressReporter | None = None
+    ):
+        """
+        Get (or upload) the thumbnail of a huid and ask for its annotation, failures are contained to this huid
+        """
+
+        async with semaphore:
+            try:
+                # crop scan and cloudinary upload are blocking, run them in the default executor
+                downloadable_img_url = await asyncio.to_thread(
+                    self._get_or_upload_huid_thumbnail, huid, asset_mgmt_service, video_public_id, timeline
+                )
+
+                # only send the parts of the footage where the person appears, fall back to the full video on failure
+                try:
+                    clip_url = await asyncio.to_thread(
+                        self._prepare_person_clip,
+                        video_public_id,
+                        build_local_uri_for_video(video_public_id),
+                        huid,
+                        timeline.get_appearance_intervals(huid),
+                        asset_mgmt_service,
+                    )
+                except Exception as e:
+                    logger.error(f"Failed to prepare clip of huid [{huid}] for video [{video_public_id}] due to error {e}, using full video")
+                    clip_url = None
+
+                # on the full video, the clip of an earlier analysis must not remap the timestamps of the callback
+                if clip_url is None:
+                    await asyncio.to_thread(self._unregister_person_clip, video_public_id, huid)
+
+                if progress is not None:
+                    progress.external_call_started()
+
+                accepted = False
+
+                try:
+                    accepted = await self.annotate_human(video_public_id, clip_url or video_url, huid, downloadable_img_url)
+                finally:
+                    # a raising (or cancelled) call must not stay pending forever
+                    if progress is not None:
+                        progress.external_call_finished(accepted)
+
+                return accepted
+
+            except Exception as e:
+                logger.error(f"Failed to analyse huid [{huid}] for video [{video_public_id}] due to error {e}")
+                return False
+
+    async def analyse_people_from_video(self, video_public_id, progress: AnalysisProgressReporter | None = None):
 
         video_file_path = build_local_uri_for_video(video_public_id)
 
         logger.info(f"Extracting Crops and HUID from the video {video_file_path}")
 
-        huids = self._get_and_insert_huids_from_video(video_file_path)
+        # tracking is CPU/GPU bound, keep it off the event loop so outbound calls can progress meanwhile
+        detection_cache_folder = build_local_uri_for_detection_cache(video_public_id) if app_settings.DETECTION_CACHE_ENABLED else None
+
+        timeline = await asyncio.to_thread(self._get_and_insert_huids_from_video, video_file_path, detection_cache_folder, progress)
 
-        logger.info(f"Their are {len(huids)} unique people in video [{video_file_path}]")
+        logger.info(f"Their are {len(timeline.huids)} unique people in video [{video_file_path}]")
+
+        # keep the tracking results around for the API, later stages and re-analysis
+        try:
+            timeline.save(build_local_uri_for_tracks(video_public_id))
+        except OSError as e:
+            logger.error(f"Failed to store track timeline for video [{video_public_id}] due to error {e}")
+
+        if progress is not None:
+            progress.set_stage(AnalysisStage.Annotating)
 
         asset_mgmt_service = AssetManagementService()
         downloadable_video_url = asset_mgmt_service.get_downloadable_cloudinary_url(video_public_id,"video")
 
-        for huid in huids:
-            local_uri = self._select_best_local_crop_for_huid(huid)
-            public_id, url = asset_mgmt_service.upload_asset(local_uri,"image")
-            downloadable_img_url = asset_mgmt_service.get_downloadable_cloudinary_url(public_id, "image")
+        # bounded fan out, every huid is independent so their round trips can overlap
+        semaphore = asyncio.Semaphore(app_settings.PERSON_ANALYSIS_CONCURRENCY)
+
+        results = await asyncio.gather(*(
+            self._annotate_person_from_video(video_public_id, downloadable_video_url, huid, timeline, asset_mgmt_service, semaphore, progress)
+            for huid in timeline.huids
+        ))
 
-            self.annotate_human(video_public_id,downloadable_video_url,huid,downloadable_img_url)
+        logger.info(f"Per person analysis requested for {sum(results)}/{len(results)} people in video [{video_public_id}]")
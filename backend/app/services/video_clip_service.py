@@ -0,0 +1,172 @@
+import json
+import logging
+import os
+from pathlib import Path
+import sqlite3
+from typing import List, Tuple
+
+import cv2
+
+from app.config import app_settings
+from app.exceptions import DBOperationFailed, GenericFSIOError
+from app.utils import timestamp_to_seconds
+
+logger = logging.getLogger(__name__)
+
+
+class VideoClipService:
+    """
+    Cuts the parts of a video where a person appears into a single sub clip, and maps the timestamps
+    of the clip back to the original video timeline
+    """
+
+    def build_segments(self, frame_intervals: List[Tuple[int, int]], fps: float, total_frames: int) -> List[Tuple[int, int]]:
+        """
+        Pad every appearance interval, merge the ones that overlap or are close and return them as (start_frame, end_frame) inclusive
+        """
+
+        padding = int(app_settings.CLIP_PADDING_SECONDS * fps)
+        merge_gap = int(app_settings.CLIP_MERGE_GAP_SECONDS * fps)
+
+        segments: List[List[int]] = []
+
+        for start, end in sorted(frame_intervals):
+            start = max(0, start - padding)
+            end = min(total_frames - 1, end + padding)
+
+            if len(segments) > 0 and start - segments[-1][1] <= merge_gap:
+                segments[-1][1] = max(segments[-1][1], end)
+            else:
+                segments.append([start, end])
+
+        return [(start, end) for start, end in segments]
+
+    def cut_clip(self, video_file_path, segments: List[Tuple[int, int]], clip_file_path):
+        """
+        Write the given frame segments of the video one after another into clip_file_path
+        """
+
+        try:
+            os.makedirs(Path(clip_file_path).parent.resolve(), exist_ok=True)
+        except Exception as e:
+            logger.error(f"Failed to create path for clip {clip_file_path} due to error {e}")
+            raise GenericFSIOError()
+
+        video_capture = cv2.VideoCapture(video_file_path)
+
+        if not video_capture.isOpened():
+            raise IOError(f"Error: Could not open video file {video_file_path}")
+
+        fps = video_capture.get(cv2.CAP_PROP_FPS)
+
+        if not fps > 0:
+            fps = app_settings.VIDEO_DEFAULT_FPS
+        width = int(video_capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(video_capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+        writer = cv2.VideoWriter(clip_file_path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+
+        try:
+            for start, end in segments:
+                video_capture.set(cv2.CAP_PROP_POS_FRAMES, start)
+
+                for _ in range(start, end + 1):
+                    ret, frame = video_capture.read()
+
+                    if not ret:
+                        break
+
+                    writer.write(frame)
+        finally:
+            writer.release()
+            video_capture.release()
+
+    def register_person_clip(self, video_public_id, huid, clip_public_id, segments_in_seconds, db_conn):
+        """
+        Remember which parts of the original video a person's clip is made of, needed to remap the callback timestamps
+        """
+
+        try:
+            cursor = db_conn.cursor()
+
+            sql_cmd = """
+            INSERT OR REPLACE INTO person_clips (huid, video_public_id, clip_public_id, segments)
+            VALUES (?,?,?,?)
+            """
+
+            cursor.execute(sql_cmd, (huid, video_public_id, clip_public_id, json.dumps(segments_in_seconds)))
+            db_conn.commit()
+
+        except sqlite3.Error as e:
+            logger.error(f"Failed to register clip of huid [{huid}] for video [{video_public_id}] due to error {e}")
+
+            if db_conn:
+                db_conn.rollback()
+
+            raise DBOperationFailed()
+
+    def unregister_person_clip(self, video_public_id, huid, db_conn):
+        """
+        Forget the clip of a person annotated on the full video, a clip of an earlier analysis would remap its timestamps
+        """
+
+        try:
+            cursor = db_conn.cursor()
+            cursor.execute("DELETE FROM person_clips WHERE video_public_id = ? AND huid = ?", (video_public_id, huid))
+            db_conn.commit()
+
+        except sqlite3.Error as e:
+            logger.error(f"Failed to unregister clip of huid [{huid}] for video [{video_public_id}] due to error {e}")
+
+            if db_conn:
+                db_conn.rollback()
+
+            raise DBOperationFailed()
+
+    def get_person_clip_segments(self, video_public_id, huid, cursor):
+        """
+        (start, end) seconds in the original video of each segment of the person's clip, None if the full video was used
+        """
+
+        sql_cmd = """
+        SELECT segments
+        FROM person_clips
+        WHERE video_public_id = ? AND huid = ?
+        """
+
+        cursor.execute(sql_cmd, (video_public_id, huid))
+        res = cursor.fetchone()
+
+        if res is None:
+            return None
+
+        return json.loads(res[0])
+
+    def remap_clip_timestamp(self, timestamp: str, segments_in_seconds) -> str:
+        """
+        Convert a MM:SS timestamp of the clip into the MM:SS timestamp of the original video
+        """
+
+        clip_seconds = timestamp_to_seconds(timestamp)
+
+        if clip_seconds is None:
+            return timestamp
+
+        offset = 0.0
+        original_seconds = None
+
+        for start, end in segments_in_seconds:
+            duration = end - start
+
+            if clip_seconds <= offset + duration:
+                original_seconds = start + (clip_seconds - offset)
+                break
+
+            offset += duration
+
+        # past the end of the clip (rounding), clamp to the end of the last segment
+        if original_seconds is None:
+            original_seconds = segments_in_seconds[-1][1]
+
+        original_seconds = int(round(original_seconds))
+        return f"{original_seconds // 60:02d}:{original_seconds % 60:02d}"
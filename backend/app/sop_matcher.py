@@ -0,0 +1,193 @@
+import logging
+import math
+import re
+from typing import List
+
+import numpy as np
+
+from app.api.api_schema_helper import SopResult
+from app.config import app_settings
+from app.utils import timestamp_to_seconds
+
+logger = logging.getLogger(__name__)
+
+STOP_WORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "has", "he", "her", "his", "in",
+    "is", "it", "its", "of", "on", "or", "she", "that", "the", "their", "them", "then", "they", "this",
+    "to", "was", "were", "with", "all", "each", "any", "into", "up",
+}
+
+NOT_DONE_TIMESTAMP = "00:00"
+
+
+def parse_sop_steps(sop_checks: str) -> List[str]:
+    """
+    Split the sopdefs text ("1) ... 2) ...") into its steps, without the serial numbers
+    """
+
+    return re.findall(r"^\s*\d+\)\s*(.+?)\s*$", sop_checks, re.MULTILINE)
+
+
+def _stem(token):
+
+    for suffix in ("ing", "ed", "es", "s"):
+        if len(token) > len(suffix) + 2 and token.endswith(suffix):
+            token = token[:-len(suffix)]
+            break
+
+    # scanning -> scann -> scan
+    if len(token) > 3 and token[-1] == token[-2] and token[-1] not in "aeiou":
+        token = token[:-1]
+
+    return token
+
+
+def _tokenize(text):
+    return [_stem(t) for t in re.findall(r"[a-z]+", text.lower()) if t not in STOP_WORDS]
+
+
+def _tfidf_similarity(steps: List[str], actions: List[str]) -> np.ndarray:
+    """
+    Cosine similarity matrix (steps x actions) of TF-IDF vectors, the vocabulary and IDF come from the SOP steps
+    so words that appear in every step (customer, employee ...) carry little weight
+    """
+
+    step_tokens = [_tokenize(s) for s in steps]
+    action_tokens = [_tokenize(a) for a in actions]
+
+    vocab = {token: i for i, token in enumerate(sorted({t for tokens in step_tokens for t in tokens}))}
+
+    def term_counts(tokens_list):
+        counts = np.zeros((len(tokens_list), len(vocab)), dtype=np.float32)
+        for row, tokens in enumerate(tokens_list):
+            for t in tokens:
+                if t in vocab:
+                    counts[row, vocab[t]] += 1
+        return counts
+
+    step_tf = term_counts(step_tokens)
+    action_tf = term_counts(action_tokens)
+
+    document_frequency = np.count_nonzero(step_tf, axis=0)
+    idf = np.log((1 + len(steps)) / (1 + document_frequency)) + 1
+
+    step_vecs = step_tf * idf
+    action_vecs = action_tf * idf
+
+    step_vecs /= np.linalg.norm(step_vecs, axis=1, keepdims=True) + 1e-8
+    action_vecs /= np.linalg.norm(action_vecs, axis=1, keepdims=True) + 1e-8
+
+    return step_vecs @ action_vecs.T
+
+
+def _align_steps_in_order(similarity: np.ndarray, min_score: float) -> List[int]:
+    """
+    Assign every step to at most one action maximising the total similarity, such that the assigned
+    actions never go back in time (a single action may satisfy consecutive steps). -1 means unassigned.
+    """
+
+    n_steps, n_actions = similarity.shape
+
+    # best[k + 1] = best total so far with last assigned action k (k = -1 nothing assigned yet)
+    best = np.full(n_actions + 1, -np.inf)
+    best[0] = 0.0
+    back = np.zeros((n_steps, n_actions + 1), dtype=np.int64)
+
+    for i in range(n_steps):
+        scores = np.where(similarity[i] >= min_score, similarity[i], -np.inf)
+
+        # best predecessor ending at or before every action
+        prefix_arg = np.zeros(n_actions + 1, dtype=np.int64)
+        for k in range(1, n_actions + 1):
+            prefix_arg[k] = k if best[k] > best[prefix_arg[k - 1]] else prefix_arg[k - 1]
+        prefix_best = best[prefix_arg]
+
+        new_best = best.copy()              # skip this step, keep the last assigned action
+        back[i] = np.arange(n_actions + 1)
+
+        assign = prefix_best[1:] + scores   # assign this step to action j, predecessor <= j
+        improved = assign > new_best[1:]
+        new_best[1:][improved] = assign[improved]
+        back[i, 1:][improved] = -(prefix_arg[1:][improved] + 1) # negative marks an assignment
+
+        best = new_best
+
+    assignment = [-1] * n_steps
+    state = int(np.argmax(best))
+
+    for i in reversed(range(n_steps)):
+        prev = back[i, state]
+        if prev < 0:
+            assignment[i] = state - 1
+            state = -prev - 1
+        else:
+            state = prev
+
+    return assignment
+
+
+def match_sop_locally(person_actions: List[dict], sop_checks: str):
+    """
+    Verify the SOP steps against the person's actions without an LLM.
+    Returns (sop_results, ambiguous_step_indices), steps listed as ambiguous should be escalated to the LLM.
+    """
+
+    steps = parse_sop_steps(sop_checks)
+
+    if len(steps) == 0:
+        return [], []
+
+    if len(person_actions) == 0:
+        results = [
+            SopResult(start=NOT_DONE_TIMESTAMP, end=NOT_DONE_TIMESTAMP, sop_event=step, done=False, confidence=1.0)
+            for step in steps
+        ]
+        return results, []
+
+    actions = sorted(person_actions, key=lambda a: timestamp_to_seconds(a.get("start"), default=math.inf))
+
+    accept_score = app_settings.SOP_MATCH_ACCEPT_SCORE
+    reject_score = app_settings.SOP_MATCH_REJECT_SCORE
+
+    similarity = _tfidf_similarity(steps, [a.get("action", "") for a in actions])
+    assignment = _align_steps_in_order(similarity, reject_score)
+
+    results: List[SopResult] = []
+    ambiguous: List[int] = []
+
+    for i, step in enumerate(steps):
+        j = assignment[i]
+
+        if j >= 0 and similarity[i, j] >= accept_score:
+            results.append(SopResult(
+                start=actions[j].get("start", NOT_DONE_TIMESTAMP),
+                end=actions[j].get("end", NOT_DONE_TIMESTAMP),
+                sop_event=step,
+                done=True,
+                confidence=round(float(similarity[i, j]), 3),
+            ))
+            continue
+
+        best_score = float(similarity[i].max())
+
+        if best_score < reject_score:
+            results.append(SopResult(
+                start=NOT_DONE_TIMESTAMP,
+                end=NOT_DONE_TIMESTAMP,
+                sop_event=step,
+                done=False,
+                confidence=round(1 - best_score, 3),
+            ))
+            continue
+
+        # somewhere in between, let the LLM decide
+        ambiguous.append(i)
+        results.append(SopResult(
+            start=NOT_DONE_TIMESTAMP,
+            end=NOT_DONE_TIMESTAMP,
+            sop_event=step,
+            done=False,
+            confidence=None,
+        ))
+
+    return results, ambiguous
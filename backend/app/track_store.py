@@ -0,0 +1,197 @@
+from array import array
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+TRACK_COLUMNS = ["frame", "track_id", "box", "conf"]
+
+
+class TrackTimelineBuilder:
+    """
+    Accumulates every tracked detection of a video in compact typed arrays while the video is being processed
+    """
+
+    def __init__(self, fps: float):
+        self.fps = fps
+        self.huid_index: Dict[str, int] = dict()
+
+        self.frames = array("i")
+        self.track_ids = array("i")
+        self.huid_ids = array("i")
+        self.boxes = array("h")
+        self.confs = array("f")
+
+    def add(self, frame_idx: int, track_id: int, huid: str, box, conf: float):
+
+        if huid not in self.huid_index:
+            self.huid_index[huid] = len(self.huid_index)
+
+        self.frames.append(frame_idx)
+        self.track_ids.append(int(track_id))
+        self.huid_ids.append(self.huid_index[huid])
+        self.boxes.extend(int(np.clip(v, -32768, 32767)) for v in box)
+        self.confs.append(float(conf))
+
+    def nbytes(self):
+        return sum(column.itemsize * len(column) for column in (self.frames, self.track_ids, self.huid_ids, self.boxes, self.confs))
+
+    def build(self) -> "TrackTimeline":
+        """
+        Sort the detections by (huid, frame) so every huid owns one contiguous, time ordered slice of the columns
+        """
+
+        frames = np.frombuffer(self.frames, dtype=np.int32)
+        huid_ids = np.frombuffer(self.huid_ids, dtype=np.int32)
+
+        order = np.lexsort((frames, huid_ids))
+        offsets = np.searchsorted(huid_ids[order], np.arange(len(self.huid_index) + 1))
+
+        huids = [None] * len(self.huid_index)
+        for huid, i in self.huid_index.items():
+            huids[i] = huid
+
+        return TrackTimeline(
+            huids=huids,
+            offsets=offsets.astype(np.int64),
+            columns={
+                "frame": frames[order],
+                "track_id": np.frombuffer(self.track_ids, dtype=np.int32)[order],
+                "box": np.frombuffer(self.boxes, dtype=np.int16).reshape(-1, 4)[order],
+                "conf": np.frombuffer(self.confs, dtype=np.float32)[order].astype(np.float16),
+            },
+            fps=self.fps,
+        )
+
+
+class ActiveTracks:
+    """
+    trackid -> huid of the tracks currently alive in a video. BoT-SORT never revives a track lost for longer than its
+    track_buffer, so tracks unseen for max_idle_frames are dropped and the state stays bounded by the scene, not the video
+    """
+
+    def __init__(self, max_idle_frames):
+        self.max_idle_frames = max_idle_frames
+        self.trackid_to_huid: Dict[int, str] = dict()
+        self.last_seen: Dict[int, int] = dict()
+
+    def __len__(self):
+        return len(self.trackid_to_huid)
+
+    def get(self, trackid, frame_idx):
+        """
+        huid of a live track (and mark it seen), None for a track not seen before
+        """
+
+        huid = self.trackid_to_huid.get(trackid)
+
+        if huid is not None:
+            self.last_seen[trackid] = frame_idx
+
+        return huid
+
+    def add(self, trackid, huid, frame_idx):
+        self.trackid_to_huid[trackid] = huid
+        self.last_seen[trackid] = frame_idx
+
+    def prune(self, frame_idx):
+        """
+        Drop the tracks idle for more than max_idle_frames, returns how many were dropped
+        """
+
+        idle = [trackid for trackid, last_seen in self.last_seen.items() if frame_idx - last_seen > self.max_idle_frames]
+
+        for trackid in idle:
+            del self.trackid_to_huid[trackid]
+            del self.last_seen[trackid]
+
+        return len(idle)
+
+
+class TrackTimeline:
+    """
+    Column store of the tracked detections of one video (frame, track_id, box, conf) indexed by huid,
+    persisted as one .npy file per column so it can be memory mapped
+    """
+
+    def __init__(self, huids: List[str], offsets: np.ndarray, columns: Dict[str, np.ndarray], fps: float):
+        self.huids = huids
+        self.offsets = offsets
+        self.columns = columns
+        self.fps = fps
+
+        self.huid_index = {huid: i for i, huid in enumerate(huids)}
+
+    def save(self, folder):
+
+        os.makedirs(folder, exist_ok=True)
+
+        for name in TRACK_COLUMNS:
+            np.save(f"{folder}/{name}.npy", self.columns[name])
+
+        np.save(f"{folder}/offsets.npy", self.offsets)
+
+        with open(f"{folder}/meta.json", "w") as f:
+            json.dump({"huids": self.huids, "fps": self.fps}, f)
+
+    @classmethod
+    def load(cls, folder):
+        """
+        Memory map a saved timeline, raises FileNotFoundError if the video has no timeline
+        """
+
+        if not Path(f"{folder}/meta.json").exists():
+            raise FileNotFoundError(f"No track timeline at {folder}")
+
+        with open(f"{folder}/meta.json") as f:
+            meta = json.load(f)
+
+        columns = {name: np.load(f"{folder}/{name}.npy", mmap_mode="r") for name in TRACK_COLUMNS}
+        offsets = np.load(f"{folder}/offsets.npy")
+
+        return cls(meta["huids"], offsets, columns, meta["fps"])
+
+    def _get_rows(self, huid, start_frame=None, end_frame=None) -> slice:
+
+        if huid not in self.huid_index:
+            return slice(0, 0)
+
+        i = self.huid_index[huid]
+        lo, hi = int(self.offsets[i]), int(self.offsets[i + 1])
+
+        # frames are sorted within a huid slice, so a time range is a binary search away
+        frames = self.columns["frame"][lo:hi]
+
+        if start_frame is not None:
+            lo += int(np.searchsorted(frames, start_frame, side="left"))
+        if end_frame is not None:
+            hi = int(self.offsets[i]) + int(np.searchsorted(frames, end_frame, side="right"))
+
+        return slice(lo, max(lo, hi))
+
+    def get_detections(self, huid, start_frame=None, end_frame=None) -> Dict[str, np.ndarray]:
+
+        rows = self._get_rows(huid, start_frame, end_frame)
+        return {name: self.columns[name][rows] for name in TRACK_COLUMNS}
+
+    def get_appearance_intervals(self, huid, max_gap_frames=1, start_frame=None, end_frame=None) -> List[Tuple[int, int]]:
+        """
+        Inclusive (start_frame, end_frame) intervals in which the huid is visible, gaps up to max_gap_frames are bridged
+        """
+
+        frames = np.unique(self.columns["frame"][self._get_rows(huid, start_frame, end_frame)])
+
+        if len(frames) == 0:
+            return []
+
+        breaks = np.flatnonzero(np.diff(frames) > max_gap_frames)
+
+        starts = frames[np.concatenate(([0], breaks + 1))]
+        ends = frames[np.concatenate((breaks, [len(frames) - 1]))]
+
+        return [(int(s), int(e)) for s, e in zip(starts, ends)]
@@ -1,13 +1,23 @@
 from itertools import combinations
-import json
 import logging
 import os
 from pathlib import Path
 import random
+import time
+from typing import List
 
 import cv2
 import numpy as np
-from app.config import APP_ROOT_DIR, chat
+import pydantic
+from google.genai import errors as genai_errors
+from google.genai import types
+
+from app.api.api_schema_helper import AlertResult, PersonAction, PersonIdSOPResultsMap, SopResult
+from app.config import APP_ROOT_DIR, app_settings, gemini_client
+from app.constants import RequestPriority
+from app.llm_cache import llm_response_cache
+from app.metrics import record_external_call, timed_stage
+from app.rate_limit import gemini_limiter
 
 logger = logging.getLogger(__name__)
 
@@ -15,11 +25,26 @@ logger = logging.getLogger(__name__)
 def build_local_uri_for_video(video_public_id):
     return f"{APP_ROOT_DIR}/videos/{video_public_id}.mp4"
 
+def build_local_uri_for_clip(video_public_id, huid):
+    return f"{APP_ROOT_DIR}/clips/{video_public_id}/{huid}.mp4"
+
+def build_local_uri_for_tracks(video_public_id):
+    return f"{APP_ROOT_DIR}/tracks/{video_public_id}"
+
+def build_local_uri_for_detection_cache(video_public_id):
+    return f"{APP_ROOT_DIR}/detection_cache/{video_public_id}"
+
+def build_local_uri_for_profile(video_public_id):
+    return f"{APP_ROOT_DIR}/profiles/{video_public_id}"
+
 def build_uri_for_huid(huid,folder):
     folder_uri = f"{APP_ROOT_DIR}/crops/{folder}/{huid}"
     os.makedirs(folder_uri, exist_ok=True)
     return folder_uri
 
+def build_uri_for_thumbnail(video_public_id, name):
+    return f"{APP_ROOT_DIR}/crops/thumbnails/{video_public_id}/{name}.jpg"
+
 def build_uri_for_crop(huid,id,folder):
 
     valid_folders = ["huid_crops","trash_crops"]
@@ -35,12 +60,24 @@ def build_uri_for_crop(huid,id,folder):
         raise ValueError(f"folder must be any of the valid folders: {valid_folders}")
     
 def store_crop_at_path(crop,uri):
-    os.makedirs(Path(uri).parent.resolve(), exist_ok=True)
-    cv2.imwrite(uri, crop)
+    with timed_stage("crop_write"):
+        os.makedirs(Path(uri).parent.resolve(), exist_ok=True)
+        cv2.imwrite(uri, crop)
     
 def generate_unique_id() -> str:
     # using uuid will be better, ToDo -> will do it later
     return str(random.randint(1, 1000000000))
+
+def timestamp_to_seconds(timestamp, default=None):
+    """
+    Seconds of a MM:SS timestamp as returned by the LLM, default if it isn't one
+    """
+
+    try:
+        minutes, seconds = timestamp.split(":")
+        return int(minutes) * 60 + int(seconds)
+    except (AttributeError, ValueError):
+        return default
     
 def select_most_diverse_subset(embeddings, k):
     """
@@ -86,37 +123,88 @@ def select_most_diverse_subset(embeddings, k):
 
     return best_subset_indices
 
+# Response schema enforced by the LLM (JSON mode) and used to validate what it returns
+STRUCTURED_OUTPUT_SCHEMAS = {
+    "annotate": List[PersonAction],
+    "alert": List[AlertResult],
+    "sop": List[SopResult],
+    "sop_batch": List[PersonIdSOPResultsMap],
+}
+
+# Bump whenever the prompts or schemas below change, it invalidates the cached LLM outputs
+PROMPT_TEMPLATE_VERSION = 3
+
+# Alerts are more urgent than per person annotation, bulk SOP verification can wait the most
+PROMPT_PRIORITIES = {
+    "alert": RequestPriority.Alert,
+    "annotate": RequestPriority.Annotation,
+    "sop": RequestPriority.Sop,
+    "sop_batch": RequestPriority.Sop,
+}
+
+def _generate_content_with_rate_limit(prompt, schema, priority):
+    """
+    Call the LLM through the shared gemini limiter, throttled calls (429 / 5xx) are requeued at the same priority
+    """
+
+    max_requeues = app_settings.RATE_LIMIT_MAX_REQUEUES
+
+    for requeues in range(max_requeues + 1):
+
+        gemini_limiter.acquire(priority)
+        throttled = False
+        start = time.perf_counter()
+
+        try:
+            response = gemini_client.models.generate_content(
+                model=app_settings.GEMINI_MODEL,
+                contents=prompt,
+                config=types.GenerateContentConfig(
+                    response_mime_type="application/json",
+                    response_schema=schema,
+                ),
+            )
+
+            record_external_call("gemini", time.perf_counter() - start)
+            return response
+
+        except genai_errors.APIError as e:
+            record_external_call("gemini", time.perf_counter() - start, error=str(e.code))
+            throttled = e.code == 429 or e.code >= 500
+
+            if not throttled or requeues == max_requeues:
+                raise
+
+            logger.warning(f"LLM call throttled with code {e.code}, requeued ({requeues + 1}/{max_requeues})")
+
+        finally:
+            gemini_limiter.release(throttled)
+
+        time.sleep(random.uniform(0, min(app_settings.HTTP_BACKOFF_MAX_SECONDS, app_settings.HTTP_BACKOFF_BASE_SECONDS * (2 ** requeues))))
+
 def get_structured_output(response_text: str, prompt_type: str, sop_events = None):
+    """
+    One shot (stateless) LLM call converting free text into the pydantic schema of prompt_type,
+    returns a list of dicts or None on failure
+    """
 
     annotate_prompt = f"""
     Given the following text:
     {response_text}
 
-    Understand and Convert it to a list of structured JSON object following the specific pattern like this:
-    {{
-        "start": MM:SS,
-        "end": MM:SS,
-        "action": str
-    }}
+    Understand and Convert it to a list of structured objects, one per action, where
+    start and end are MM:SS timestamps and action describes what happened.
     Action should not contain any person's name. Derive everything exactly from the input text that I'm providing.
-    IMPORTANT: Respond with *only* the raw JSON object
-    and no other text, markdown, or explanation.
     """
 
     alert_prompt = f"""
     Given the following text:
     {response_text}
 
-    Understand and Convert it to a list of structured JSON object following the specific pattern like this:
-    {{
-        "start": MM:SS,
-        "end": MM:SS,
-        "alert_level": str - warning, high, critical,
-        "description": str
-    }}
+    Understand and Convert it to a list of structured objects, one per event, where
+    start and end are MM:SS timestamps, alert_level is one of warning, high, critical
+    and description describes the event.
     Derive everything exactly from the input text that I'm providing
-    IMPORTANT: Respond with *only* the raw JSON object
-    and no other text, markdown, or explanation.
     """
 
     sop_prompt = ""
@@ -129,45 +217,64 @@ def get_structured_output(response_text: str, prompt_type: str, sop_events = Non
         and the SOP Events:
         {sop_events}
 
-        Understand and Convert it to a list of structured JSON object following the specific pattern like this:
-        {{
-            "start": MM:SS (should be exactly same as present in response string provided, if event never happened set it 00:00),
-            "end": MM:SS (should be exactly same as present in response string provided, if event never happened set it 00:00)
-            "sop_event": str (should exactly match from what is provided, and in the same order as SOP events given, no need of serial Number),
-            "done": bool (False - if that sop event never happened True Otherwise)
-        }}
+        Understand and Convert it to a list of structured objects, one per SOP event, where
+        start and end are MM:SS timestamps (should be exactly same as present in response string provided, if event never happened set it 00:00),
+        sop_event should exactly match from what is provided, and in the same order as SOP events given, no need of serial Number,
+        done is False if that sop event never happened True Otherwise.
         Derive everything exactly from the input text that I'm providing
-        IMPORTANT: Respond with *only* the raw JSON object
-        and no other text, markdown, or explanation.
         """
-    try: 
-        final_str = None
-        if prompt_type == "annotate":
-            response = chat.send_message(annotate_prompt)
-            final_str = response.text
-
-        elif prompt_type == "sop":
-            response = chat.send_message(sop_prompt)
-            final_str = response.text
-
-        elif prompt_type == "alert":
-            response = chat.send_message(alert_prompt)
-            final_str = response.text
-        else:
-            logger.error("unknown prompt type provided")
-            return ""
-
-        # --- Key Changes Below ---
-
-        # Clean the string, just in case the AI adds markdown backticks
-        if final_str.startswith("```json"):
-            final_str = final_str[7:-3].strip()
-
-        logger.info(f"Structured Resp - {final_str}")
-
-        json_object = json.loads(final_str)
-        return json_object
-    except json.decoder.JSONDecodeError as e:
-        logger.error(f"JSON decoding failed due to error {e}")
+
+    sop_batch_prompt = ""
+
+    if sop_events is not None:
+        sop_batch_prompt = f"""
+        Given the following list of people, each with a person_id and the actions they performed:
+        {response_text}
+
+        and the SOP Events:
+        {sop_events}
+
+        Verify the SOP Events independently for every person and return one entry per person_id with its sop_results,
+        a list of structured objects, one per SOP event, where
+        start and end are MM:SS timestamps (should be exactly same as present in that person's actions, if event never happened set it 00:00),
+        sop_event should exactly match from what is provided, and in the same order as SOP events given, no need of serial Number,
+        done is False if that sop event never happened True Otherwise.
+        Derive everything exactly from the input that I'm providing, never mix actions of different people
+        """
+
+    prompts = {
+        "annotate": annotate_prompt,
+        "alert": alert_prompt,
+        "sop": sop_prompt,
+        "sop_batch": sop_batch_prompt,
+    }
+
+    if prompt_type not in prompts:
+        logger.error("unknown prompt type provided")
+        return None
+
+    schema = STRUCTURED_OUTPUT_SCHEMAS[prompt_type]
+
+    # same text (callback retries, duplicate webhooks, re-verified SOPs) gives the same output, don't pay the LLM twice
+    cache_key = llm_response_cache.build_key(prompt_type, PROMPT_TEMPLATE_VERSION, response_text, sop_events)
+    cached_output = llm_response_cache.get(cache_key)
+
+    if cached_output is not None:
+        logger.info(f"Structured Resp served from cache for prompt type {prompt_type}")
+        return cached_output
+
+    try:
+        response = _generate_content_with_rate_limit(prompts[prompt_type], schema, PROMPT_PRIORITIES[prompt_type])
+
+        logger.info(f"Structured Resp - {response.text}")
+
+        structured_output = pydantic.TypeAdapter(schema).validate_json(response.text)
+        structured_output = [item.model_dump() for item in structured_output]
+
+        llm_response_cache.set(cache_key, structured_output)
+        return structured_output
+
+    except pydantic.ValidationError as e:
+        logger.error(f"LLM response didn't match the {prompt_type} schema, error {e}")
     except Exception as e:
-        logger.error(f"Call to LLM Failed due to error {e}")
\ No newline at end of file
+        logger.error(f"Call to LLM Failed due to error {e}")
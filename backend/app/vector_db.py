@@ -0,0 +1,32 @@
+import logging
+
+import chromadb
+
+logger = logging.getLogger(__name__)
+
+def setup_vector_db():
+
+    try:
+        chroma_client = chromadb.Client()
+        collection_name = "huid_collection"
+        chroma_client.get_or_create_collection(name=collection_name, 
+            configuration={ 
+                "hnsw:space": "cosine",
+            }
+        )
+
+        logger.info(f"Collection '{collection_name}' is ready.")
+
+    except Exception as e:
+        logger.error(f"Failed to setup vector db due to error {e}")
+
+def get_huid_collection():
+    chroma_client = chromadb.PersistentClient(path="chromadb_data")
+
+    collection_name = "huid_collection"
+
+    return chroma_client.get_or_create_collection(name=collection_name, 
+            configuration={
+                "hnsw:space": "cosine",
+            }
+        )
@@ -0,0 +1,221 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import suppress
+import contextvars
+import logging
+import sqlite3
+import threading
+
+from app.api.background import analyse_video
+from app.callbacks import claim_next_callback_event, process_callback_event
+from app.config import app_settings
+from app.db import open_sqllite_db_connection
+from app.helpers import verify_pending_sops
+from app.http_client import close_async_http_client
+from app.jobs import analysis_job_lease, claim_next_analysis_job, finish_analysis_job
+from app.metrics import ANALYSIS_JOB_SECONDS, JobStats, current_job_stats, start_metrics_server
+from app.profiling import JOB_EXECUTOR_THREAD_PREFIX, JobProfiler
+
+logger = logging.getLogger(__name__)
+
+
+def _rollback(db_conn):
+
+    with suppress(sqlite3.Error):
+        db_conn.rollback()
+
+
+def run_worker(poll_interval: float = 2.0, stop_event: threading.Event | None = None):
+    """
+    Pull analysis jobs queued by the API out of SQLite and run them one at a time until stop_event is set
+    """
+
+    if stop_event is None:
+        stop_event = threading.Event()
+
+    db_conn = open_sqllite_db_connection()
+
+    # one long lived event loop for all jobs, so the pooled HTTP connections survive between videos
+    runner = asyncio.Runner()
+
+    # named threads for to_thread, the profiler tells the job's threads apart by their name
+    runner.get_loop().set_default_executor(ThreadPoolExecutor(thread_name_prefix=JOB_EXECUTOR_THREAD_PREFIX))
+
+    logger.info("------Analysis worker is starting UP------")
+
+    try:
+        while not stop_event.is_set():
+
+            try:
+                job = claim_next_analysis_job(db_conn)
+            except Exception as e:
+                # e.g. database is locked while the API writes, the next poll tries again
+                logger.error(f"Claiming the next analysis job failed due to error {e}")
+                _rollback(db_conn)
+                stop_event.wait(poll_interval)
+                continue
+
+            if job is None:
+                stop_event.wait(poll_interval)
+                continue
+
+            logger.info(f"Picked analysis job [{job['id']}] for video [{job['video_public_id']}]")
+
+            # every stage timed while the job runs (tasks and to_thread copy the context) lands in its stats
+            job_stats = JobStats()
+            context = contextvars.copy_context()
+            context.run(current_job_stats.set, job_stats)
+
+            profiler = None
+            if job["profile"] or app_settings.PROFILE_ALL_JOBS:
+                profiler = JobProfiler(job["video_public_id"], job["id"])
+                profiler.start()
+
+            try:
+                with analysis_job_lease(job["id"]):
+                    runner.run(analyse_video(job["video_public_id"]), context=context)
+                status, error = "done", None
+            except Exception as e:
+                logger.error(f"Analysis job [{job['id']}] for video [{job['video_public_id']}] failed due to error {e}")
+                status, error = "failed", str(e)
+            finally:
+                if profiler is not None:
+                    profiler.stop()
+
+            summary = job_stats.summary()
+            ANALYSIS_JOB_SECONDS.observe(summary["wall_seconds"], status=status)
+
+            logger.info(f"Analysis job [{job['id']}] {status} in {summary['wall_seconds']}s, {summary['frames_per_second']} frames/s")
+
+            # the job already ran, only its status is retried, a worker stopped meanwhile leaves it to the lease
+            while True:
+                try:
+                    finish_analysis_job(job["id"], db_conn, error=error, metrics=summary)
+                    break
+                except Exception as e:
+                    logger.error(f"Finishing analysis job [{job['id']}] failed due to error {e}")
+                    _rollback(db_conn)
+
+                    if stop_event.wait(poll_interval):
+                        break
+
+    finally:
+        runner.run(close_async_http_client())
+        runner.close()
+        db_conn.close()
+        logger.info("------Analysis worker is shutting DOWN------")
+
+
+def start_worker_thread(poll_interval: float = 2.0):
+    """
+    Run the worker inside the current process, used by the all-in-one app
+    """
+
+    stop_event = threading.Event()
+    thread = threading.Thread(
+        target=run_worker,
+        kwargs={"poll_interval": poll_interval, "stop_event": stop_event},
+        name="analysis-worker",
+        daemon=True,
+    )
+    thread.start()
+
+    return thread, stop_event
+
+
+def run_sop_scheduler(interval: float, stop_event: threading.Event | None = None):
+    """
+    Every interval seconds verify the SOPs of all annotated people in bulk
+    """
+
+    if stop_event is None:
+        stop_event = threading.Event()
+
+    db_conn = open_sqllite_db_connection()
+
+    try:
+        while not stop_event.wait(interval):
+            try:
+                verify_pending_sops(db_conn)
+            except Exception as e:
+                logger.error(f"Bulk SOP verification failed due to error {e}")
+
+    finally:
+        db_conn.close()
+
+
+def start_sop_scheduler_thread(interval: float):
+
+    stop_event = threading.Event()
+    thread = threading.Thread(
+        target=run_sop_scheduler,
+        kwargs={"interval": interval, "stop_event": stop_event},
+        name="sop-scheduler",
+        daemon=True,
+    )
+    thread.start()
+
+    return thread, stop_event
+
+
+def run_callback_processor(poll_interval: float, stop_event: threading.Event | None = None):
+    """
+    Process the webhook payloads stored by the API callbacks until stop_event is set
+    """
+
+    if stop_event is None:
+        stop_event = threading.Event()
+
+    db_conn = open_sqllite_db_connection()
+
+    try:
+        while not stop_event.is_set():
+            try:
+                event = claim_next_callback_event(db_conn)
+
+                if event is None:
+                    stop_event.wait(poll_interval)
+                    continue
+
+                process_callback_event(event, db_conn)
+
+            except Exception as e:
+                logger.error(f"Callback processing failed due to error {e}")
+                stop_event.wait(poll_interval)
+
+    finally:
+        db_conn.close()
+
+
+def start_callback_processor_thread(poll_interval: float):
+
+    stop_event = threading.Event()
+    thread = threading.Thread(
+        target=run_callback_processor,
+        kwargs={"poll_interval": poll_interval, "stop_event": stop_event},
+        name="callback-processor",
+        daemon=True,
+    )
+    thread.start()
+
+    return thread, stop_event
+
+
+def start_metrics_server_if_enabled():
+    """
+    The standalone worker has no API to serve /metrics from
+    """
+
+    if app_settings.WORKER_METRICS_PORT > 0:
+        return start_metrics_server(app_settings.WORKER_METRICS_PORT)
+
+
+def start_background_threads():
+    """
+    Start the threads that run next to the analysis loop (callback processing, bulk SOP verification)
+    """
+
+    return [
+        start_callback_processor_thread(app_settings.WORKER_POLL_INTERVAL_SECONDS),
+        start_sop_scheduler_thread(app_settings.SOP_BATCH_INTERVAL_SECONDS),
+    ]
@@ -0,0 +1,145 @@
+import argparse
+from datetime import datetime, timezone
+import json
+import logging
+import os
+from pathlib import Path
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import traceback
+
+# Offline benchmarks of the analysis hot path, run from backend/ with
+#   python -m benchmarks [--quick] [--only pipeline gallery] [--baseline benchmarks/baseline.json] [--save-baseline]
+# Needs no GPU, weights or network (see benchmarks/synthetic.py), the secrets only have to be set, not valid.
+
+BASELINE_PATH = Path(__file__).parent / "baseline.json"
+
+
+def _environment(quick):
+
+    import cv2
+    import numpy as np
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": commit,
+        "quick": quick,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    Per metric change against the baseline, returns (rows, regressions), a row is (benchmark, metric, baseline, current, change)
+    """
+
+    rows, regressions = [], []
+
+    for name, result in results["benchmarks"].items():
+        baseline_metrics = baseline["benchmarks"].get(name, {}).get("metrics", {})
+
+        for metric, value in result.get("metrics", {}).items():
+            base = baseline_metrics.get(metric)
+
+            if base is None or base == 0:
+                continue
+
+            change = (value - base) / base
+            rows.append((name, metric, base, value, change))
+
+            if metric.endswith("_per_second") and change < -tolerance:
+                regressions.append(rows[-1])
+            elif metric.endswith("_ms") and change > tolerance:
+                regressions.append(rows[-1])
+
+    return rows, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks of the analysis pipeline and the API")
+    parser.add_argument("--only", nargs="+", help="benchmarks to run, default all")
+    parser.add_argument("--quick", action="store_true", help="smaller inputs, for a smoke run")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", default=str(BASELINE_PATH))
+    parser.add_argument("--save-baseline", action="store_true", help="also write the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="relative change reported as a regression")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    # settings are read at import, point the database at the scratch dir before anything imports app
+    workdir = tempfile.mkdtemp(prefix="sentinel-bench-")
+    os.environ["SQLITE_DB_PATH"] = f"{workdir}/bench.db"
+
+    from benchmarks.cases import BENCHMARKS
+
+    names = args.only or list(BENCHMARKS)
+    unknown = set(names) - set(BENCHMARKS)
+
+    if unknown:
+        parser.error(f"unknown benchmarks {sorted(unknown)}, available {list(BENCHMARKS)}")
+
+    results = {"environment": _environment(args.quick), "benchmarks": {}}
+
+    try:
+        for name in names:
+            print(f"Running {name} ...", file=sys.stderr)
+
+            try:
+                results["benchmarks"][name] = BENCHMARKS[name](workdir, args.quick)
+            except ImportError as e:
+                results["benchmarks"][name] = {"skipped": f"missing dependency {e.name}"}
+            except Exception as e:
+                traceback.print_exc()
+                results["benchmarks"][name] = {"error": str(e)}
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    print(json.dumps(results["benchmarks"], indent=2))
+
+    regressions = []
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+        if baseline["environment"].get("quick") != args.quick:
+            print("Baseline was recorded with a different --quick setting, the comparison is not meaningful", file=sys.stderr)
+
+        rows, regressions = compare(results, baseline, args.tolerance)
+
+        print(f"\n{'benchmark':<16} {'metric':<40} {'baseline':>12} {'current':>12} {'change':>8}")
+        for name, metric, base, value, change in rows:
+            flag = " !" if (name, metric, base, value, change) in regressions else ""
+            print(f"{name:<16} {metric:<40} {base:>12} {value:>12} {change:>+8.1%}{flag}")
+
+        print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%}")
+    else:
+        print(f"No baseline at {args.baseline}, run with --save-baseline to record one", file=sys.stderr)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.fail_on_regression and regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
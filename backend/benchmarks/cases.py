@@ -0,0 +1,291 @@
+import asyncio
+import statistics
+import time
+
+import numpy as np
+
+# Every benchmark takes (workdir, quick) and returns {"params": ..., "metrics": ...}. Metric names carry their
+# direction for the baseline comparison: *_per_second is better higher, *_ms better lower, anything else is informative.
+# app modules are imported inside the benchmarks, after __main__ pointed the settings at the scratch workdir.
+
+
+def _time_calls(fn, number):
+
+    samples = []
+
+    for _ in range(number):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+
+    return samples
+
+
+def _latency_metrics(prefix, samples):
+
+    samples_ms = sorted(1000 * s for s in samples)
+
+    return {
+        f"{prefix}_p50_ms": round(statistics.median(samples_ms), 4),
+        f"{prefix}_p95_ms": round(samples_ms[min(len(samples_ms) - 1, int(0.95 * len(samples_ms)))], 4),
+    }
+
+
+def bench_pipeline(workdir, quick):
+    """
+    End to end _get_and_insert_huids_from_video over a synthetic video, stub detector and embedder, real Chroma
+    """
+
+    import sys
+
+    from benchmarks.synthetic import StubDetector, install_stub_models, new_gallery_collection, write_synthetic_video
+
+    if "app.ml_models" not in sys.modules:
+        install_stub_models()
+
+    import app.utils
+    from app.metrics import JobStats, current_job_stats
+    from app.services import video_analysis_service
+
+    # crops are written under APP_ROOT_DIR/crops, keep them in the scratch dir
+    app.utils.APP_ROOT_DIR = workdir
+
+    n_frames, people, repeat = (100, 4, 1) if quick else (500, 4, 3)
+    video_path = write_synthetic_video(f"{workdir}/synthetic.mp4", n_frames=n_frames, people=people)
+
+    # skip __init__, it loads the YOLO weights
+    service = object.__new__(video_analysis_service.VideoAnalysisService)
+    service.segmentation_model = StubDetector(people)
+
+    runs = []
+
+    for _ in range(repeat):
+        video_analysis_service.huid_collection = new_gallery_collection()
+
+        stats = JobStats()
+        token = current_job_stats.set(stats)
+
+        try:
+            start = time.perf_counter()
+            timeline = service._get_and_insert_huids_from_video(video_path)
+            elapsed = time.perf_counter() - start
+        finally:
+            current_job_stats.reset(token)
+
+        runs.append((elapsed, stats.summary(), len(timeline.huids)))
+
+    elapsed, summary, huids = sorted(runs, key=lambda run: run[0])[len(runs) // 2]
+
+    metrics = {
+        "frames_per_second": round(n_frames / elapsed, 2),
+        "crops_per_second": round(summary["counters"].get("crops", 0) / elapsed, 2),
+        "huids": huids,
+    }
+
+    for stage, totals in summary["stages"].items():
+        metrics[f"{stage}_ms"] = totals["mean_ms"]
+
+    return {"params": {"frames": n_frames, "people": people, "repeat": repeat}, "metrics": metrics}
+
+
+def bench_diverse_subset(workdir, quick):
+    """
+    select_most_diverse_subset scaling in n (gallery size + 1) and k (gallery size)
+    """
+
+    from app.utils import select_most_diverse_subset
+
+    rng = np.random.default_rng(0)
+    sizes = [(6, 5), (8, 5), (10, 5)] if quick else [(6, 3), (6, 5), (8, 5), (10, 5), (12, 5), (12, 8)]
+    number = 5 if quick else 20
+
+    metrics = {}
+
+    for n, k in sizes:
+        embeddings = rng.normal(size=(n, 512)).astype(np.float32)
+        samples = _time_calls(lambda: select_most_diverse_subset(embeddings, k), number)
+        metrics[f"n{n}_k{k}_ms"] = round(1000 * statistics.median(samples), 4)
+
+    return {"params": {"sizes": sizes, "number": number}, "metrics": metrics}
+
+
+def bench_gallery(workdir, quick):
+    """
+    Chroma query (top 1, as in re-identification) and single insert latency for growing galleries
+    """
+
+    from benchmarks.synthetic import new_gallery_collection
+
+    rng = np.random.default_rng(0)
+    gallery_sizes = [1000] if quick else [1000, 10000, 50000]
+    number = 50 if quick else 200
+
+    metrics = {}
+
+    for gallery_size in gallery_sizes:
+        collection = new_gallery_collection(f"bench_gallery_{gallery_size}")
+
+        embeddings = rng.normal(size=(gallery_size, 512)).astype(np.float32)
+
+        for offset in range(0, gallery_size, 1000):
+            batch = embeddings[offset:offset + 1000]
+            collection.add(
+                ids=[str(offset + i) for i in range(len(batch))],
+                embeddings=batch.tolist(),
+                metadatas=[{"huid": f"huid-{(offset + i) // 5}"} for i in range(len(batch))],
+            )
+
+        queries = rng.normal(size=(number, 512)).astype(np.float32).tolist()
+        query_iter = iter(queries)
+
+        query_samples = _time_calls(
+            lambda: collection.query(query_embeddings=[next(query_iter)], n_results=1, include=["metadatas", "distances"]),
+            number,
+        )
+
+        inserts = iter(enumerate(rng.normal(size=(number, 512)).astype(np.float32).tolist()))
+
+        def insert():
+            i, embedding = next(inserts)
+            collection.add(ids=[f"new-{i}"], embeddings=[embedding], metadatas=[{"huid": f"new-{i}"}])
+
+        insert_samples = _time_calls(insert, number)
+
+        metrics.update(_latency_metrics(f"size{gallery_size}_query", query_samples))
+        metrics.update(_latency_metrics(f"size{gallery_size}_insert", insert_samples))
+        metrics[f"size{gallery_size}_queries_per_second"] = round(number / sum(query_samples), 2)
+
+    return {"params": {"gallery_sizes": gallery_sizes, "number": number}, "metrics": metrics}
+
+
+def bench_crop_io(workdir, quick):
+    """
+    Crop writes through store_crop_at_path and reads back with OpenCV, person sized crops
+    """
+
+    import cv2
+
+    from app.utils import store_crop_at_path
+
+    rng = np.random.default_rng(0)
+    number = 100 if quick else 500
+
+    crops = [cv2.GaussianBlur(rng.integers(0, 256, size=(256, 128, 3), dtype=np.uint8), (5, 5), 0) for _ in range(number)]
+    paths = [f"{workdir}/crops_bench/{i % 20}/{i}.jpg" for i in range(number)]
+
+    items = iter(zip(crops, paths))
+    write_samples = _time_calls(lambda: store_crop_at_path(*next(items)), number)
+
+    path_iter = iter(paths)
+    read_samples = _time_calls(lambda: cv2.imread(next(path_iter)), number)
+
+    metrics = {}
+    metrics.update(_latency_metrics("write", write_samples))
+    metrics.update(_latency_metrics("read", read_samples))
+    metrics["writes_per_second"] = round(number / sum(write_samples), 2)
+    metrics["reads_per_second"] = round(number / sum(read_samples), 2)
+
+    return {"params": {"number": number, "crop_shape": [256, 128, 3]}, "metrics": metrics}
+
+
+def _seed_results_db(videos, people_per_video, alerts_per_video):
+
+    from app.callbacks import _store_alerts, _store_annotation
+    from app.db import setup_sqllite_database, sqlite_connection_pool
+
+    setup_sqllite_database()
+
+    db_conn = sqlite_connection_pool.acquire()
+
+    try:
+        cursor = db_conn.cursor()
+
+        for v in range(videos):
+            video_public_id = f"bench_video_{v}"
+
+            cursor.execute(
+                "INSERT OR IGNORE INTO videos (public_id, url, env_id) VALUES (?,?,?)",
+                (video_public_id, f"https://bench.invalid/{video_public_id}.mp4", 1 + v % 3),
+            )
+
+            _store_alerts(video_public_id, [
+                {"start": f"00:{a % 60:02d}", "end": f"01:{a % 60:02d}", "alert_level": ["low", "medium", "critical"][a % 3], "description": f"alert {a}"}
+                for a in range(alerts_per_video)
+            ], cursor)
+
+            for p in range(people_per_video):
+                _store_annotation(video_public_id, f"huid-{v}-{p}", [
+                    {"start": f"00:{a:02d}", "end": f"00:{a + 1:02d}", "action": f"action {a}"} for a in range(5)
+                ], cursor)
+
+        db_conn.commit()
+    finally:
+        sqlite_connection_pool.release(db_conn)
+
+
+def bench_endpoints(workdir, quick):
+    """
+    Latency and throughput of the read endpoints of the lean API at several client concurrencies
+    """
+
+    import httpx
+
+    videos = 20 if quick else 100
+    _seed_results_db(videos, people_per_video=10, alerts_per_video=20)
+
+    import api
+
+    endpoints = {
+        "alerts": lambda i: f"/api/v1/video_analysis/alerts?video_public_id=bench_video_{i % videos}",
+        "persons": lambda i: f"/api/v1/video_analysis/persons?video_public_id=bench_video_{i % videos}",
+        "report_alerts": lambda i: f"/api/v1/reports/alerts?env_id={1 + i % 3}&alert_level=critical&limit=50",
+        "person_list": lambda i: f"/api/v1/persons/list?limit=50&offset={50 * (i % 10)}",
+    }
+
+    concurrencies = [1, 8] if quick else [1, 8, 32]
+    requests_per_level = 50 if quick else 300
+
+    async def run(build_url, concurrency):
+
+        semaphore = asyncio.Semaphore(concurrency)
+        samples = []
+
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=api.app), base_url="http://bench") as client:
+
+            async def one(i):
+                async with semaphore:
+                    start = time.perf_counter()
+                    response = await client.get(build_url(i))
+                    samples.append(time.perf_counter() - start)
+
+                    if response.status_code != 200:
+                        raise RuntimeError(f"{build_url(i)} returned {response.status_code}")
+
+            start = time.perf_counter()
+            await asyncio.gather(*(one(i) for i in range(requests_per_level)))
+            elapsed = time.perf_counter() - start
+
+        return samples, elapsed
+
+    metrics = {}
+
+    for name, build_url in endpoints.items():
+        for concurrency in concurrencies:
+            samples, elapsed = asyncio.run(run(build_url, concurrency))
+
+            metrics.update(_latency_metrics(f"{name}_c{concurrency}", samples))
+            metrics[f"{name}_c{concurrency}_requests_per_second"] = round(requests_per_level / elapsed, 2)
+
+    return {
+        "params": {"videos": videos, "concurrencies": concurrencies, "requests_per_level": requests_per_level},
+        "metrics": metrics,
+    }
+
+
+BENCHMARKS = {
+    "pipeline": bench_pipeline,
+    "diverse_subset": bench_diverse_subset,
+    "gallery": bench_gallery,
+    "crop_io": bench_crop_io,
+    "endpoints": bench_endpoints,
+}
@@ -0,0 +1,190 @@
+import sys
+import time
+import types
+
+import cv2
+import numpy as np
+
+# Deterministic stand-ins for the footage and the models, so the pipeline can be benchmarked on a CPU only box
+# without network, weights or GPU. Every person is a blob of its own saturated hue on a grey noisy background,
+# the stub detector finds them by colour and the stub embedder describes them by their colour histogram.
+
+
+def write_synthetic_video(path, n_frames=300, width=640, height=360, people=4, fps=25, seed=0):
+    """
+    Write an mp4 of `people` person-like blobs (body and head) bouncing around the frame, returns its path
+    """
+
+    rng = np.random.default_rng(seed)
+
+    sizes = rng.integers([30, 80], [50, 140], size=(people, 2))
+    positions = rng.uniform([0, 0], [width - sizes[:, 0].max(), height - sizes[:, 1].max()], size=(people, 2))
+    velocities = rng.uniform(-4, 4, size=(people, 2))
+
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+
+    if not writer.isOpened():
+        raise IOError(f"Could not open a video writer for {path}")
+
+    try:
+        for _ in range(n_frames):
+            frame = np.full((height, width, 3), 110, dtype=np.uint8)
+            frame += rng.integers(0, 20, size=frame.shape, dtype=np.uint8)
+
+            for person in range(people):
+                body_w, body_h = sizes[person]
+                x, y = positions[person].astype(int)
+
+                color = person_color(person, people)
+                head_r = max(4, body_w // 3)
+
+                cv2.rectangle(frame, (x, y + 2 * head_r), (x + body_w, y + body_h), color, thickness=-1)
+                cv2.circle(frame, (x + body_w // 2, y + head_r), head_r, color, thickness=-1)
+
+            positions += velocities
+
+            # bounce off the borders
+            limits = np.array([width, height]) - sizes
+            bounced = (positions < 0) | (positions > limits)
+            velocities[bounced] *= -1
+            positions = np.clip(positions, 0, limits)
+
+            writer.write(frame)
+    finally:
+        writer.release()
+
+    return path
+
+
+def person_color(person, people):
+
+    hue = np.uint8(int(180 * person / max(1, people)))
+    return tuple(int(c) for c in cv2.cvtColor(np.array([[[hue, 230, 220]]], dtype=np.uint8), cv2.COLOR_HSV2BGR)[0, 0])
+
+
+class _Array:
+    """
+    What the pipeline calls on torch tensors (.cpu().numpy())
+    """
+
+    def __init__(self, array):
+        self.array = np.asarray(array)
+
+    def __getitem__(self, index):
+        return _Array(self.array[index])
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self.array
+
+
+class _Boxes:
+
+    def __init__(self, xyxy, ids, confs):
+        self.xyxy = _Array(xyxy)
+        self.id = None if len(ids) == 0 else _Array(ids)
+        self.conf = _Array(confs)
+
+
+class _Result:
+
+    def __init__(self, boxes, speed):
+        self.boxes = boxes
+        self.speed = speed
+
+
+class StubDetector:
+    """
+    Stands in for the ultralytics YOLO model in tracking mode, the track id of a blob is given by its hue
+    """
+
+    def __init__(self, people, min_area=400, conf=0.9):
+        self.people = people
+        self.min_area = min_area
+        self.conf = conf
+
+    def track(self, frame, conf=0.0, **kwargs):
+
+        start = time.perf_counter()
+
+        hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+        mask = cv2.inRange(hsv, (0, 150, 50), (180, 255, 255))
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+        boxes, ids = [], []
+        hue_step = 180 / max(1, self.people)
+
+        if self.conf < conf:
+            contours = []
+
+        for contour in contours:
+            x, y, w, h = cv2.boundingRect(contour)
+
+            if w * h < self.min_area:
+                continue
+
+            hue = cv2.mean(hsv[y:y + h, x:x + w, 0], mask=mask[y:y + h, x:x + w])[0]
+
+            boxes.append([x, y, x + w, y + h])
+            ids.append(int(round(hue / hue_step)) % self.people + 1)
+
+        confs = [self.conf] * len(boxes)
+
+        return [_Result(
+            _Boxes(np.array(boxes, dtype=int).reshape(-1, 4), np.array(ids, dtype=int), np.array(confs, dtype=np.float32)),
+            # the colour segmentation is the detection, there is no separate tracker step
+            speed={"preprocess": 0.0, "inference": 1000 * (time.perf_counter() - start), "postprocess": 0.0},
+        )]
+
+
+class StubEmbedder:
+    """
+    Stands in for the torchreid FeatureExtractor, a 512-d L2 normalised HSV histogram per crop
+    """
+
+    def __call__(self, crops):
+
+        if isinstance(crops, np.ndarray):
+            crops = [crops]
+
+        features = np.zeros((len(crops), 512), dtype=np.float32)
+
+        for i, crop in enumerate(crops):
+            hsv = cv2.cvtColor(crop, cv2.COLOR_BGR2HSV)
+            hist = cv2.calcHist([hsv], [0, 1, 2], None, [8, 8, 8], [0, 180, 0, 256, 0, 256]).flatten()
+            features[i] = hist / (np.linalg.norm(hist) + 1e-8)
+
+        return _Array(features)
+
+
+def new_gallery_collection(name="huid_collection"):
+    """
+    In memory Chroma collection configured like the real one (app/vector_db.py)
+    """
+
+    import chromadb
+
+    client = chromadb.EphemeralClient()
+
+    try:
+        client.delete_collection(name)
+    except Exception:
+        pass
+
+    return client.get_or_create_collection(name=name, configuration={"hnsw:space": "cosine"})
+
+
+def install_stub_models():
+    """
+    Register a stub app.ml_models before the analysis service is imported, the real one loads OSNet on CUDA
+    and opens the persistent gallery at import time
+    """
+
+    module = types.ModuleType("app.ml_models")
+    module.osnet_feature_extractor = StubEmbedder()
+    module.huid_collection = new_gallery_collection()
+
+    sys.modules["app.ml_models"] = module
+    return module
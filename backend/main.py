@@ -3,6 +3,8 @@ from fastapi import FastAPI
 from app.config import configure_cloudinary, init_cors, lifespan, app_secrets
 from app.logger import configure_logging
 from app.api.api_handlers import router
+from app.api.metrics_handlers import metrics_router
+from app.api.search_handlers import search_router
 
 configure_logging()
 
@@ -15,4 +17,6 @@ app = FastAPI(
 
 init_cors(app)
 app.include_router(router)
+app.include_router(metrics_router)
+app.include_router(search_router)
 configure_cloudinary(app_secrets)
\ No newline at end of file
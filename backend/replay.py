@@ -0,0 +1,45 @@
+import argparse
+from itertools import product
+import json
+import time
+
+from app.detection_cache import DetectionCache, replay_association
+from app.utils import build_local_uri_for_detection_cache
+
+# Replays the HUID association of a video from its detection cache (record it with DETECTION_CACHE_ENABLED=true)
+# for every combination of the given thresholds, e.g.
+#   python replay.py <video_public_id> --reid-distance 0.2 0.3 0.4 --gallery-every 5 10
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep re-identification settings over a recorded detection cache")
+    parser.add_argument("video_public_id")
+    parser.add_argument("--threshold-conf", type=float, nargs="+", default=[None])
+    parser.add_argument("--reid-distance", type=float, nargs="+", default=[None])
+    parser.add_argument("--gallery-every", type=int, nargs="+", default=[None])
+    parser.add_argument("--gallery-size", type=int, nargs="+", default=[None])
+    parser.add_argument("--verbose", action="store_true", help="include the per track / per huid breakdown")
+    args = parser.parse_args()
+
+    cache = DetectionCache(build_local_uri_for_detection_cache(args.video_public_id))
+
+    results = []
+
+    for threshold_conf, reid_distance, gallery_every, gallery_size in product(
+        args.threshold_conf, args.reid_distance, args.gallery_every, args.gallery_size
+    ):
+        start = time.perf_counter()
+        result = replay_association(cache, threshold_conf, reid_distance, gallery_every, gallery_size)
+        result["seconds"] = round(time.perf_counter() - start, 3)
+
+        if not args.verbose:
+            result.pop("detections_per_huid")
+            result.pop("trackid_to_huid")
+
+        results.append(result)
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+import os
+import sys
+
+# app.config reads the secrets at import time, the tests never reach Cloudinary or Gemini
+for name in ("CLOUDINARY_CLOUD_NAME", "CLOUDINARY_API_KEY", "CLOUDINARY_API_SECRET", "GEMINI_API_KEY"):
+    os.environ.setdefault(name, "test")
+
+import pytest
+
+from app.config import app_settings
+
+
+@pytest.fixture
+def db_conn(tmp_path, monkeypatch):
+    """
+    Connection to a fresh database in tmp_path, created and migrated like the app does on startup
+    """
+
+    from app.db import open_sqllite_db_connection, setup_sqllite_database, sqlite_connection_pool
+
+    monkeypatch.setattr(app_settings, "SQLITE_DB_PATH", str(tmp_path / "app.db"))
+    setup_sqllite_database()
+
+    conn = open_sqllite_db_connection()
+    yield conn
+    conn.close()
+
+    # pooled connections stay open on this test's database
+    sqlite_connection_pool.close()
+
+
+@pytest.fixture
+def analysis_models():
+    """
+    The benchmark stand-ins for OSNet and the re-ID gallery (benchmarks/synthetic.py) in place of app.ml_models,
+    so the analysis service imports without weights. Skipped where ultralytics or chromadb aren't installed.
+    """
+
+    pytest.importorskip("ultralytics")
+    pytest.importorskip("chromadb")
+
+    from benchmarks.synthetic import install_stub_models
+
+    if "app.ml_models" not in sys.modules:
+        install_stub_models()
+
+    return sys.modules["app.ml_models"]
+
+
+@pytest.fixture
+def api_client(db_conn):
+    """
+    TestClient of the REST endpoints of the lean API (api.py), on the db_conn database
+    """
+
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+
+    from app.api.api_handlers import router
+    from app.api.metrics_handlers import metrics_router
+    from app.config import app_secrets, configure_cloudinary
+
+    app = FastAPI()
+    app.include_router(router)
+    app.include_router(metrics_router)
+    configure_cloudinary(app_secrets)
+
+    with TestClient(app) as client:
+        yield client
@@ -0,0 +1,103 @@
+import asyncio
+
+import pytest
+
+from app.constants import AnalysisStage
+
+
+@pytest.fixture
+def background(analysis_models, monkeypatch):
+
+    from app.api import background
+    from app.services.video_analysis_service import VideoAnalysisService
+
+    class Service(VideoAnalysisService):
+
+        # no YOLO weights
+        def __init__(self):
+            pass
+
+    return background, Service
+
+
+def progress_row(db_conn, video_public_id):
+    return db_conn.execute("SELECT * FROM analysis_progress WHERE video_public_id = ?", (video_public_id,)).fetchone()
+
+
+def test_failed_tracking_cancels_the_alert_request_and_fails_the_job(db_conn, background, monkeypatch):
+
+    from app.exceptions import VideoTrackingFailed
+
+    background, Service = background
+    alert_cancelled = asyncio.Event()
+
+    async def check_alert(self, video_public_id):
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            alert_cancelled.set()
+            raise
+
+    async def analyse_people_from_video(self, video_public_id, progress=None):
+        await asyncio.sleep(0.01)
+        raise VideoTrackingFailed("IO error while processing video: unreadable")
+
+    monkeypatch.setattr(Service, "check_alert", check_alert)
+    monkeypatch.setattr(Service, "analyse_people_from_video", analyse_people_from_video)
+    monkeypatch.setattr(background, "VideoAnalysisService", Service)
+    monkeypatch.setattr(background, "_download_video", lambda video_public_id: None)
+
+    async def run():
+        with pytest.raises(VideoTrackingFailed):
+            await background.analyse_video("v1")
+
+        assert alert_cancelled.is_set()
+
+    asyncio.run(run())
+
+    row = progress_row(db_conn, "v1")
+    assert row["stage"] == AnalysisStage.Failed
+    assert row["error"] == "IO error while processing video: unreadable"
+    assert row["external_pending"] == 0
+
+
+def test_tracking_an_unreadable_video_raises(analysis_models, tmp_path):
+
+    from app.exceptions import VideoTrackingFailed
+    from app.services.video_analysis_service import VideoAnalysisService
+
+    service = object.__new__(VideoAnalysisService)
+
+    with pytest.raises(VideoTrackingFailed):
+        service._get_and_insert_huids_from_video(str(tmp_path / "missing.mp4"))
+
+
+def test_failed_download_fails_the_job_before_tracking(db_conn, background, monkeypatch):
+
+    from app.exceptions import AssetDownloadFailed
+    from app.services.asset_management_service import AssetManagementService
+
+    background, Service = background
+    started = []
+
+    async def analyse_people_from_video(self, video_public_id, progress=None):
+        started.append(video_public_id)
+
+    def download_asset_if_not_exist(self, file_path, url):
+        raise AssetDownloadFailed()
+
+    monkeypatch.setattr(Service, "analyse_people_from_video", analyse_people_from_video)
+    monkeypatch.setattr(background, "VideoAnalysisService", Service)
+    monkeypatch.setattr(AssetManagementService, "download_asset_if_not_exist", download_asset_if_not_exist)
+
+    db_conn.execute("INSERT INTO videos (public_id, url) VALUES ('v1', 'https://res.cloudinary.com/test/video/upload/v1.mp4')")
+    db_conn.commit()
+
+    with pytest.raises(AssetDownloadFailed):
+        asyncio.run(background.analyse_video("v1"))
+
+    assert started == []
+
+    row = progress_row(db_conn, "v1")
+    assert row["stage"] == AnalysisStage.Failed
+    assert row["error"] == "Failed to download video [v1]"
@@ -0,0 +1,65 @@
+from app import jobs
+from app.exceptions import DBOperationFailed
+from app.services.asset_management_service import AssetManagementService
+
+
+def video(public_id, env_id=1):
+    return {"video_public_id": public_id, "video_url": f"https://res.cloudinary.com/test/video/upload/{public_id}.mp4", "env_id": env_id}
+
+
+def statuses(response):
+    return [(result["video_public_id"], result["status"], result["reg_status"]) for result in response.json()["results"]]
+
+
+def queued_videos(db_conn):
+    return [row[0] for row in db_conn.execute("SELECT video_public_id FROM analysis_jobs ORDER BY id")]
+
+
+def test_bulk_registration_queues_without_downloading(api_client, db_conn, monkeypatch):
+
+    def download(*args):
+        raise AssertionError("the request must not download")
+
+    monkeypatch.setattr(AssetManagementService, "download_asset_if_not_exist", download)
+
+    db_conn.execute("INSERT INTO videos (public_id, url) VALUES ('v3', 'https://res.cloudinary.com/test/video/upload/v3.mp4')")
+    db_conn.commit()
+
+    response = api_client.post("/api/v1/register_videos", json={"videos": [
+        video("v1"), video("v1"), video("v2", env_id=99), video("v3"), video("v4"),
+    ]})
+
+    assert response.status_code == 202
+    assert statuses(response) == [
+        ("v1", "queued", True),
+        ("v1", "queued", True),
+        ("v2", "invalid_env", False),
+        ("v3", "duplicate", False),
+        ("v4", "queued", True),
+    ]
+    assert queued_videos(db_conn) == ["v1", "v4"]
+
+    stage = db_conn.execute("SELECT stage FROM analysis_progress WHERE video_public_id = 'v4'").fetchone()[0]
+    assert stage == "queued"
+
+
+def test_failed_registration_leaves_nothing_behind(api_client, db_conn, monkeypatch):
+
+    enqueued = []
+
+    def enqueue_analysis_job(video_public_id, conn, commit=True, profile=False):
+        # the second video fails after the first one is already queued in the transaction
+        if enqueued:
+            raise DBOperationFailed()
+
+        enqueued.append(video_public_id)
+        return jobs.enqueue_analysis_job(video_public_id, conn, commit=commit, profile=profile)
+
+    monkeypatch.setattr("app.api.api_handlers.enqueue_analysis_job", enqueue_analysis_job)
+
+    response = api_client.post("/api/v1/register_videos", json={"videos": [video("v1"), video("v2"), video("v3", env_id=99)]})
+
+    assert response.status_code == 202
+    assert statuses(response) == [("v1", "failed", False), ("v2", "failed", False), ("v3", "invalid_env", False)]
+    assert queued_videos(db_conn) == []
+    assert db_conn.execute("SELECT COUNT(*) FROM videos").fetchone()[0] == 0
@@ -0,0 +1,157 @@
+import json
+
+from app import db
+from app.db import MIGRATIONS, apply_migrations, open_sqllite_db_connection, setup_sqllite_database
+
+
+def insert_video(conn, public_id, env_id=1, alerts=None):
+    conn.execute(
+        "INSERT INTO videos (public_id, url, env_id, alerts) VALUES (?,?,?,?)",
+        (public_id, f"https://res.cloudinary.com/test/video/upload/{public_id}.mp4", env_id, alerts),
+    )
+
+
+def insert_person(conn, huid, video_public_id, annotation=None, sop=None):
+    return conn.execute(
+        "INSERT INTO people (huid, video_public_id, annotation, sop) VALUES (?,?,?,?)", (huid, video_public_id, annotation, sop),
+    ).lastrowid
+
+
+def results_version(conn, public_id):
+    return conn.execute("SELECT results_version FROM videos WHERE public_id = ?", (public_id,)).fetchone()[0]
+
+
+def test_setup_applies_every_migration(db_conn):
+
+    assert db_conn.execute("PRAGMA user_version").fetchone()[0] == len(MIGRATIONS)
+    assert db_conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+    columns = {row["name"] for row in db_conn.execute("PRAGMA table_info(analysis_jobs)")}
+    assert {"metrics", "profile", "claimed_at"} <= columns
+
+
+def test_setup_is_idempotent(db_conn):
+
+    insert_video(db_conn, "v1")
+    db_conn.commit()
+
+    setup_sqllite_database()
+    apply_migrations(db_conn)
+
+    assert db_conn.execute("PRAGMA user_version").fetchone()[0] == len(MIGRATIONS)
+    assert db_conn.execute("SELECT COUNT(*) FROM videos").fetchone()[0] == 1
+    assert db_conn.execute("SELECT COUNT(*) FROM sopdefs").fetchone()[0] == 1
+
+
+def test_migrations_backfill_an_existing_database(tmp_path, monkeypatch):
+
+    monkeypatch.setattr(db.app_settings, "SQLITE_DB_PATH", str(tmp_path / "app.db"))
+
+    # a database that shipped with the first two migrations only
+    monkeypatch.setattr(db, "MIGRATIONS", MIGRATIONS[:2])
+    setup_sqllite_database()
+
+    conn = open_sqllite_db_connection()
+
+    try:
+        alerts = [{"start": "00:05", "end": "01:10", "alert_level": "HIGH", "description": "Unattended bag"}]
+        annotation = [{"start": "00:03", "end": "00:09", "action": "Scans the items"}]
+        sop = [
+            {"start": "00:03", "end": "00:09", "sop_event": "Scan the items", "done": True},
+            {"start": "00:00", "end": "00:00", "sop_event": "Hand over the receipt", "done": False},
+        ]
+
+        insert_video(conn, "v1", env_id=2, alerts=json.dumps(alerts))
+        insert_person(conn, "h1", "v1", annotation=json.dumps(annotation), sop=json.dumps(sop))
+        insert_person(conn, "h1", "v1")
+        conn.execute("INSERT INTO images (public_id, url) VALUES ('img', 'https://res.cloudinary.com/test/img.jpg')")
+        conn.execute(
+            "INSERT INTO huid_thumbnails (huid, image_public_id, url, content_hash, resolution) VALUES (?,?,?,?,?)",
+            ("h1", "img", "https://res.cloudinary.com/test/img.jpg", "hash", 100),
+        )
+        conn.commit()
+
+        monkeypatch.setattr(db, "MIGRATIONS", MIGRATIONS)
+        apply_migrations(conn)
+
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == len(MIGRATIONS)
+
+        alert = conn.execute("SELECT * FROM alert_events").fetchone()
+        assert (alert["env_id"], alert["alert_level"], alert["start_seconds"], alert["end_seconds"]) == (2, "high", 5, 70)
+
+        action = conn.execute("SELECT * FROM person_actions").fetchone()
+        assert (action["huid"], action["action"], action["start_seconds"]) == ("h1", "Scans the items", 3)
+
+        steps = conn.execute("SELECT step_number, sop_event, done, env_id FROM sop_step_results ORDER BY step_number").fetchall()
+        assert [tuple(step) for step in steps] == [(1, "Scan the items", 1, 2), (2, "Hand over the receipt", 0, 2)]
+
+        summary = conn.execute("SELECT * FROM person_summary WHERE huid = 'h1'").fetchone()
+        assert summary["video_count"] == 1
+        assert summary["thumbnail_url"] == "https://res.cloudinary.com/test/img.jpg"
+
+    finally:
+        conn.close()
+
+
+def test_results_version_follows_every_result_change(db_conn):
+
+    insert_video(db_conn, "v1")
+    insert_video(db_conn, "v2")
+    assert results_version(db_conn, "v1") == 0
+
+    person_id = insert_person(db_conn, "h1", "v1")
+    assert results_version(db_conn, "v1") == 1
+
+    db_conn.execute("UPDATE videos SET alerts = '[]' WHERE public_id = 'v1'")
+    assert results_version(db_conn, "v1") == 2
+
+    db_conn.execute("UPDATE people SET annotation = '[]' WHERE id = ?", (person_id,))
+    db_conn.execute("UPDATE people SET sop = '[]' WHERE id = ?", (person_id,))
+    assert results_version(db_conn, "v1") == 4
+
+    # columns that aren't results leave it alone
+    db_conn.execute("UPDATE people SET sop_attempts = 1 WHERE id = ?", (person_id,))
+    assert results_version(db_conn, "v1") == 4
+    assert results_version(db_conn, "v2") == 0
+
+
+def test_person_summary_counts_distinct_videos(db_conn):
+
+    for video_public_id in ("v1", "v2"):
+        insert_video(db_conn, video_public_id)
+
+    insert_person(db_conn, "h1", "v1")
+    insert_person(db_conn, "h1", "v1")
+    insert_person(db_conn, "h1", "v2")
+    insert_person(db_conn, "h2", "v2")
+
+    counts = dict(db_conn.execute("SELECT huid, video_count FROM person_summary").fetchall())
+    assert counts == {"h1": 2, "h2": 1}
+
+    videos = db_conn.execute("SELECT video_public_id FROM person_videos WHERE huid = 'h1' ORDER BY 1").fetchall()
+    assert [row[0] for row in videos] == ["v1", "v2"]
+
+
+def test_person_summary_follows_the_thumbnail(db_conn):
+
+    insert_video(db_conn, "v1")
+    insert_person(db_conn, "h1", "v1")
+
+    for url in ("https://res.cloudinary.com/test/a.jpg", "https://res.cloudinary.com/test/b.jpg"):
+        db_conn.execute("INSERT OR IGNORE INTO images (public_id, url) VALUES (?,?)", (url, url))
+
+    db_conn.execute(
+        "INSERT INTO huid_thumbnails (huid, image_public_id, url, content_hash, resolution) VALUES (?,?,?,?,?)",
+        ("h1", "https://res.cloudinary.com/test/a.jpg", "https://res.cloudinary.com/test/a.jpg", "a", 100),
+    )
+    assert db_conn.execute("SELECT thumbnail_url FROM person_summary WHERE huid = 'h1'").fetchone()[0].endswith("a.jpg")
+
+    db_conn.execute("UPDATE huid_thumbnails SET url = 'https://res.cloudinary.com/test/b.jpg' WHERE huid = 'h1'")
+    assert db_conn.execute("SELECT thumbnail_url FROM person_summary WHERE huid = 'h1'").fetchone()[0].endswith("b.jpg")
+
+    # a thumbnail for a person never seen in a video still gets a summary row
+    db_conn.execute(
+        "INSERT INTO huid_thumbnails (huid, image_public_id, url, content_hash, resolution) VALUES (?,?,?,?,?)",
+        ("h2", "https://res.cloudinary.com/test/a.jpg", "https://res.cloudinary.com/test/a.jpg", "a", 100),
+    )
+    assert db_conn.execute("SELECT video_count FROM person_summary WHERE huid = 'h2'").fetchone()[0] == 0
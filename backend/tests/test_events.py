@@ -0,0 +1,108 @@
+import json
+
+import pytest
+
+from app.config import app_settings
+
+
+@pytest.fixture(autouse=True)
+def fast_stream(monkeypatch):
+
+    monkeypatch.setattr(app_settings, "SSE_POLL_INTERVAL_SECONDS", 0.01)
+    monkeypatch.setattr(app_settings, "SSE_MAX_STREAM_SECONDS", 2)
+
+
+def add_progress(db_conn, stage, idle_seconds=0, external_requested=0, error=None):
+
+    db_conn.execute("INSERT INTO videos (public_id, url) VALUES ('v1', 'https://res.cloudinary.com/test/video/upload/v1.mp4')")
+    db_conn.execute(
+        """
+        INSERT INTO analysis_progress (video_public_id, stage, external_requested, error, updated_at)
+        VALUES ('v1', ?, ?, ?, datetime('now', ?))
+        """,
+        (stage, external_requested, error, f"-{idle_seconds} seconds"),
+    )
+    db_conn.commit()
+
+
+def add_callback_event(db_conn, status):
+
+    db_conn.execute(
+        "INSERT INTO callback_events (kind, video_public_id, payload, payload_hash, status) VALUES ('person', 'v1', '{}', ?, ?)",
+        (f"hash-{status}", status),
+    )
+    db_conn.commit()
+
+
+def stream_events(api_client):
+    """
+    (event, data) of every event the stream sent before it ended
+    """
+
+    response = api_client.get("/api/v1/video_analysis/events", params={"video_public_id": "v1"})
+    assert response.status_code == 200
+
+    events = []
+    for block in response.text.split("\n\n"):
+        if block.startswith("event: "):
+            event, data = block.split("\n", 1)
+            events.append((event.removeprefix("event: "), json.loads(data.removeprefix("data: "))))
+
+    return events
+
+
+def test_stream_ends_done_once_all_results_are_in(api_client, db_conn):
+
+    add_progress(db_conn, "awaiting_results", external_requested=1)
+    add_callback_event(db_conn, "done")
+
+    events = stream_events(api_client)
+
+    assert [event for event, _ in events] == ["progress", "done"]
+    assert events[-1][1] == {"video_public_id": "v1", "stage": "done", "error": None}
+
+
+def test_stream_times_out_on_missing_callbacks(api_client, db_conn, monkeypatch):
+
+    monkeypatch.setattr(app_settings, "SSE_RESULTS_DEADLINE_SECONDS", 60)
+
+    add_progress(db_conn, "awaiting_results", idle_seconds=120, external_requested=2)
+    add_callback_event(db_conn, "done")
+
+    event, data = stream_events(api_client)[-1]
+
+    assert event == "timed_out"
+    assert data["stage"] == "timed_out"
+    assert data["error"].startswith("1 callback(s) and 0 SOP verification(s) still pending")
+
+
+def test_stream_waits_for_callbacks_within_the_deadline(api_client, db_conn, monkeypatch):
+
+    monkeypatch.setattr(app_settings, "SSE_RESULTS_DEADLINE_SECONDS", 60)
+    monkeypatch.setattr(app_settings, "SSE_MAX_STREAM_SECONDS", 0.2)
+
+    add_progress(db_conn, "awaiting_results", idle_seconds=30, external_requested=1)
+
+    # only SSE_MAX_STREAM_SECONDS ends the stream, without a terminal event
+    assert [event for event, _ in stream_events(api_client)] == ["progress"]
+
+
+def test_stream_fails_with_the_analysis(api_client, db_conn):
+
+    add_progress(db_conn, "failed", error="Failed to download video [v1]")
+
+    event, data = stream_events(api_client)[-1]
+
+    assert (event, data["error"]) == ("failed", "Failed to download video [v1]")
+
+
+def test_stream_fails_when_the_worker_stops_reporting(api_client, db_conn, monkeypatch):
+
+    monkeypatch.setattr(app_settings, "SSE_STALE_PROGRESS_SECONDS", 60)
+
+    add_progress(db_conn, "tracking", idle_seconds=120)
+
+    event, data = stream_events(api_client)[-1]
+
+    assert event == "failed"
+    assert data["error"].startswith("No progress for")
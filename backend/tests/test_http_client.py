@@ -0,0 +1,138 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.config import app_settings
+from app.http_client import AsyncHTTPClient
+from app.rate_limit import AdaptiveRateLimiter
+
+URL = "https://upstream.test/v1/understand"
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(app_settings, "HTTP_BACKOFF_BASE_SECONDS", 0.0)
+    monkeypatch.setattr(app_settings, "HTTP_BACKOFF_MAX_SECONDS", 0.0)
+    monkeypatch.setattr(app_settings, "HTTP_MAX_RETRIES", 2)
+
+
+def send(responses, limiter=None):
+    """
+    POST through an AsyncHTTPClient whose transport answers with responses in order, an exception is raised instead.
+    Returns (response or raised error, number of requests the upstream saw)
+    """
+
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        response = responses[min(len(calls), len(responses)) - 1]
+
+        if isinstance(response, Exception):
+            raise response
+
+        return response
+
+    async def run():
+        client = AsyncHTTPClient()
+        client.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+        try:
+            return await client.post(URL, json={}, limiter=limiter)
+        except httpx.HTTPError as e:
+            return e
+        finally:
+            await client.aclose()
+
+    return asyncio.run(run()), len(calls)
+
+
+def test_success_is_not_retried():
+
+    response, calls = send([httpx.Response(200, json={"ok": True})])
+
+    assert response.status_code == 200
+    assert response.json() == {"ok": True}
+    assert calls == 1
+
+
+def test_retryable_status_is_retried():
+
+    response, calls = send([httpx.Response(503), httpx.Response(200)])
+
+    assert response.status_code == 200
+    assert calls == 2
+
+
+def test_client_error_is_returned_as_is():
+
+    response, calls = send([httpx.Response(404)])
+
+    assert response.status_code == 404
+    assert calls == 1
+
+
+def test_exhausted_retries_raise():
+
+    error, calls = send([httpx.Response(502)])
+
+    assert isinstance(error, httpx.HTTPStatusError)
+    assert error.response.status_code == 502
+    assert calls == app_settings.HTTP_MAX_RETRIES + 1
+
+
+def test_transport_error_is_retried():
+
+    response, calls = send([httpx.ConnectError("refused"), httpx.Response(200)])
+
+    assert response.status_code == 200
+    assert calls == 2
+
+
+def test_transport_error_raises_once_retries_are_exhausted():
+
+    error, calls = send([httpx.ReadTimeout("timed out")])
+
+    assert isinstance(error, httpx.ReadTimeout)
+    assert calls == app_settings.HTTP_MAX_RETRIES + 1
+
+
+def test_throttled_requests_are_requeued_without_using_retries(monkeypatch):
+
+    monkeypatch.setattr(app_settings, "HTTP_MAX_RETRIES", 0)
+    limiter = AdaptiveRateLimiter("upstream", rate_per_second=1000, burst=100, max_concurrency=8)
+
+    response, calls = send([httpx.Response(429), httpx.Response(429), httpx.Response(200)], limiter)
+
+    assert response.status_code == 200
+    assert calls == 3
+
+    stats = limiter.stats()
+    assert stats["throttled"] == 2
+    assert stats["completed"] == 1
+    assert stats["in_flight"] == 0
+    assert stats["concurrency_limit"] < 8
+
+
+def test_requeues_are_capped(monkeypatch):
+
+    monkeypatch.setattr(app_settings, "HTTP_MAX_RETRIES", 0)
+    monkeypatch.setattr(app_settings, "RATE_LIMIT_MAX_REQUEUES", 2)
+    limiter = AdaptiveRateLimiter("upstream", rate_per_second=1000, burst=100, max_concurrency=8)
+
+    error, calls = send([httpx.Response(429)], limiter)
+
+    assert isinstance(error, httpx.HTTPStatusError)
+    assert calls == 3
+    assert limiter.stats()["in_flight"] == 0
+
+
+def test_not_implemented_does_not_throttle_the_limiter():
+
+    limiter = AdaptiveRateLimiter("upstream", rate_per_second=1000, burst=100, max_concurrency=8)
+
+    response, _ = send([httpx.Response(501)], limiter)
+
+    assert response.status_code == 501
+    assert limiter.stats()["throttled"] == 0
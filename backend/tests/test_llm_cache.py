@@ -0,0 +1,93 @@
+import time
+
+from app.llm_cache import LLMResponseCache
+
+
+def make_cache(tmp_path, max_entries=100, memory_entries=10, ttl_seconds=60.0):
+    return LLMResponseCache(str(tmp_path / "llm_cache.db"), max_entries, memory_entries, ttl_seconds)
+
+
+def stored_keys(cache):
+    return {row[0] for row in cache._get_conn().execute("SELECT key FROM llm_cache")}
+
+
+def test_key_covers_every_input():
+
+    key = LLMResponseCache.build_key("annotate", 1, "text")
+
+    assert key == LLMResponseCache.build_key("annotate", 1, "text")
+    assert key != LLMResponseCache.build_key("alert", 1, "text")
+    assert key != LLMResponseCache.build_key("annotate", 2, "text")
+    assert key != LLMResponseCache.build_key("annotate", 1, "text", sop_events=["step"])
+
+
+def test_callers_get_copies(tmp_path):
+
+    cache = make_cache(tmp_path)
+    value = [{"start": "00:01", "action": "Scans the items"}]
+
+    cache.set("k", value)
+    value[0]["start"] = "01:00"
+
+    hit = cache.get("k")
+    hit[0]["start"] = "02:00"
+
+    assert cache.get("k") == [{"start": "00:01", "action": "Scans the items"}]
+
+
+def test_persistent_tier_is_shared(tmp_path):
+
+    make_cache(tmp_path).set("k", {"v": 1})
+
+    cache = make_cache(tmp_path)
+
+    assert cache.get("k") == {"v": 1}
+    assert cache.get("missing") is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_expired_entries_are_misses(tmp_path):
+
+    cache = make_cache(tmp_path, ttl_seconds=0.05)
+    cache.set("k", 1)
+    time.sleep(0.1)
+
+    assert cache.get("k") is None
+    assert make_cache(tmp_path, ttl_seconds=0.05).get("k") is None
+
+
+def test_eviction_runs_once_over_the_bound_and_keeps_the_recently_used(tmp_path):
+
+    cache = make_cache(tmp_path, max_entries=10, memory_entries=1)
+
+    for i in range(10):
+        cache.set(f"k{i}", i)
+
+    # at the bound nothing is evicted
+    assert len(stored_keys(cache)) == 10
+
+    # k0 is used again, the persistent recency is updated on the next write
+    assert cache.get("k0") == 0
+    cache.set("k10", 10)
+
+    # trimmed to 90% of the bound, least recently used first
+    keys = stored_keys(cache)
+    assert len(keys) == 9
+    assert {"k0", "k10"} <= keys
+    assert not {"k1", "k2"} & keys
+
+    # the next writes only insert until the bound is crossed again
+    cache.set("k11", 11)
+    assert len(stored_keys(cache)) == 10
+
+
+def test_eviction_uses_the_indexes(tmp_path):
+
+    conn = make_cache(tmp_path)._get_conn()
+
+    for sql in (
+        "SELECT key FROM llm_cache WHERE created_at < 0",
+        "SELECT key FROM llm_cache ORDER BY last_access LIMIT 1",
+    ):
+        plan = " ".join(row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}"))
+        assert "USING" in plan and "INDEX" in plan, plan
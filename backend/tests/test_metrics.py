@@ -0,0 +1,71 @@
+from app.metrics import Counter, Gauge, Histogram, MetricsRegistry
+
+
+def test_counter_and_gauge_render_in_text_format():
+
+    registry = MetricsRegistry()
+    calls = registry.register(Counter("calls_total", "Calls", ("service",)))
+    depth = registry.register(Gauge("queue_depth", "Depth"))
+
+    calls.inc(service="gemini")
+    calls.inc(2, service='say "hi"\n')
+    depth.set(3)
+
+    assert registry.render().splitlines() == [
+        "# HELP calls_total Calls",
+        "# TYPE calls_total counter",
+        'calls_total{service="gemini"} 1.0',
+        'calls_total{service="say \\"hi\\"\\n"} 2.0',
+        "# HELP queue_depth Depth",
+        "# TYPE queue_depth gauge",
+        "queue_depth 3.0",
+    ]
+
+
+def test_histogram_renders_cumulative_buckets():
+
+    histogram = Histogram("job_seconds", "Jobs", ("status",), buckets=(1.0, 5.0))
+
+    for value in (0.5, 1.0, 3.0, 10.0):
+        histogram.observe(value, status="done")
+
+    assert histogram.render() == [
+        "# HELP job_seconds Jobs",
+        "# TYPE job_seconds histogram",
+        'job_seconds_bucket{status="done",le="1.0"} 2',
+        'job_seconds_bucket{status="done",le="5.0"} 3',
+        'job_seconds_bucket{status="done",le="+Inf"} 4',
+        'job_seconds_sum{status="done"} 14.5',
+        'job_seconds_count{status="done"} 4',
+    ]
+
+
+def test_histogram_render_is_a_snapshot(monkeypatch):
+
+    histogram = Histogram("job_seconds", "Jobs", buckets=(1.0,))
+    histogram.observe(0.5)
+
+    render_value = Histogram._render_value
+
+    def observe_while_rendering(self, key, value):
+        # an observation landing between the copy and the formatting must not tear the rendered state
+        self.observe(2.0)
+        return render_value(self, key, value)
+
+    monkeypatch.setattr(Histogram, "_render_value", observe_while_rendering)
+
+    assert histogram.render()[2:] == [
+        'job_seconds_bucket{le="1.0"} 1',
+        'job_seconds_bucket{le="+Inf"} 1',
+        "job_seconds_sum 0.5",
+        "job_seconds_count 1",
+    ]
+
+
+def test_metrics_endpoint_serves_the_registry(api_client):
+
+    response = api_client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "# TYPE sentinel_stage_seconds histogram" in response.text
@@ -0,0 +1,79 @@
+import asyncio
+import json
+
+import pytest
+
+from app.callbacks import _store_annotation
+from app.config import app_settings
+from app.services.video_clip_service import VideoClipService
+from app.track_store import TrackTimelineBuilder
+
+ANNOTATION = [{"start": "00:05", "end": "00:12", "action": "Scans the items"}]
+
+
+def stored_annotation(db_conn, huid):
+    return json.loads(db_conn.execute("SELECT annotation FROM people WHERE huid = ?", (huid,)).fetchone()[0])
+
+
+def test_clip_timestamps_are_remapped_to_the_original(db_conn):
+
+    VideoClipService().register_person_clip("v1", "h1", "v1", [(60.0, 70.0), (100.0, 110.0)], db_conn)
+
+    _store_annotation("v1", "h1", ANNOTATION, db_conn.cursor())
+
+    assert stored_annotation(db_conn, "h1") == [{"start": "01:05", "end": "01:42", "action": "Scans the items"}]
+
+
+def test_unregistered_clip_leaves_the_timestamps_alone(db_conn):
+
+    clip_service = VideoClipService()
+    clip_service.register_person_clip("v1", "h1", "v1", [(60.0, 70.0)], db_conn)
+    clip_service.unregister_person_clip("v1", "h1", db_conn)
+
+    assert clip_service.get_person_clip_segments("v1", "h1", db_conn.cursor()) is None
+
+    _store_annotation("v1", "h1", ANNOTATION, db_conn.cursor())
+
+    assert stored_annotation(db_conn, "h1") == ANNOTATION
+
+
+@pytest.mark.parametrize("clip_failure", [False, True])
+def test_reanalysis_on_the_full_video_drops_the_earlier_clip(db_conn, analysis_models, monkeypatch, clip_failure):
+
+    from app.services.video_analysis_service import VideoAnalysisService
+
+    # the first analysis annotated h1 on a clip
+    VideoClipService().register_person_clip("v1", "h1", "v1", [(60.0, 70.0)], db_conn)
+
+    # skip __init__, it loads the YOLO weights
+    service = object.__new__(VideoAnalysisService)
+    sent_urls = []
+
+    async def annotate_human(video_public_id, video_url, huid, img_url):
+        sent_urls.append(video_url)
+        return True
+
+    def prepare_person_clip(*args):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(service, "_get_or_upload_huid_thumbnail", lambda *args: "https://res.cloudinary.com/test/h1.jpg")
+    monkeypatch.setattr(service, "annotate_human", annotate_human)
+
+    if clip_failure:
+        monkeypatch.setattr(service, "_prepare_person_clip", prepare_person_clip)
+    else:
+        monkeypatch.setattr(app_settings, "PERSON_CLIPS_ENABLED", False)
+
+    builder = TrackTimelineBuilder(fps=25.0)
+    builder.add(0, 1, "h1", (0, 0, 10, 10), 0.9)
+
+    accepted = asyncio.run(service._annotate_person_from_video(
+        "v1", "https://res.cloudinary.com/test/v1.mp4", "h1", builder.build(), None, asyncio.Semaphore(1),
+    ))
+
+    assert accepted
+    assert sent_urls == ["https://res.cloudinary.com/test/v1.mp4"]
+    assert VideoClipService().get_person_clip_segments("v1", "h1", db_conn.cursor()) is None
+
+    _store_annotation("v1", "h1", ANNOTATION, db_conn.cursor())
+    assert stored_annotation(db_conn, "h1") == ANNOTATION
@@ -0,0 +1,107 @@
+import base64
+
+import cv2
+import numpy as np
+import pytest
+
+from app.config import app_secrets, app_settings, configure_cloudinary
+from app.exceptions import InvalidSearchImage
+
+
+class FakeGallery:
+    """
+    huid_collection answering every query with the given (huid, distance) neighbours per query image
+    """
+
+    def __init__(self, neighbours):
+        self.neighbours = neighbours
+        self.queries = []
+
+    def query(self, query_embeddings, n_results, include):
+
+        self.queries.append(n_results)
+
+        return {
+            "metadatas": [[{"huid": huid} for huid, _ in image] for image in self.neighbours],
+            "distances": [[distance for _, distance in image] for image in self.neighbours],
+        }
+
+
+@pytest.fixture
+def search_service(analysis_models):
+
+    from app.services.person_search_service import PersonSearchService
+
+    configure_cloudinary(app_secrets)
+    return PersonSearchService()
+
+
+def image_base64(color):
+
+    _, encoded = cv2.imencode(".png", np.full((32, 16, 3), color, dtype=np.uint8))
+    return base64.b64encode(encoded.tobytes()).decode("ascii")
+
+
+@pytest.mark.parametrize("image_url", [
+    "http://res.cloudinary.com/test/image/upload/p.jpg",
+    "https://res.cloudinary.com/other/image/upload/p.jpg",
+    "https://res.cloudinary.com/test/video/upload/p.mp4",
+    "https://res.cloudinary.com:8443/test/image/upload/p.jpg",
+    "https://user@res.cloudinary.com/test/image/upload/p.jpg",
+    "https://res.cloudinary.com.evil.example/test/image/upload/p.jpg",
+    "https://169.254.169.254/test/image/upload/p.jpg",
+])
+def test_only_images_of_our_cloud_are_fetched(search_service, monkeypatch, image_url):
+
+    def get(*args, **kwargs):
+        raise AssertionError("a rejected url must never be requested")
+
+    monkeypatch.setattr("app.services.person_search_service.requests.get", get)
+
+    with pytest.raises(InvalidSearchImage):
+        search_service._load_image(None, image_url)
+
+
+def test_images_of_our_cloud_pass_the_check(search_service):
+
+    search_service._check_image_url(f"https://{app_settings.PERSON_SEARCH_IMAGE_HOST}/test/image/upload/v1/p.jpg")
+
+
+def test_search_ranks_by_mean_similarity_over_the_images(search_service, monkeypatch):
+
+    gallery = FakeGallery([
+        [("h1", 0.1), ("h2", 0.2), ("h2", 0.3)],
+        [("h2", 0.4)],
+    ])
+    monkeypatch.setattr("app.services.person_search_service.huid_collection", gallery)
+
+    images = [(image_base64((255, 0, 0)), None, None), (image_base64((0, 255, 0)), None, None)]
+
+    # h2 matched both images, h1 only the first one
+    assert search_service.search(images, top_k=5) == [("h2", 0.7, 0.2, 2), ("h1", 0.45, 0.1, 1)]
+    assert gallery.queries == [5 * app_settings.GALLERY_SIZE]
+
+    # neighbours further away than max_distance don't count
+    assert search_service.search(images, top_k=1, max_distance=0.3) == [("h1", 0.45, 0.1, 1)]
+
+
+def test_repeated_searches_are_served_from_the_cache(search_service, monkeypatch):
+
+    gallery = FakeGallery([[("h1", 0.1)]])
+    monkeypatch.setattr("app.services.person_search_service.huid_collection", gallery)
+
+    images = [(image_base64((255, 0, 0)), None, [0, 0, 8, 16])]
+
+    assert search_service.search(images, top_k=3) == search_service.search(images, top_k=3)
+    assert len(gallery.queries) == 1
+
+    monkeypatch.setattr(app_settings, "PERSON_SEARCH_RESULT_TTL_SECONDS", 0)
+    search_service.search(images, top_k=3)
+
+    assert len(gallery.queries) == 2
+
+
+def test_empty_crop_is_rejected(search_service):
+
+    with pytest.raises(InvalidSearchImage):
+        search_service.get_embeddings([(image_base64((255, 0, 0)), None, [20, 0, 30, 10])])
@@ -0,0 +1,81 @@
+import json
+import threading
+import time
+
+import pytest
+
+import app.utils
+from app.profiling import JOB_EXECUTOR_THREAD_PREFIX, JobProfiler
+
+
+@pytest.fixture(autouse=True)
+def profiles_root(tmp_path, monkeypatch):
+
+    monkeypatch.setattr(app.utils, "APP_ROOT_DIR", str(tmp_path))
+    return tmp_path
+
+
+def spin_in_executor_thread(seconds):
+
+    time.sleep(seconds)
+
+
+def spin_in_other_thread(seconds):
+
+    time.sleep(seconds)
+
+
+def run_in_thread(target, name, seconds):
+
+    thread = threading.Thread(target=target, args=(seconds,), name=name)
+    thread.start()
+    return thread
+
+
+def test_profiler_samples_only_the_job_threads(profiles_root):
+
+    profiler = JobProfiler("v1", job_id=7)
+    profiler.start()
+
+    threads = [
+        run_in_thread(spin_in_executor_thread, f"{JOB_EXECUTOR_THREAD_PREFIX}_0", 0.2),
+        run_in_thread(spin_in_other_thread, "api-request", 0.2),
+    ]
+    for thread in threads:
+        thread.join()
+
+    summary = profiler.stop()
+
+    assert summary["video_public_id"] == "v1" and summary["job_id"] == 7
+    assert summary["samples"] > 0
+
+    stacks = (profiles_root / "profiles" / "v1" / "stacks.txt").read_text()
+
+    assert "spin_in_executor_thread" in stacks
+    assert "spin_in_other_thread" not in stacks
+    assert json.loads((profiles_root / "profiles" / "v1" / "summary.json").read_text())["samples"] == summary["samples"]
+
+
+def test_profile_endpoint_serves_the_stored_artifacts(api_client):
+
+    profiler = JobProfiler("v1")
+    profiler.start()
+    profiler.stop()
+
+    summary = api_client.get("/api/v1/video_analysis/profile", params={"video_public_id": "v1"})
+    stacks = api_client.get("/api/v1/video_analysis/profile", params={"video_public_id": "v1", "artifact": "stacks"})
+
+    assert summary.status_code == 200
+    assert summary.json()["video_public_id"] == "v1"
+    assert stacks.status_code == 200
+    assert stacks.headers["content-type"].startswith("text/plain")
+
+
+def test_profile_endpoint_stays_inside_the_profiles_directory(api_client, profiles_root):
+
+    (profiles_root / "summary.json").write_text("{}")
+
+    response = api_client.get("/api/v1/video_analysis/profile", params={"video_public_id": ".."})
+
+    assert response.status_code == 400
+    assert api_client.get("/api/v1/video_analysis/profile", params={"video_public_id": "v2"}).status_code == 204
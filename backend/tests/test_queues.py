@@ -0,0 +1,97 @@
+from app.callbacks import claim_next_callback_event, store_callback_event
+from app.config import app_settings
+from app.jobs import claim_next_analysis_job, enqueue_analysis_job, finish_analysis_job
+
+
+def expire_lease(conn, table, row_id):
+    conn.execute(f"UPDATE {table} SET claimed_at = datetime('now', '-1 day') WHERE id = ?", (row_id,))
+    conn.commit()
+
+
+def test_jobs_are_claimed_oldest_first_and_once(db_conn):
+
+    first = enqueue_analysis_job("v1", db_conn)
+    second = enqueue_analysis_job("v2", db_conn, profile=True)
+
+    job = claim_next_analysis_job(db_conn)
+    assert (job["id"], job["video_public_id"], job["profile"], job["attempts"]) == (first, "v1", 0, 1)
+
+    job = claim_next_analysis_job(db_conn)
+    assert (job["id"], job["profile"]) == (second, 1)
+
+    assert claim_next_analysis_job(db_conn) is None
+
+    stage = db_conn.execute("SELECT stage FROM analysis_progress WHERE video_public_id = 'v1'").fetchone()[0]
+    assert stage == "queued"
+
+
+def test_job_with_an_expired_lease_is_claimed_again(db_conn):
+
+    job_id = enqueue_analysis_job("v1", db_conn)
+    claim_next_analysis_job(db_conn)
+
+    # a live lease keeps it
+    assert claim_next_analysis_job(db_conn) is None
+
+    expire_lease(db_conn, "analysis_jobs", job_id)
+    job = claim_next_analysis_job(db_conn)
+
+    assert (job["id"], job["attempts"]) == (job_id, 2)
+
+
+def test_job_losing_its_worker_on_every_attempt_is_failed(db_conn, monkeypatch):
+
+    monkeypatch.setattr(app_settings, "ANALYSIS_JOB_MAX_ATTEMPTS", 2)
+
+    job_id = enqueue_analysis_job("v1", db_conn)
+
+    for _ in range(2):
+        assert claim_next_analysis_job(db_conn)["id"] == job_id
+        expire_lease(db_conn, "analysis_jobs", job_id)
+
+    assert claim_next_analysis_job(db_conn) is None
+
+    status, error = db_conn.execute("SELECT status, error FROM analysis_jobs WHERE id = ?", (job_id,)).fetchone()
+    assert status == "failed"
+    assert "Lease expired" in error
+
+
+def test_finished_job_is_never_reclaimed(db_conn):
+
+    job_id = enqueue_analysis_job("v1", db_conn)
+    claim_next_analysis_job(db_conn)
+    finish_analysis_job(job_id, db_conn, metrics={"frames_per_second": 12.5})
+    expire_lease(db_conn, "analysis_jobs", job_id)
+
+    assert claim_next_analysis_job(db_conn) is None
+    assert db_conn.execute("SELECT status FROM analysis_jobs WHERE id = ?", (job_id,)).fetchone()[0] == "done"
+
+
+def test_duplicate_callbacks_are_stored_once(db_conn):
+
+    payload = {"data": {"text": "Alert"}}
+
+    assert store_callback_event("alert", "v1", "", payload, db_conn) is True
+    assert store_callback_event("alert", "v1", "", dict(payload), db_conn) is False
+    assert store_callback_event("annotate", "v1", "h1", payload, db_conn) is True
+
+    assert db_conn.execute("SELECT COUNT(*) FROM callback_events").fetchone()[0] == 2
+
+
+def test_callback_event_with_an_expired_lease_is_claimed_again_then_failed(db_conn, monkeypatch):
+
+    monkeypatch.setattr(app_settings, "CALLBACK_MAX_ATTEMPTS", 2)
+
+    store_callback_event("alert", "v1", "", {"data": {}}, db_conn)
+
+    event = claim_next_callback_event(db_conn)
+    assert event["attempts"] == 1
+    assert claim_next_callback_event(db_conn) is None
+
+    expire_lease(db_conn, "callback_events", event["id"])
+    assert claim_next_callback_event(db_conn)["attempts"] == 2
+
+    expire_lease(db_conn, "callback_events", event["id"])
+    assert claim_next_callback_event(db_conn) is None
+
+    assert db_conn.execute("SELECT status FROM callback_events WHERE id = ?", (event["id"],)).fetchone()[0] == "failed"
@@ -0,0 +1,147 @@
+import asyncio
+import threading
+import time
+
+from app.rate_limit import AdaptiveRateLimiter
+
+
+def make_limiter(max_concurrency=8, rate_per_second=1000, burst=100):
+    return AdaptiveRateLimiter("test", rate_per_second=rate_per_second, burst=burst, max_concurrency=max_concurrency)
+
+
+def test_throttling_halves_the_concurrency_limit_down_to_the_minimum():
+
+    limiter = make_limiter(max_concurrency=8)
+
+    for expected in (4, 2, 1, 1):
+        limiter.acquire(0)
+        limiter.release(throttled=True)
+        assert limiter.stats()["concurrency_limit"] == expected
+
+
+def test_successes_grow_the_concurrency_limit_up_to_the_maximum():
+
+    limiter = make_limiter(max_concurrency=4)
+    limiter.concurrency_limit = 1.0
+
+    limits = []
+    for _ in range(20):
+        limiter.acquire(0)
+        limiter.release()
+        limits.append(limiter.stats()["concurrency_limit"])
+
+    # additive increase, ~1 per window of successes
+    assert limits[0] == 2
+    assert limits == sorted(limits)
+    assert limits[-1] == 4
+
+
+def test_token_bucket_paces_requests():
+
+    limiter = make_limiter(rate_per_second=20, burst=1)
+
+    start = time.monotonic()
+    for _ in range(3):
+        limiter.acquire(0)
+        limiter.release()
+
+    # the burst covers the first one, the next two wait for a token each
+    assert time.monotonic() - start >= 0.08
+
+
+def test_threads_are_granted_by_priority():
+
+    limiter = make_limiter(max_concurrency=1)
+    limiter.acquire(0)
+
+    order = []
+
+    def worker(priority):
+        limiter.acquire(priority)
+        order.append(priority)
+        limiter.release()
+
+    threads = []
+    for priority in (5, 1, 3):
+        thread = threading.Thread(target=worker, args=(priority,))
+        thread.start()
+        threads.append(thread)
+
+        # queued in this order
+        while limiter.stats()["queued"] < len(threads):
+            time.sleep(0.001)
+
+    limiter.release()
+
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert order == [1, 3, 5]
+
+
+def test_coroutines_are_granted_by_priority_fifo_within_a_priority():
+
+    limiter = make_limiter(max_concurrency=1)
+
+    async def run():
+        limiter.acquire(0)
+        order = []
+
+        async def worker(priority, name):
+            await limiter.acquire_async(priority)
+            order.append(name)
+            limiter.release()
+
+        tasks = []
+        for priority, name in ((2, "late"), (1, "first"), (2, "later"), (1, "second")):
+            tasks.append(asyncio.create_task(worker(priority, name)))
+            await asyncio.sleep(0)
+
+        limiter.release()
+        await asyncio.wait_for(asyncio.gather(*tasks), 5)
+
+        return order
+
+    assert asyncio.run(run()) == ["first", "second", "late", "later"]
+
+
+def test_cancelled_waiter_leaves_the_queue_without_a_slot():
+
+    limiter = make_limiter(max_concurrency=1)
+
+    async def run():
+        limiter.acquire(0)
+
+        waiter = asyncio.create_task(limiter.acquire_async(0))
+        await asyncio.sleep(0.01)
+        assert limiter.stats()["queued"] == 1
+
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+
+        limiter.release()
+
+        # the next caller gets the slot straight away
+        await asyncio.wait_for(limiter.acquire_async(0), 1)
+        limiter.release()
+
+    asyncio.run(run())
+
+    stats = limiter.stats()
+    assert stats["queued"] == 0
+    assert stats["in_flight"] == 0
+
+
+def test_release_from_another_thread_wakes_a_coroutine():
+
+    limiter = make_limiter(max_concurrency=1)
+    limiter.acquire(0)
+
+    async def run():
+        threading.Timer(0.05, limiter.release).start()
+        await asyncio.wait_for(limiter.acquire_async(0), 5)
+        limiter.release()
+
+    asyncio.run(run())
+
+    assert limiter.stats()["in_flight"] == 0
@@ -0,0 +1,96 @@
+import json
+
+import pytest
+
+from app.api.api_schema import VideoAnalysisAlertResponse
+from app.response_cache import ResultsResponseCache, results_response_cache
+
+
+@pytest.fixture(autouse=True)
+def empty_response_cache():
+
+    # the cache is process wide, every test starts its database at the same results_version
+    results_response_cache.entries.clear()
+    yield
+    results_response_cache.entries.clear()
+
+
+def add_video(db_conn, alerts=None):
+
+    db_conn.execute(
+        "INSERT INTO videos (public_id, url, alerts) VALUES ('v1', 'https://res.cloudinary.com/test/video/upload/v1.mp4', ?)",
+        (None if alerts is None else json.dumps(alerts),),
+    )
+    db_conn.commit()
+
+
+def alert(description):
+    return {"start": "00:01", "end": "00:04", "alert_level": "high", "description": description}
+
+
+def get_alerts(api_client, if_none_match=None):
+
+    headers = {} if if_none_match is None else {"If-None-Match": if_none_match}
+    return api_client.get("/api/v1/video_analysis/alerts", params={"video_public_id": "v1"}, headers=headers)
+
+
+def test_unchanged_results_are_not_modified(api_client, db_conn):
+
+    add_video(db_conn, alerts=[alert("Unattended bag")])
+
+    response = get_alerts(api_client)
+    etag = response.headers["ETag"]
+
+    assert response.status_code == 200
+    assert response.headers["Cache-Control"] == "no-cache"
+    assert response.json() == {"alert_results": [alert("Unattended bag")]}
+
+    not_modified = get_alerts(api_client, if_none_match=etag)
+
+    assert not_modified.status_code == 304
+    assert not_modified.headers["ETag"] == etag
+    assert not_modified.content == b""
+
+    assert get_alerts(api_client, if_none_match=f'"other", W/{etag}').status_code == 304
+    assert get_alerts(api_client, if_none_match="*").status_code == 304
+
+
+def test_changed_results_get_a_new_etag(api_client, db_conn):
+
+    add_video(db_conn, alerts=[alert("Unattended bag")])
+    etag = get_alerts(api_client).headers["ETag"]
+
+    # the results_version trigger makes the cached response stale
+    db_conn.execute("UPDATE videos SET alerts = ? WHERE public_id = 'v1'", (json.dumps([alert("Door left open")]),))
+    db_conn.commit()
+
+    response = get_alerts(api_client, if_none_match=etag)
+
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert response.json() == {"alert_results": [alert("Door left open")]}
+
+
+def test_missing_results_have_no_content(api_client, db_conn):
+
+    add_video(db_conn)
+
+    response = get_alerts(api_client)
+
+    assert response.status_code == 204
+    assert "ETag" not in response.headers
+
+
+def test_response_cache_evicts_the_least_recently_used():
+
+    cache = ResultsResponseCache(max_entries=2)
+
+    for video_public_id in ("v1", "v2"):
+        cache.set("alerts", video_public_id, 1, VideoAnalysisAlertResponse(alert_results=[]))
+
+    assert cache.get("alerts", "v1", 1) is not None
+    cache.set("alerts", "v3", 1, VideoAnalysisAlertResponse(alert_results=[]))
+
+    assert cache.get("alerts", "v2", 1) is None
+    assert cache.get("alerts", "v1", 1) is not None
+    assert cache.get("alerts", "v1", 2) is None
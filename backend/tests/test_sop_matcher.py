@@ -0,0 +1,91 @@
+import numpy as np
+
+from app.config import app_settings
+from app.sop_matcher import NOT_DONE_TIMESTAMP, _align_steps_in_order, match_sop_locally, parse_sop_steps
+
+SOP_CHECKS = """
+1) Employee scans each item barcode.
+
+2) Customer pays via card.
+
+3) Receipt is printed and handed to customer.
+"""
+
+
+def test_parse_sop_steps_drops_the_serial_numbers():
+
+    assert parse_sop_steps(SOP_CHECKS) == [
+        "Employee scans each item barcode.",
+        "Customer pays via card.",
+        "Receipt is printed and handed to customer.",
+    ]
+    assert parse_sop_steps("no numbered steps") == []
+
+
+def test_alignment_never_goes_back_in_time():
+
+    # step 1 fits action 0 best, but step 0 already took action 1
+    assert _align_steps_in_order(np.array([[0.1, 0.9], [0.8, 0.2]]), 0.05) == [1, 1]
+
+    # one action may satisfy consecutive steps
+    assert _align_steps_in_order(np.array([[0.9, 0.0], [0.9, 0.0]]), 0.05) == [0, 0]
+
+    # below min_score a step stays unassigned
+    assert _align_steps_in_order(np.array([[0.01, 0.0], [0.9, 0.0]]), 0.05) == [-1, 0]
+
+
+def test_steps_are_matched_to_actions_in_time_order():
+
+    actions = [
+        {"start": "00:30", "end": "00:40", "action": "Receipt printed and handed over to the customer"},
+        {"start": "00:05", "end": "00:20", "action": "Employee scanning items barcodes"},
+        {"start": "00:21", "end": "00:29", "action": "Customer pays with a card"},
+    ]
+
+    results, ambiguous = match_sop_locally(actions, SOP_CHECKS)
+
+    assert ambiguous == []
+    assert all(result.done for result in results)
+    assert [(result.start, result.end) for result in results] == [("00:05", "00:20"), ("00:21", "00:29"), ("00:30", "00:40")]
+
+
+def test_unrelated_actions_leave_every_step_not_done():
+
+    results, ambiguous = match_sop_locally([{"start": "00:01", "end": "00:02", "action": "Person waves at the camera"}], SOP_CHECKS)
+
+    assert ambiguous == []
+    assert [result.done for result in results] == [False, False, False]
+    assert all(result.start == NOT_DONE_TIMESTAMP and result.confidence == 1.0 for result in results)
+
+
+def test_no_actions_means_nothing_done():
+
+    results, ambiguous = match_sop_locally([], SOP_CHECKS)
+
+    assert ambiguous == []
+    assert len(results) == 3
+    assert not any(result.done for result in results)
+
+
+def test_weak_matches_are_left_to_the_llm(monkeypatch):
+
+    monkeypatch.setattr(app_settings, "SOP_MATCH_ACCEPT_SCORE", 0.9)
+
+    results, ambiguous = match_sop_locally([{"start": "00:01", "end": "00:02", "action": "Employee prints a label"}], SOP_CHECKS)
+
+    assert ambiguous == [0, 2]
+    assert [results[i].confidence for i in ambiguous] == [None, None]
+    assert results[1].done is False and results[1].confidence == 1.0
+
+
+def test_actions_without_a_timestamp_go_last():
+
+    actions = [
+        {"action": "Receipt printed and handed over to the customer"},
+        {"start": "00:05", "end": "00:20", "action": "Employee scanning items barcodes"},
+    ]
+
+    results, _ = match_sop_locally(actions, SOP_CHECKS)
+
+    assert results[0].done and results[0].start == "00:05"
+    assert results[2].done and results[2].start == NOT_DONE_TIMESTAMP
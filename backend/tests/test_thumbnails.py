@@ -0,0 +1,118 @@
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+import app.utils
+from app.config import app_settings
+from app.utils import build_local_uri_for_video
+
+ORIGINAL_SIZE = (640, 480)
+
+
+class FakeAssetManagementService:
+    """
+    Serves one solid colour original frame per offset, instead of Cloudinary
+    """
+
+    def __init__(self):
+        self.downloads = []
+
+    def get_original_frame_cloudinary_url(self, video_public_id, seconds):
+        return f"https://res.cloudinary.com/test/video/upload/so_{seconds:.2f}/{video_public_id}.jpg"
+
+    def download_asset_if_not_exist(self, file_path, url):
+
+        # the real one never overwrites an existing file
+        if file_path in self.downloads:
+            return
+
+        self.downloads.append(file_path)
+
+        value = 10 * len(self.downloads)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        cv2.imwrite(file_path, np.full((ORIGINAL_SIZE[1], ORIGINAL_SIZE[0], 3), value, dtype=np.uint8))
+
+
+@pytest.fixture
+def service(analysis_models, tmp_path, monkeypatch):
+
+    from benchmarks.synthetic import write_synthetic_video
+    from app.services.video_analysis_service import VideoAnalysisService
+
+    monkeypatch.setattr(app.utils, "APP_ROOT_DIR", str(tmp_path))
+
+    # a 320x180 proxy of the 640x480 original, the aspect ratio isn't kept
+    video_path = build_local_uri_for_video("v1")
+    (tmp_path / "videos").mkdir()
+    write_synthetic_video(video_path, n_frames=2, width=320, height=180)
+
+    # skip __init__, it loads the YOLO weights
+    return object.__new__(VideoAnalysisService)
+
+
+def test_thumbnail_box_is_scaled_per_axis(service):
+
+    crop_path = service._get_thumbnail_crop_from_original(
+        "v1", "h1", 10, np.array([10, 30, 60, 90]), 25.0, FakeAssetManagementService()
+    )
+
+    # x * 2, y * 480 / 180
+    assert cv2.imread(crop_path).shape[:2] == (160, 100)
+
+
+def test_reanalysis_crops_the_new_best_frame(service):
+
+    asset_mgmt_service = FakeAssetManagementService()
+    box = np.array([10, 30, 60, 90])
+
+    first = cv2.imread(service._get_thumbnail_crop_from_original("v1", "h1", 10, box, 25.0, asset_mgmt_service))
+    second = cv2.imread(service._get_thumbnail_crop_from_original("v1", "h1", 40, box, 25.0, asset_mgmt_service))
+
+    assert len(asset_mgmt_service.downloads) == 2
+    assert first.mean() != second.mean()
+
+
+def add_crop(huid, crop_id, size, value=128):
+
+    from app.utils import build_uri_for_crop, store_crop_at_path
+
+    store_crop_at_path(np.full((size[1], size[0], 3), value, dtype=np.uint8), build_uri_for_crop(huid, crop_id, "huid_crops"))
+
+
+def test_returning_huid_reuses_its_thumbnail(service, db_conn, monkeypatch):
+
+    from app.config import app_secrets, configure_cloudinary
+    from app.services.asset_management_service import AssetManagementService
+
+    configure_cloudinary(app_secrets)
+    monkeypatch.setattr(app_settings, "PROXY_INGEST_ENABLED", False)
+
+    uploads = []
+
+    def upload_asset(file_uri, resource_type):
+        uploads.append(file_uri)
+        return f"thumb_{len(uploads)}", f"https://res.cloudinary.com/test/image/upload/thumb_{len(uploads)}.jpg"
+
+    asset_mgmt_service = AssetManagementService()
+    monkeypatch.setattr(asset_mgmt_service, "upload_asset", upload_asset)
+
+    add_crop("h1", "1", (40, 80))
+    first_url = service._get_or_upload_huid_thumbnail("h1", asset_mgmt_service)
+
+    # seen again in another video, a slightly bigger crop isn't worth an upload
+    add_crop("h1", "2", (44, 88), value=200)
+    assert service._get_or_upload_huid_thumbnail("h1", asset_mgmt_service) == first_url
+    assert len(uploads) == 1
+
+    # a meaningfully better crop replaces the stored thumbnail
+    add_crop("h1", "3", (80, 160))
+    second_url = service._get_or_upload_huid_thumbnail("h1", asset_mgmt_service)
+
+    assert len(uploads) == 2
+    assert second_url != first_url
+
+    thumbnail = asset_mgmt_service.get_huid_thumbnail("h1", db_conn)
+    assert (thumbnail["image_public_id"], thumbnail["resolution"]) == ("thumb_2", 80 * 160)
+    assert db_conn.execute("SELECT COUNT(*) FROM images").fetchone()[0] == 2
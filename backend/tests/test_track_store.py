@@ -0,0 +1,80 @@
+import numpy as np
+
+from app.track_store import ActiveTracks, TrackTimeline, TrackTimelineBuilder
+
+
+def build_timeline():
+    """
+    h1 visible on frames 0-4 and 10-11 (two tracks), h2 on frames 2-3, added out of order like the tracker does
+    """
+
+    builder = TrackTimelineBuilder(fps=25.0)
+
+    for frame in (0, 1, 2, 3, 4, 10, 11):
+        track_id = 1 if frame < 10 else 7
+        builder.add(frame, track_id, "h1", (frame, 0, frame + 10, 40000), 0.9)
+
+        if frame in (2, 3):
+            builder.add(frame, 2, "h2", (5, 5, 15, 15), 0.5)
+
+    return builder.build()
+
+
+def test_detections_of_a_huid_are_time_ordered():
+
+    detections = build_timeline().get_detections("h1")
+
+    assert detections["frame"].tolist() == [0, 1, 2, 3, 4, 10, 11]
+    assert detections["track_id"].tolist() == [1, 1, 1, 1, 1, 7, 7]
+    # boxes are stored as int16, clipped
+    assert detections["box"][0].tolist() == [0, 0, 10, 32767]
+
+
+def test_detections_within_a_frame_range():
+
+    timeline = build_timeline()
+
+    assert timeline.get_detections("h1", start_frame=3, end_frame=10)["frame"].tolist() == [3, 4, 10]
+    assert timeline.get_detections("h2", start_frame=4)["frame"].tolist() == []
+    assert timeline.get_detections("unknown")["frame"].tolist() == []
+
+
+def test_appearance_intervals_bridge_small_gaps():
+
+    timeline = build_timeline()
+
+    assert timeline.get_appearance_intervals("h1") == [(0, 4), (10, 11)]
+    assert timeline.get_appearance_intervals("h1", max_gap_frames=6) == [(0, 11)]
+    assert timeline.get_appearance_intervals("h1", start_frame=2, end_frame=10) == [(2, 4), (10, 10)]
+    assert timeline.get_appearance_intervals("h2") == [(2, 3)]
+    assert timeline.get_appearance_intervals("unknown") == []
+
+
+def test_saved_timeline_loads_memory_mapped(tmp_path):
+
+    build_timeline().save(tmp_path)
+    timeline = TrackTimeline.load(tmp_path)
+
+    assert timeline.fps == 25.0
+    assert sorted(timeline.huids) == ["h1", "h2"]
+    assert isinstance(timeline.columns["frame"], np.memmap)
+    assert timeline.get_appearance_intervals("h1") == [(0, 4), (10, 11)]
+
+
+def test_active_tracks_prune_idle_tracks_only():
+
+    tracks = ActiveTracks(max_idle_frames=10)
+    tracks.add(1, "h1", frame_idx=0)
+    tracks.add(2, "h2", frame_idx=0)
+
+    # seen again, its idle time starts over
+    assert tracks.get(1, frame_idx=8) == "h1"
+
+    assert tracks.prune(frame_idx=10) == 0
+    assert tracks.prune(frame_idx=11) == 1
+
+    assert len(tracks) == 1
+    assert tracks.get(2, frame_idx=11) is None
+    assert tracks.get(1, frame_idx=18) == "h1"
+    assert tracks.prune(frame_idx=29) == 1
+    assert len(tracks) == 0
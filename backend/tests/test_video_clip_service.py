@@ -0,0 +1,39 @@
+import pytest
+
+from app.config import app_settings
+from app.services.video_clip_service import VideoClipService
+
+# a 40s clip made of 00:10-00:20, 01:00-01:25 and 02:00-02:05 of the original video
+SEGMENTS_IN_SECONDS = [(10.0, 20.0), (60.0, 85.0), (120.0, 125.0)]
+
+
+@pytest.mark.parametrize("clip_timestamp, original_timestamp", [
+    ("00:00", "00:10"),
+    ("00:04", "00:14"),
+    ("00:10", "00:20"),
+    ("00:11", "01:01"),
+    ("00:35", "01:25"),
+    ("00:36", "02:01"),
+    ("00:40", "02:05"),
+    # past the end of the clip (rounding) is clamped to the end of the last segment
+    ("00:47", "02:05"),
+])
+def test_remap_clip_timestamp(clip_timestamp, original_timestamp):
+    assert VideoClipService().remap_clip_timestamp(clip_timestamp, SEGMENTS_IN_SECONDS) == original_timestamp
+
+
+@pytest.mark.parametrize("timestamp", ["", "n/a", "1:2:3", None])
+def test_remap_keeps_what_isnt_a_timestamp(timestamp):
+    assert VideoClipService().remap_clip_timestamp(timestamp, SEGMENTS_IN_SECONDS) == timestamp
+
+
+def test_build_segments_pads_merges_and_clamps(monkeypatch):
+
+    monkeypatch.setattr(app_settings, "CLIP_PADDING_SECONDS", 1.0)
+    monkeypatch.setattr(app_settings, "CLIP_MERGE_GAP_SECONDS", 2.0)
+
+    # 10 fps, 300 frames
+    segments = VideoClipService().build_segments([(200, 250), (5, 40), (80, 100), (290, 299)], fps=10, total_frames=300)
+
+    # 0-50 and 70-110 are 20 frames apart, within the merge gap, 190-260 and 280-299 too
+    assert segments == [(0, 110), (190, 299)]
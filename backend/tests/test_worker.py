@@ -0,0 +1,41 @@
+import sqlite3
+import threading
+
+
+def test_worker_survives_database_errors(db_conn, analysis_models, monkeypatch):
+
+    from app import worker
+
+    stop_event = threading.Event()
+    claims = []
+    finishes = []
+
+    def claim_next_analysis_job(conn):
+        claims.append(1)
+
+        if len(claims) == 1:
+            raise sqlite3.OperationalError("database is locked")
+        if len(claims) == 2:
+            return {"id": 1, "video_public_id": "v1", "profile": 0, "attempts": 1}
+
+        stop_event.set()
+        return None
+
+    def finish_analysis_job(job_id, conn, error=None, metrics=None):
+        finishes.append((job_id, error))
+
+        if len(finishes) == 1:
+            raise sqlite3.OperationalError("database is locked")
+
+    async def analyse_video(video_public_id):
+        pass
+
+    monkeypatch.setattr(worker, "claim_next_analysis_job", claim_next_analysis_job)
+    monkeypatch.setattr(worker, "finish_analysis_job", finish_analysis_job)
+    monkeypatch.setattr(worker, "analyse_video", analyse_video)
+
+    worker.run_worker(poll_interval=0.01, stop_event=stop_event)
+
+    # the job ran once, only its status was written again
+    assert len(claims) == 3
+    assert finishes == [(1, None), (1, None)]
@@ -0,0 +1,17 @@
+from app.config import configure_cloudinary, app_secrets, app_settings
+from app.db import setup_sqllite_database
+from app.logger import configure_logging
+from app.vector_db import setup_vector_db
+from app.worker import run_worker, start_background_threads, start_metrics_server_if_enabled
+
+# Analysis worker entry point, it owns the models and runs VideoAnalysisService for the jobs queued by api.py
+
+configure_logging()
+configure_cloudinary(app_secrets)
+
+if __name__ == "__main__":
+    setup_sqllite_database()
+    setup_vector_db()
+    start_background_threads()
+    start_metrics_server_if_enabled()
+    run_worker(app_settings.WORKER_POLL_INTERVAL_SECONDS)